@@ -0,0 +1,169 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from time import perf_counter
+import construct
+from frame_memory import configure_pandas
+from report_loader import ReportInventory
+from report_rules import load_config
+from sheet_writer import write_dataframe_diff
+from submission_index import SubmissionIndex
+from synthetic_course import generate_course, FakeSheetsClient, FakeDrive, FakeWorksheet
+
+
+SIZES = [1000, 10000, 50000]
+REPEATS = 3
+BASELINE_PATH = 'benchmark_baseline.json'
+TOLERANCE = 1.5
+NOISE_SECONDS = 0.05
+
+
+def __timed(func, *args, repeats=REPEATS, setup=None):
+    '''
+    Times a stage, returning its fastest run and the output of its last run. Stage output is silenced.
+    '''
+    best, result = None, None
+    for _ in range(repeats):
+        call_args = setup() if setup is not None else args
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = perf_counter()
+            result = func(*call_args)
+            elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_course(students, directory, repeats=REPEATS, **options):
+    '''
+    Times every report-building stage on a synthetic course, feeding each stage the output of the one before.
+
+    Args:
+    students (int): The number of students in the course.
+    directory (str): An empty working folder.
+    repeats (int): The number of runs per stage, the fastest of which is kept.
+    options: Further arguments of synthetic_course.generate_course.
+
+    Returns:
+    Dict[str, float]: The seconds taken by each stage.
+    '''
+    data = generate_course(directory, students=students, **options)
+    course = construct.Course(data.name, data.data_url, data.attendance_url, data.thinkific_url,
+                              data.master_url, data.credential_url)
+    gc = FakeSheetsClient(data.spreadsheets)
+    config = load_config()
+    partner_df, _ = construct.get_reporting_groups(gc, course, data.participants)
+    timings = {}
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        inventory = ReportInventory(os.path.join(course.name, 'Downloaded Reports'))
+        timings['progress'], master = __timed(construct.build_progress_report, course, inventory, repeats=repeats)
+        timings['attendance'], master = __timed(construct.add_attendance, repeats=repeats,
+                                                setup=lambda: (master.copy(), course, gc))
+
+        # A fresh index every run, so the full latest-submission build is timed
+        timings['answers'], master = __timed(construct.add_quiz_answers, repeats=repeats, setup=lambda: (
+            master, course, gc, config['concat_answers'], SubmissionIndex(os.path.join(directory, 'submissions.json'))))
+
+        story = next(records for title, records in data.spreadsheets[data.data_url].items() if 'Share a Story' in title)
+        timings['concat_answers'], _ = __timed(construct.concat_answers, repeats=repeats, setup=lambda: (
+            construct.pd.DataFrame(story), 'Share a Story', config['concat_answers']))
+
+        timings['eligibility'], master = __timed(construct.extended_survey_flag, master, config['eligibility'], repeats=repeats)
+        timings['credentials'], master = __timed(construct.add_credential_status, gc, master, course, repeats=repeats)
+        timings['finalize'], master = __timed(construct.finalize_report, master, repeats=repeats)
+
+        timings['partner reports'], _ = __timed(construct.write_group_reports, repeats=repeats,
+                                                setup=lambda: (partner_df, master, course, False, FakeDrive()))
+        timings['sheet write'], _ = __timed(write_dataframe_diff, repeats=repeats,
+                                            setup=lambda: (FakeWorksheet('Sheet1', []), master))
+    finally:
+        os.chdir(cwd)
+
+    return timings
+
+
+def find_regressions(results, baseline, tolerance=TOLERANCE, noise=NOISE_SECONDS):
+    '''
+    Compares benchmark results with a baseline.
+
+    Args:
+    results (Dict[str, Dict[str, float]]): The seconds of each stage keyed by course size.
+    baseline (Dict[str, Dict[str, float]]): The baseline in the same shape.
+    tolerance (float): The slowdown factor allowed before a stage counts as regressed.
+    noise (float): The slowdown in seconds below which differences are ignored.
+
+    Returns:
+    List[str]: A description of every regressed stage.
+    '''
+    regressions = []
+    for size, stages in results.items():
+        for stage, seconds in stages.items():
+            reference = baseline.get(size, {}).get(stage)
+            if reference is not None and seconds > reference * tolerance and seconds - reference > noise:
+                regressions.append(f'{stage} at {size} students: {seconds:.3f}s vs {reference:.3f}s baseline')
+    return regressions
+
+
+def __parser():
+    parser = argparse.ArgumentParser(description='Time the report-building stages on synthetic courses, fully offline.')
+    parser.add_argument('--sizes', help='Numbers of students to benchmark', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeats', help='Runs per stage, the fastest is kept', type=int, default=REPEATS)
+    parser.add_argument('--groups', help='Number of groups', type=int, default=20)
+    parser.add_argument('--modules', help='Number of survey modules', type=int, default=6)
+    parser.add_argument('--sessions', help='Number of attendance sessions', type=int, default=10)
+    parser.add_argument('--duplicates', help='Share of responses submitted twice', type=float, default=0.2)
+    parser.add_argument('--baseline', help='Baseline file to compare against', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', help='Slowdown factor that fails the benchmark', type=float, default=TOLERANCE)
+    parser.add_argument('--save_baseline', '--save-baseline', help='Store these results as the new baseline', action='store_true')
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    return parser.parse_args()
+
+
+def main():
+    args = __parser()
+    configure_pandas()
+    results = {}
+    for students in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            print(f'Benchmarking {students} students...')
+            results[str(students)] = bench_course(students, directory, repeats=args.repeats, groups=args.groups,
+                                                  modules=args.modules, sessions=args.sessions,
+                                                  duplicate_rate=args.duplicates)
+
+    stages = list(next(iter(results.values())))
+    print(f"\n{'Stage':<20}" + ''.join(f'{size:>12}' for size in results))
+    for stage in stages:
+        print(f'{stage:<20}' + ''.join(f'{results[size][stage]:>12.3f}' for size in results))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nBaseline saved to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'\nNo baseline at {args.baseline}, run with --save-baseline to create one.')
+        return
+
+    with open(args.baseline) as f:
+        regressions = find_regressions(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f'\n{len(regressions)} STAGES REGRESSED:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+    print('\nNo regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    main()
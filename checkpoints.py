@@ -0,0 +1,172 @@
+import hashlib
+import inspect
+import json
+import os
+import pandas as pd
+from instrumentation import RUN_REPORT
+
+try:
+    import pyarrow
+    CHECKPOINT_FORMAT = 'parquet'
+except ImportError:
+    CHECKPOINT_FORMAT = 'pickle'
+
+
+STAGES = ['progress', 'attendance', 'answers', 'eligibility', 'credentials', 'finalize']
+# Bump to invalidate every checkpoint after a change the module sources below do not capture
+CHECKPOINT_VERSION = 1
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGE_MODULES = ['construct.py', 'checkpoints.py', 'frame_memory.py', 'report_loader.py', 'report_rules.py',
+                 'sheet_cache.py', 'submission_index.py', 'thinkific_source.py']
+
+
+def frame_hash(df):
+    '''
+    Hashes the content, columns and dtypes of a DataFrame.
+
+    Args:
+    df (pd.DataFrame): The DataFrame to hash.
+
+    Returns:
+    str: The hex digest of the DataFrame.
+    '''
+    digest = hashlib.sha256()
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(repr([str(dtype) for dtype in df.dtypes]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def code_version(directory=None, modules=None):
+    '''
+    Hashes the checkpoint version and the sources of the modules holding the stage functions and
+    the helpers they call, so a checkpoint is not reused after any of them is edited.
+
+    Args:
+    directory (str): The folder of the modules, CODE_DIR if not given.
+    modules (List[str]): The module files, STAGE_MODULES if not given.
+
+    Returns:
+    str: The hex digest of the code.
+    '''
+    digest = hashlib.sha256(str(CHECKPOINT_VERSION).encode())
+    for module in (STAGE_MODULES if modules is None else modules):
+        digest.update(module.encode())
+        try:
+            with open(os.path.join(CODE_DIR if directory is None else directory, module), 'rb') as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            pass
+    return digest.hexdigest()
+
+
+def _columnar(df):
+    # Parquet columns hold a single type, so mixed object columns are stored as text
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+
+class PipelineCheckpoints():
+    '''
+    Persists the output of every pipeline stage together with a hash of its inputs and code.
+    A stage whose inputs are unchanged since its last run is loaded instead of run, stages
+    before from_stage are always loaded, and stop() reports when to_stage has been reached.
+    Every stage is timed in the run report under label.
+    '''
+    def __init__(self, directory, from_stage=None, to_stage=None, label=None):
+        self.directory = directory
+        self.label = label
+        self.from_index = STAGES.index(from_stage) if from_stage else 0
+        self.to_stage = to_stage
+        self.code_version = code_version()
+        self.manifest_path = os.path.join(directory, 'checkpoints.json')
+        os.makedirs(directory, exist_ok=True)
+
+        try:
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+
+    def run(self, stage, func, *args, key=()):
+        '''
+        Runs a stage, or loads its checkpoint when it precedes from_stage or its inputs are unchanged.
+
+        Args:
+        stage (str): The name of the stage, one of STAGES.
+        func (Callable): The stage function, called as func(*args).
+        key (Iterable): The stage's inputs. DataFrames are hashed by content, anything else by value,
+        and a None input (e.g. an unknown sheet revision) always makes the stage run.
+
+        Returns:
+        pd.DataFrame: The output of the stage.
+        '''
+        rows_in = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+        with RUN_REPORT.stage(stage, self.label, rows_in) as record:
+            df = self.__run(stage, func, args, key, record)
+            record['rows_out'] = len(df)
+        return df
+
+    def stop(self, stage):
+        '''
+        Returns True once the stage given as to_stage has completed.
+        '''
+        return self.to_stage == stage
+
+    def __run(self, stage, func, args, key, record):
+        entry = self.manifest.get(stage)
+
+        if STAGES.index(stage) < self.from_index:
+            if entry is None:
+                raise FileNotFoundError(f'No checkpoint for stage "{stage}" to resume from.')
+            print(f'Loaded "{stage}" from checkpoint.')
+            record['source'] = 'checkpoint'
+            return self.__load(entry)
+
+        input_hash = self.__input_hash(stage, func, key)
+        if entry is not None and input_hash is not None and entry['input_hash'] == input_hash:
+            try:
+                df = self.__load(entry)
+                print(f'Inputs of "{stage}" unchanged, loaded from checkpoint.')
+                record['source'] = 'checkpoint'
+                return df
+            except (OSError, ValueError):
+                pass
+
+        df = func(*args)
+        return self.__save(stage, df, input_hash)
+
+    def __input_hash(self, stage, func, key):
+        digest = hashlib.sha256(stage.encode())
+        digest.update(self.code_version.encode())
+        digest.update(inspect.getsource(func).encode())
+        for item in key:
+            if item is None:
+                return None
+            digest.update(frame_hash(item).encode() if isinstance(item, pd.DataFrame) else repr(item).encode())
+        return digest.hexdigest()
+
+    def __load(self, entry):
+        path = os.path.join(self.directory, entry['file'])
+        if entry['file'].endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    def __save(self, stage, df, input_hash):
+        # The stored form is handed on, so a resumed run sees exactly what a full run saw
+        if CHECKPOINT_FORMAT == 'parquet':
+            file = f'{stage}.parquet'
+            df = _columnar(df)
+            df.to_parquet(os.path.join(self.directory, file))
+        else:
+            file = f'{stage}.pkl'
+            df.to_pickle(os.path.join(self.directory, file))
+
+        self.manifest[stage] = {'file': file, 'input_hash': input_hash}
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+        return df
@@ -1,28 +1,51 @@
 import pandas as pd
-from credentials import login_credentials
 from download_reports import *
 from initiate_exports import *
 import imaplib
 import email
 import re
 import os
-from thinkific import Thinkific
+import json
+import hashlib
 from pathlib import Path
 import argparse
 import inquirer
 import gspread
-from gspread_dataframe import set_with_dataframe
-from datetime import datetime
-from functools import reduce
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 import pyfiglet
 import requests
+from time import sleep, monotonic
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from sheet_fetch import fetch_worksheets
+from sheet_cache import SheetCache
+from sheet_writer import write_dataframe_diff
+from drive_upload import ReportUploader, folder_id_from_url
+from report_stream import REPORT_FORMATS, report_file_name, stream_group_reports, save_reports
+from report_loader import ReportInventory
+from thinkific_source import ThinkificSource, ThinkificInventory
+from checkpoints import PipelineCheckpoints, STAGES
+from instrumentation import RUN_REPORT, IMAP_METHODS
+from submission_index import SubmissionIndex
+from frame_memory import configure_pandas, compact_columns
+from report_rules import load_config, apply_flags, concat_terms, concat_columns, join_columns
+from imap_ingest import STATE_PATH, load_watermark, save_watermark, uid_validity, search_uids, fetch_messages
 
 
-LOGIN_DICT = login_credentials()
 COURSE_CONFIG_URL = 'https://docs.google.com/spreadsheets/d/1agtq7aPw_LUce7b3rYv7LKs40oqo0cj0z50HQ-r9EYM/edit#gid=0'
 PARTICIPANT_CONFIG_URL = 'https://docs.google.com/spreadsheets/d/1ipe43_HfpbR25DSz13JIZq1sF4fYck3qPyVcqM49T74/edit#gid=0'
+EXPORT_EMAIL_CRITERIA = ('(SUBJECT "Export")', '(FROM "Thinkific")')
+SURVEY_NAME_REGEX = '(:?Survey Results For\s)(.*\s.*\d\d\d\d)(\s-\s.*)'
+EXPORT_EMAIL_TIMEOUT = 60 * 60
+EXPORT_POLL_INTERVAL = 30
+COURSE_WORKERS = 4
+COLUMN_PLANS_FILE = 'column_plans.json'
+MAX_COLUMN_PLANS = 16
+DROP_TERMS = ['Token', 'last_name', 'first_name']
+LEAD_COLUMNS = ['First Name', 'Last Name', 'Email', 'Credential Status', 'Notes', 'Last Sign In',
+                'Request a micro-credential_Submitted At', 'Group', 'Company', 'Attendance Count', '% Completed']
+FEEDBACK_COLUMNS = ['Feedback_Overall how do you rate your experience of participating in the TS program?']
 
 
 class Course():
@@ -35,9 +58,16 @@ class Course():
         self.attendance_url = attendance_url
         self.thinkific_url = thinkific_url
         self.master_url = master_url
-        self.participant_config_url = 'https://docs.google.com/spreadsheets/d/1ipe43_HfpbR25DSz13JIZq1sF4fYck3qPyVcqM49T74/edit#gid=0'
+        self.participant_config_url = PARTICIPANT_CONFIG_URL
         self.credential_url = credential_url
 
+class NoExportEmails(SystemExit):
+    '''
+    Raised when the mailbox holds no unprocessed export emails. It ends a single-course run like exit(),
+    while a batch run builds the course from its existing downloads instead.
+    '''
+
+
 class Group():
     '''
     Group object consisting of student emails
@@ -54,7 +84,7 @@ def create_course(course_config_url, thinkific, gc):
 
     Args:
     course_config_url (str): The URL of the course configuration file in Google Sheets.
-    thinkific (Thinkific): An instance of the Thinkific API client.
+    thinkific (ThinkificSource): An instance of the Thinkific API client, or None to skip the course check when offline.
     gc (gspread.client.Client): An authenticated instance of the Google Sheets client.
 
     Returns:
@@ -62,9 +92,7 @@ def create_course(course_config_url, thinkific, gc):
     '''
 
     # Connect to gc
-    
-    config = gc.open_by_url(course_config_url).worksheet('Sheet1')
-    config_df = pd.DataFrame(config.get_all_records())
+    config_df = __course_config(course_config_url, gc)
     course_list = config_df['Course Name'].tolist()
 
     if len(course_list) == 1:
@@ -73,6 +101,57 @@ def create_course(course_config_url, thinkific, gc):
         # Select course through terminal
         course_name = __select_course(course_list)
 
+    # Check course exists on thinkific
+    if thinkific is not None and course_name not in __thinkific_courses(thinkific):
+        print('NO COURSE FOUND. EXITING PROGRAM.\n')
+        quit()
+
+    return __course_from_config(config_df, course_name)
+
+
+def load_courses(course_config_url, thinkific, gc, names=None):
+    '''
+    Creates a course object for every course in the config file with a single read, without prompting.
+
+    Args:
+    course_config_url (str): The URL of the course configuration file in Google Sheets.
+    thinkific (ThinkificSource): An instance of the Thinkific API client, or None to skip the course check when offline.
+    gc (gspread.client.Client): An authenticated instance of the Google Sheets client.
+    names (List[str]): The courses to load, or None for all configured courses.
+
+    Returns:
+    List[Course]: The course objects, in config order.
+    '''
+    config_df = __course_config(course_config_url, gc)
+    course_list = config_df['Course Name'].tolist()
+
+    if names:
+        for name in names:
+            if name not in course_list:
+                print(f'{name} is not in the course config - SKIPPING')
+        course_list = [name for name in course_list if name in names]
+
+    if thinkific is not None:
+        t_courses = __thinkific_courses(thinkific)
+        for name in course_list:
+            if name not in t_courses:
+                print(f'{name} was not found on Thinkific - SKIPPING')
+        course_list = [name for name in course_list if name in t_courses]
+
+    return [__course_from_config(config_df, name) for name in course_list]
+
+
+def __course_config(course_config_url, gc):
+    config = gc.open_by_url(course_config_url).worksheet('Sheet1')
+    return pd.DataFrame(config.get_all_records())
+
+
+def __thinkific_courses(thinkific):
+    # Retrieve the course names on thinkific, across every page
+    return thinkific.course_names()
+
+
+def __course_from_config(config_df, course_name):
     # Select row from config file and retrieve relevant info
     df = config_df.loc[config_df['Course Name'] == course_name].reset_index()
     name = df['Course Name'][0]
@@ -82,23 +161,7 @@ def create_course(course_config_url, thinkific, gc):
     master_url = df['Master File URL'][0]
     credential_url = df['Credential Status URL'][0]
 
-    # Retrieve relevant course info from thinkific and construct object
-    t_courses = thinkific.courses.list()
-    for course in t_courses['items']:
-
-        # Check course exists on thinkfic
-        name = course['name']
-        
-        if course_name == name:
-            course_object = Course(name, data_url, attendance_url, thinkific_url, master_url, credential_url)
-            break
-
-    try:
-        return course_object
-
-    except UnboundLocalError:
-        print('NO COURSE FOUND. EXITING PROGRAM.\n')
-        quit()
+    return Course(name, data_url, attendance_url, thinkific_url, master_url, credential_url)
 
 
 def __select_course(courses):
@@ -131,63 +194,113 @@ def gspread_authenticate():
 
     gc = gspread.oauth(scopes=DEFAULT_SCOPES)
 
+    # Record every Sheets API request in the run report
+    session = gc.http_client.session if hasattr(gc, 'http_client') else gc.session
+    RUN_REPORT.hook_session(session, 'gspread')
+
     return gc
 
 
-def get_email_link(username, password, course):
+def get_email_link(username, password, course, mail=None, state_path=STATE_PATH, groups=None):
     '''
-    Retrieves download links from email and returns a list of tuples containing the link and the email subject.
+    Opens the export emails received since the last run. Iterating the returned ExportEmails yields
+    their download links as tuples containing the link and the email subject. An email is only marked
+    as read, and the UID watermark of the mailbox advanced past it, once every report it links to is
+    reported downloaded, so a failed or interrupted run leaves the remaining emails for the next one.
+    The watermark is shared by all courses, as group exports do not name their course. When groups are
+    given, only the exports of the course and of those groups are read, and the emails of other courses
+    are left unread for them.
 
     Args:
     username (str): The email username.
     password (str): The email password.
     course (Course): The course object.
+    mail (imaplib.IMAP4): An optional logged in IMAP connection, e.g. a local stand-in.
+    state_path (str): The path of the JSON file holding the UID watermarks.
+    groups (List[str]): The groups of the course, to skip the exports of other courses as in a batch run.
 
     Returns:
-    List[Tuple[str, str]]: A list of tuples containing the download link and email subject.
+    ExportEmails: The unprocessed export emails, to be closed once their downloads have finished.
     '''
-
-    # create regex to recognize download links within email html
-    regex = '(?:Click here)(?:.*\n)(?:\(\s)([\s\S]*)(?:\s\)\n\s)(?:to download)'
-    name_regex = '(:?Survey Results For\s)(.*\s.*\d\d\d\d)(\s-\s.*)'
     # create imap instance
-    mail = imaplib.IMAP4_SSL('imap.gmail.com')
-    mail.login(username, password)
-    mail.select()
-    print('Retreiving reports via email...')
-
-    #id holds numerical value locations of emails found
-    typ, message_id = mail.search(None, '(SUBJECT "Export")', '(UNSEEN FROM "Thinkific")')
-    if len(message_id[0].split()) < 1:
-        print('NO EMAILS FOUND... EXITING PROGRAM.')
-        exit()
-
-    # Create lists holding the url, email subject and filenames to be zipped later
-    links = []
-    subjects = []
-    filenames = []
-
-    for num in message_id[0].split():
-        typ, data = mail.fetch(num, '(RFC822)')
-        email_message = data[0][1].decode('utf-8')
-        email_message = email.message_from_string(email_message)
-        subject = email_message.get('subject')
-        subjects.append(subject)
-
-
-        # If course does not match course reported in exports, exit
-        if 'Survey Results' in subject:
-
-            subject = repr(r"{}".format(subject).replace('\r\n', ''))
-            course_name = re.search(name_regex, subject).group(2)
-            if course.name != course_name:
-                print('INCORRECT COURSE DETECTED - EXITING PROGRAM')
-                exit(1)
-
-        # Iterate through email content
-        for part in email_message.walk():
-            # find plain text content
-            if part.get_content_type() == 'text/plain':
+    if mail is None:
+        mail = RUN_REPORT.wrap(imaplib.IMAP4_SSL('imap.gmail.com'), 'imap', IMAP_METHODS)
+        mail.login(username, password)
+
+    try:
+        mail.select()
+        print('Retreiving reports via email...')
+
+        # Resume from the last email consumed from this mailbox by any course
+        key = __watermark_key(username)
+        validity, last_uid = load_watermark(key, state_path)
+        current_validity = uid_validity(mail)
+        if validity != current_validity:
+            last_uid = None
+
+        uids = search_uids(mail, last_uid, *EXPORT_EMAIL_CRITERIA)
+        if len(uids) < 1:
+            print('NO EMAILS FOUND... EXITING PROGRAM.')
+            raise NoExportEmails()
+    except BaseException:
+        try:
+            mail.close()
+        finally:
+            mail.logout()
+        raise
+
+    return ExportEmails(mail, course, uids, key, current_validity, state_path, groups)
+
+
+class ExportEmails():
+    '''
+    The unprocessed export emails of a mailbox. Iterating reads the emails in UID order and yields the
+    download link and subject of every report they link to. downloaded() records a finished download:
+    once all reports of an email are downloaded, the email is marked as read, and the watermark is moved
+    up to the highest UID below which every email has been consumed. When groups are given, emails exporting
+    another course or its groups are skipped and stay unread, holding the watermark back until that course
+    reads them.
+    '''
+
+    def __init__(self, mail, course, uids, key, uidvalidity, state_path=STATE_PATH, groups=None):
+        self.mail = mail
+        self.course = course
+        self.names = None if groups is None else {name.lower() for name in [course.name] + list(groups)}
+        self.uids = uids
+        self.key = key
+        self.uidvalidity = uidvalidity
+        self.state_path = state_path
+        self.remaining = {}
+        self.sources = {}
+        self.consumed = set()
+        # Position in uids of the first email not yet consumed
+        self.next = 0
+
+    def __iter__(self):
+        # create regex to recognize download links within email html
+        regex = '(?:Click here)(?:.*\n)(?:\(\s)([\s\S]*)(?:\s\)\n\s)(?:to download)'
+        links = 0
+        for uid, subject, parts in fetch_messages(self.mail, self.uids):
+
+            # Exports of other courses are left unread for them
+            if self.names is not None:
+                name = export_name(subject)
+                if name is not None and name.lower() not in self.names:
+                    print(f'Export of another course - SKIPPING {subject}')
+                    continue
+
+            # If course does not match course reported in exports, exit
+            if 'Survey Results' in subject:
+
+                course_subject = repr(r"{}".format(subject).replace('\r\n', ''))
+                course_name = re.search(SURVEY_NAME_REGEX, course_subject).group(2)
+                if self.course.name != course_name:
+                    print('INCORRECT COURSE DETECTED - EXITING PROGRAM')
+                    exit(1)
+
+            # Iterate through plain text content
+            entries = []
+            for part in parts:
 
                 # If regex fails, email is not an export link
                 try:
@@ -196,111 +309,223 @@ def get_email_link(username, password, course):
                 except AttributeError:
                     print(f'Invalid email detected - SKIPPING {part}')
                     continue
+                entries.append((link, subject))
+
+            # The email is consumed once every link it holds has been downloaded
+            self.remaining[uid] = len(entries)
+            for entry in entries:
+                self.sources.setdefault(entry, []).append(uid)
+            if not entries:
+                self.__consume(uid)
+
+            for entry in entries:
+                links += 1
+                print(f"{links} Links Added!", end='\r', flush=True)
+                yield entry
+
+    def downloaded(self, entry):
+        '''
+        Records that the report of a yielded entry has been downloaded and is in place.
+
+        Args:
+        entry (Tuple[str, str]): The download link and email subject.
+        '''
+        uids = self.sources.get(entry)
+        if not uids:
+            return
+        uid = uids.pop(0)
+        self.remaining[uid] -= 1
+        if self.remaining[uid] == 0:
+            self.__consume(uid)
+
+    def close(self):
+        try:
+            self.mail.close()
+        finally:
+            self.mail.logout()
+
+    def __consume(self, uid):
+        # Email fully downloaded, mark it as read and advance the watermark past every consumed email
+        self.mail.uid('store', str(uid), '+FLAGS', '\\Seen')
+        self.consumed.add(uid)
+
+        advanced = False
+        while self.next < len(self.uids) and self.uids[self.next] in self.consumed:
+            self.next += 1
+            advanced = True
+        if advanced:
+            save_watermark(self.key, self.uidvalidity, self.uids[self.next - 1], self.state_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
-                links.append(link)
-                print(f"{len(links)} Links Added!", end='\r', flush=True)
 
+def export_name(subject):
+    '''
+    Reads the course or group an export email is about from its subject.
+
+    Args:
+    subject (str): The subject of the export email.
+
+    Returns:
+    str: The course or group name, or None for an export of no particular course, such as the users export.
+    '''
+    subject = ' '.join(subject.split())
+    if 'Survey Results' in subject:
+        match = re.search(SURVEY_NAME_REGEX, subject)
+        return match.group(2) if match else None
 
-        # Create nested list of downloaded file info
-        files = list(zip(links, subjects))
+    parts = re.split(r'\s+for\s+', subject.split(': ', 1)[-1], maxsplit=1, flags=re.IGNORECASE)
+    return parts[1] if len(parts) > 1 else None
 
-    mail.close()
-    mail.logout()
-    return files
 
+def __watermark_key(username):
+    return f'{username}/INBOX'
 
-def create_groups(course):
+
+def create_groups(course, inventory=None):
     '''
     Uses the Thinkific group reports to create a list of Group objects.
 
     Args:
     course (Course): The course object.
+    inventory (ReportInventory): The scanned Downloaded Reports folder, scanned here if not given.
 
     Returns:
     List[Group]: A list of Group objects.
     '''
-    group_list = []
-    for file in os.listdir(os.path.join(course.name, 'Downloaded Reports')):
-        if file.startswith('Group'):
-            df = pd.read_csv(os.path.join(course.name, 'Downloaded Reports', file))
-            group_name =  re.sub(r'.csv$', '', file.split('_')[-1])
+    if inventory is None:
+        inventory = ReportInventory(os.path.join(course.name, 'Downloaded Reports'))
 
-            try:
-                group_list.append(Group(df, group_name))
-            except KeyError:
-                print(f'Unknown Format Detected - Skipping file named:\n"{file}"')
+    group_list = []
+    for group_name, path, df in inventory.group_emails():
+        if df is None:
+            print(f'Unknown Format Detected - Skipping file named:\n"{os.path.basename(path)}"')
+            continue
+        group_list.append(Group(df, group_name))
 
     return group_list
 
 
-def __get_progress_report(course):
+def __get_progress_report(course, inventory=None):
     '''
     Helper function to select the course progress report and create a pandas dataframe.
 
     Args:
     course (Course): The course object.
+    inventory (ReportInventory): The scanned Downloaded Reports folder, scanned here if not given.
 
     Returns:
     pd.DataFrame: The progress report as a pandas dataframe.
     '''
+    if inventory is None:
+        inventory = ReportInventory(os.path.join(course.name, 'Downloaded Reports'))
+
+    return inventory.progress_report(course.name)
+
+
+def group_membership(groups):
+    '''
+    Builds a single email to group membership table from all Group objects.
+
+    Args:
+    groups (List[Group]): A list of Group objects.
+
+    Returns:
+    pd.DataFrame: One row per email and group, with the group's position in the list as '_group_order'.
+    '''
+    membership = pd.DataFrame({
+        'Email': [email for group in groups for email in group.emails],
+        'Group': [group.name for group in groups for _ in group.emails],
+        '_group_order': [order for order, group in enumerate(groups) for _ in group.emails],
+    })
+
+    return membership.drop_duplicates(subset=['Email', '_group_order'])
+
+
+def build_progress_report(course, inventory):
+    '''
+    Creates the groups from the downloaded group reports and generates the master progress report.
 
+    Args:
+    course (Course): The course object.
+    inventory (ReportInventory): The scanned Downloaded Reports folder.
 
-    for file in os.listdir(os.path.join(course.name, 'Downloaded Reports')):
-        # Check file is progress report and course name matches
-        if file.startswith('Progress Report') and course.name.lower() == file.split('_')[-1].strip('.csv').lower():
-            progress_df = pd.read_csv(os.path.join(course.name, 'Downloaded Reports', file))
+    Returns:
+    pd.DataFrame: The master progress report as a pandas dataframe.
+    '''
+    groups = create_groups(course, inventory)
+    print(f'{len(groups)} groups created.')
 
-    return progress_df
+    return generate_prog_reports(course, groups, inventory)
 
 
-def generate_prog_reports(course, groups):
+def generate_prog_reports(course, groups, inventory=None):
     '''
     Separates reporting into groups and generates a master progress report.
 
     Args:
     course (Course): The course object.
     groups (List[Group]): A list of Group objects.
+    inventory (ReportInventory): The scanned Downloaded Reports folder, scanned here if not given.
 
     Returns:
     pd.DataFrame: The master progress report as a pandas dataframe.
     '''
-    progress_df = __get_progress_report(course)
-    master_progress = pd.DataFrame()
+    progress_df = __get_progress_report(course, inventory)
 
-    for group in groups:
+    # Match emails from group emails to progress reports and obtain records for every group at once,
+    # students belonging to several groups get a row per group
+    membership = group_membership(groups)
+    master_progress = progress_df.assign(_row=range(len(progress_df))).merge(membership, on='Email')
 
-        # Match emails from group emails to progress reports and obtain records
-        df = progress_df.loc[progress_df['Email'].isin(group.emails)].reset_index(drop=True).sort_values(by='Last Name')
-        df['Group'] = group.name
-        
-        # Add group reports to master report
-        master_progress = pd.concat([master_progress, df], ignore_index=True)
+    # Keep groups in order, each sorted by last name with ties in progress report order
+    master_progress = master_progress.sort_values(by=['_group_order', 'Last Name', '_row'], kind='stable')
+    master_progress = master_progress.drop(columns=['_row', '_group_order']).reset_index(drop=True)
 
     master_progress.to_csv(os.path.join(course.name, 'Reports', 'Master Progress Report.csv'), index=None)
-    master_progress.to_csv('prog.csv')
+    master_progress.to_csv(os.path.join(course.name, 'prog.csv'))
     return master_progress
 
 
 
-def get_reporting_groups(gc, course):  
+def get_reporting_groups(gc, course, participants=None):
     '''
     Extracts a list of groups requiring partner reporting from the participant configuration sheet.
 
     Args:
     gc (gspread.client.Client): An authenticated instance of the Google Sheets client.
     course (Course): The course object.
+    participants (pd.DataFrame): The participant configuration, read from the sheet if not given.
 
     Returns:
     Tuple[pd.DataFrame, List[str]]: A tuple containing the partner reporting dataframe and a list of participant groups.
     '''
-    sheet = gc.open_by_url(course.participant_config_url).worksheet('Sheet1')
-    df = pd.DataFrame(sheet.get_all_records())
+    df = participants if participants is not None else participant_config(gc, course.participant_config_url)
     partner_reporting_df = df[df[course.name].str.startswith('https://drive.google.com/drive/')]
     participant_group_list = df[df[course.name] == 'x']['Group'].tolist()
 
     return partner_reporting_df, participant_group_list
 
 
+def participant_config(gc, url=PARTICIPANT_CONFIG_URL):
+    '''
+    Reads the participant configuration sheet, which holds the reporting groups of every course.
+
+    Args:
+    gc (gspread.client.Client): An authenticated instance of the Google Sheets client.
+    url (str): The URL of the participant configuration sheet.
+
+    Returns:
+    pd.DataFrame: The participant configuration.
+    '''
+    sheet = gc.open_by_url(url).worksheet('Sheet1')
+    return pd.DataFrame(sheet.get_all_records())
+
+
 def __get_attendance(course, gc):
     '''
     Adds attendance data to the master progress report.
@@ -315,19 +540,21 @@ def __get_attendance(course, gc):
     '''
     # Create blank df
     att_df = pd.DataFrame(columns=['First name', 'Last name', 'Email', 'Submitted At', 'Date'])
-    attendance = gc.open_by_url(course.attendance_url)
+    attendance = fetch_worksheets(gc.open_by_url(course.attendance_url))
     attendance_date_list = []
+    entries = [att_df]
 
     # Iterate through each attendance sheet
-    for sheet in attendance.worksheets():
-        date = str(sheet.title).strip('TSPS - ')
+    for title, df in attendance.items():
+        date = str(title).strip('TSPS - ')
         attendance_date_list.append(date)
-        df = pd.DataFrame(sheet.get_all_records())
         if df.shape[0] == 0:
             continue
         entry = df[['First name', 'Last name', 'Email', 'Submitted At']].copy()
         entry['Date'] = date
-        att_df = pd.concat([att_df, entry])
+        entries.append(entry)
+
+    att_df = pd.concat(entries, ignore_index=True)
 
     return att_df, attendance_date_list
 
@@ -352,57 +579,60 @@ def add_attendance(master_progress, course, gc):
     """
 
     att_df, attendance_date_list = __get_attendance(course, gc)
-    for index, row in master_progress.iterrows():
-        email = row['Email']
-        # if email == 'snali@mun.ca':
-        #     print('my man')
-        # Match emails to list of full attendance to extract drop-ins,
-        # use set() due to duplicates in attendace
-        att_list = set(att_df.loc[att_df['Email'] == email]['Date'].values)
-        attendance_counter = len(att_list)
-
-        master_progress.at[index, 'Attendance Count'] = attendance_counter
-        for date in att_list:
-            master_progress.at[index, f'Attendance - {date}'] = 'ATTENDED'
-
-    # master_progress.to_csv('att.csv')
+
+    # Build an email x date table of attendance once, use drop_duplicates() due to duplicates in attendance
+    attended = att_df[['Email', 'Date']].drop_duplicates()
+    attended = attended.loc[attended['Email'].isin(master_progress['Email'])]
+    if attended.empty:
+        master_progress['Attendance Count'] = 0
+        return master_progress
+
+    # Email and date pairs are unique, so a pivot marks presence without a per-group aggregation
+    presence = attended.assign(present=True).pivot(index='Email', columns='Date', values='present').notna()
+    dates = [date for date in dict.fromkeys(attendance_date_list) if date in presence.columns]
+    presence = presence[dates]
+
+    attendance = presence.apply(lambda col: col.map({True: 'ATTENDED'}))
+    attendance.columns = [f'Attendance - {date}' for date in dates]
+    attendance.insert(0, 'Attendance Count', presence.sum(axis=1))
+
+    master_progress = master_progress.merge(attendance, left_on='Email', right_index=True, how='left')
+    master_progress['Attendance Count'] = master_progress['Attendance Count'].fillna(0).astype(int)
+
     return master_progress
 
 
-def concat_answers(df, module_name):
+def concat_answers(df, module_name, rules=None):
     """
     Concatenates specific columns of a DataFrame based on the given module name based on reporting requirements.
     
     This function takes a DataFrame (df) and a module name (module_name) as input, and concatenates the 
-    content of specific columns for each row depending on the module name. The concatenated answers are 
-    stored in a new column called 'concat_answers' in the DataFrame.
+    content of the columns selected by the module's terms in report_config.json. The column selection is 
+    resolved once per worksheet layout, and the concatenated answers are stored in a new column called 
+    'concat_answers' in the DataFrame.
     
     Args:
     df (pd.DataFrame): The input DataFrame containing the data to be processed.
     module_name (str): The name of the module used to determine which columns to concatenate.
+    rules (List[Dict[str, List[str]]]): The concatenation rules, read from the 'concat_answers' section of report_config.json if not given.
     
     Returns:
     pd.DataFrame: The modified DataFrame with the new 'concat_answers' column containing the concatenated answers.
     """
-    #apply lower() for better string matching
-    module_name = module_name.lower()
-
-    if 'share a story' in module_name:
-        concat_list = ['what kind of story do you want to share this week?', 'describe the situation', 'how does', 'what opportunities']
-        df['concat_answers'] = df.apply(lambda x: ' '.join(x[col] for col in df.columns if any(term in col.lower() for term in concat_list)), axis=1)
+    if rules is None:
+        rules = load_config()['concat_answers']
 
-    elif 'advance understanding' in module_name or 'deliberate values' in module_name:
-        concat_list = ['what questions are you currently', 'what stood', 'how was']
-        df['concat_answers'] = df.apply(lambda x: ' '.join(x[col] for col in df.columns if any(term in col.lower() for term in concat_list)), axis=1)
+    terms = concat_terms(module_name, rules)
+    if terms is None:
+        return df
 
-    elif 'career management' in module_name:
-        concat_list = ['situation', 'new opportunity', 'small action']
-        df['concat_answers'] = df.apply(lambda x: ' '.join(x[col] for col in df.columns if any(term in col.lower() for term in concat_list)), axis=1)
+    positions = concat_columns(tuple(str(col) for col in df.columns), terms)
+    df['concat_answers'] = join_columns(df, positions)
 
     return df
    
 
-def add_quiz_answers(master_progress, course, gc):
+def add_quiz_answers(master_progress, course, gc, concat_rules=None, submissions=None):
     """
     Adds quiz answer data to a master progress DataFrame.
     
@@ -416,145 +646,172 @@ def add_quiz_answers(master_progress, course, gc):
     master_progress (pd.DataFrame): The master progress DataFrame to which quiz answer data will be added.
     course (Course): A course object containing the name and URL of the course being processed.
     gc (gspread.client.Client): A Google Sheets client object used to retrieve quiz answer data from the course.
+    concat_rules (List[Dict[str, List[str]]]): The answer concatenation rules, read from report_config.json if not given.
+    submissions (SubmissionIndex): The latest-submission index, kept in the course's Checkpoints folder if not given.
     
     Returns:
     pd.DataFrame: The modified master progress DataFrame with quiz answer data added.
     """
+    if concat_rules is None:
+        concat_rules = load_config()['concat_answers']
+    if submissions is None:
+        submissions = SubmissionIndex(os.path.join(course.name, 'Checkpoints', 'submissions.json'))
     
-    # Open quiz answers
-    survey = gc.open_by_url(course.data_url)
+    # Open quiz answers and read all gsheet worksheets at once to limit API calls and work locally
+    survey = fetch_worksheets(gc.open_by_url(course.data_url))
 
-    # Save all gsheet worksheets into a list to limit API calls and work locally
     # Retrieve module names for column labelling at later point
-    module_names = [str(sheet.title).split(' - ', 1)[1] for sheet in survey.worksheets()]
-
-
-    # change the order of module names to control the order in which they appear
-    order_dict = {}
+    module_names = [str(title).split(' - ', 1)[1] for title in survey]
 
     for module in module_names:
         print(f'{module} answers retrieved.')
 
-    # Create list of dataframes per answer sheet, then zip it with corresponding module name
-    answers = [pd.DataFrame(sheet.get_all_records()) for sheet in survey.worksheets()]
-    zipped_df = list(zip(module_names, answers))
-
-    # Create blank dataframe to append each user entry with corresponding answers
-    answers_master = pd.DataFrame()
-    # For each user instance
-    for index, row in master_progress.iterrows():
-        # using email as primary key per user
-        user_email = row['Email']
-        # if user_email == 'snali@mun.ca':
-        #     print('my man')
-        # Create initial dataframe that only includes user's email for later merging
-        user_answers = [pd.DataFrame([user_email], columns=['email'])]
-        # For each survey worksheet
-        for module_name, df in zipped_df:
-            # Retrieve all instances from user - Skip answers with no email field
-            try:
-                answer_list = df.loc[df['email'] == user_email]
-            except KeyError:
-                continue
+    # Build each module's answers keyed by email and align them all at once, rather than growing a wide frame per module.
+    # Every raw sheet is released as soon as its module is reduced to the latest answers of master students
+    master_emails = master_progress['Email'].drop_duplicates()
+    modules = []
+    for module_name, title in zip(module_names, list(survey)):
+        module_answers = __module_answers(survey.pop(title), module_name, master_emails, concat_rules, submissions)
+        if module_answers is None:
+            continue
+        modules.append(module_answers.set_index('Email'))
+    submissions.save()
+
+    if not modules:
+        return master_progress
+
+    # Repeated choice answers are stored once as categories before being spread over every group row
+    answers_master = compact_columns(pd.concat(modules, axis=1))
+    master_progress = master_progress.merge(answers_master, left_on='Email', right_index=True, how='left')
+
+    return master_progress
 
-            # If user has multiple entries, take the latest one
-            if answer_list.shape[0] > 1:
-                submission_dates = answer_list['Submitted At'].to_list()
-                # Limit answers down to latest submission by finding latest date then selecting corresponding row
-                formatted_submission_dates = [datetime.strptime(date, '%m/%d/%Y %H:%M:%S') for date in submission_dates]
-                latest_date = max(formatted_submission_dates).strftime("%-m/%-d/%Y %-H:%M:%S")
-                #Convert datetime object back to string to match cell value and select latest row only
 
-                ''' THIS IS CAUSING PROBLEMS BECAUSE ITS NOT MATCHING ANY ENTRIES - did i already fix this? Im pretty sure I did'''
-                answer_list = answer_list.loc[answer_list['Submitted At'] == latest_date]
+def __module_answers(df, module_name, master_emails, concat_rules, submissions):
+    """
+    Builds the prefixed answer columns of one module for every student in the master report.
 
-            elif answer_list.empty:
-                continue
-            
-            # Apply a concat method to create a new field for reporting requirement to concat answers into one field
-            answer_list = concat_answers(answer_list, module_name)
+    Args:
+    df (pd.DataFrame): The survey answers for one module.
+    module_name (str): The name of the module, used to prefix the answer columns.
+    master_emails (pd.Series): The emails present in the master progress report.
+    concat_rules (List[Dict[str, List[str]]]): The answer concatenation rules.
+    submissions (SubmissionIndex): The latest-submission index.
 
+    Returns:
+    pd.DataFrame: One row per answering student keyed on 'Email', or None if no student answered.
+    """
+    # Skip answers with no email field
+    if 'email' not in df.columns:
+        return None
 
-            # Add columns prefixes excluding 'email' column for merging
-            answer_list.columns = [f'{module_name}_' + str(col) if str(col)!= 'email' else str(col) for col in answer_list.columns ]
-            user_answers.append(answer_list)
+    # If user has multiple entries, take the latest one
+    df = df.iloc[submissions.latest(module_name, df)]
 
-        # merges list of dataframes per module to create one cohesive list of all module answers per single student email
-        user_answers = reduce(lambda x, y: pd.merge(x, y, on='email') if not y.empty else x, user_answers)
-        # Add user entry to master list
-        answers_master = pd.concat([answers_master, user_answers], ignore_index=True)
+    df = df.loc[df['email'].isin(master_emails)].reset_index(drop=True)
+    if df.empty:
+        return None
 
-    # rename email column to match master sheet column naming
-    answers_master.rename(columns={'email': 'Email'}, inplace=True)
+    # Apply a concat method to create a new field for reporting requirement to concat answers into one field
+    df = concat_answers(df, module_name, concat_rules)
 
-    master_progress = pd.merge(master_progress, answers_master, on='Email')
-    
-    return master_progress
+    # Add columns prefixes excluding 'email' column, which is renamed to match master sheet column naming
+    df.columns = [f'{module_name}_' + str(col) if str(col) != 'email' else 'Email' for col in df.columns]
+
+    return df
 
 
-def write_to_gs(gc, df, url, worksheet):
+def write_to_gs(gc, df, url, worksheet, dry_run=False, keep_columns=False):
     """
     Writes a DataFrame to a Google Sheets worksheet.
     
     This function takes a Google Sheets client object (gc), a DataFrame (df), a Google Sheets URL (url), 
     and a worksheet name (worksheet) as input. It writes the DataFrame to the specified worksheet in the 
-    specified Google Sheets document.
+    specified Google Sheets document, sending only the cells that changed since the last write.
     
     Args:
     gc (gspread.client.Client): A Google Sheets client object used to write the DataFrame to the worksheet.
     df (pd.DataFrame): The DataFrame to be written to the worksheet.
     url (str): The URL of the Google Sheets document where the DataFrame will be written.
     worksheet (str): The name of the worksheet where the DataFrame will be written.
+    dry_run (bool): Only report how many cells would be written.
+    keep_columns (bool): Refuse to write a DataFrame lacking columns the worksheet already has, which
+    the write would otherwise delete, e.g. the lesson columns of exports when building from the API.
+
+    Raises:
+    ValueError: If keep_columns is set and columns of the worksheet are missing from the DataFrame.
     """
     data = gc.open_by_url(url).worksheet(worksheet)
-    data.clear()
-    set_with_dataframe(worksheet=data, dataframe=df, include_index=False,
-    include_column_header=True, resize=True)
+    if keep_columns:
+        missing = [col for col in data.row_values(1) if col and col not in df.columns]
+        if missing:
+            raise ValueError(f'{len(missing)} columns of {url} are missing from the report and would be deleted, '
+                             f'e.g. {", ".join(missing[:3])}. Write it from exported reports instead.')
+    write_dataframe_diff(data, df, dry_run=dry_run)
 
 
 def __parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('--no_emails', '-n',  help='Skip email download and use locally stored downloads', action='store_true')
     parser.add_argument('--exports', '-e',  help='Automate export retrieval', action='store_true')
+    parser.add_argument('--dry_run', '-d',  help='Report how many cells would be written to Google Sheets without writing them', action='store_true')
+    parser.add_argument('--show_browser', '-b',  help='Run the browser visibly instead of headless', action='store_true')
+    parser.add_argument('--offline', '-o',  help='Rebuild reports from locally cached sheets and downloads without any API calls', action='store_true')
+    parser.add_argument('--from_stage', '--from-stage',  help='Resume the pipeline at this stage, loading earlier stages from their checkpoints', choices=STAGES)
+    parser.add_argument('--to_stage', '--to-stage',  help='Stop the pipeline after this stage', choices=STAGES)
+    parser.add_argument('--api', '-a',  help='Read progress and group membership from the Thinkific API instead of exported reports', action='store_true')
+    parser.add_argument('--full_sync', '--full-sync',  help='With --api, list every enrollment again instead of only those updated since the last run', action='store_true')
+    parser.add_argument('--stats', '-s',  help='Print a table of stage timings and API calls at the end of the run', action='store_true')
+    parser.add_argument('--profile',  help='Write cProfile statistics of the run next to the run report', action='store_true')
+    parser.add_argument('--all_courses', '--all-courses',  help='Process every configured course unattended in one run', action='store_true')
+    parser.add_argument('--courses',  help='Process only the named courses unattended in one run', nargs='+', metavar='COURSE')
+    parser.add_argument('--report_format', '--report-format',  help='File format of the partner reports', choices=REPORT_FORMATS, default='csv')
     # ADD ARGUMENTS HERE
     args = parser.parse_args()
 
     return args
 
 
-def __wait_time(wait_minutes):
-    """
-    Waits for the specified number of minutes.
-
-    Args:
-    wait_minutes (float): The number of minutes to wait.
-    """
-    wait_seconds = round(float(wait_minutes)*60)
-    print(f'INITIATING WAIT TIME FOR {wait_seconds} SECONDS...')
-
-    while wait_seconds:
-        mins, secs = divmod(wait_seconds, 60)
-        timer = '=== {:02d}:{:02d} ==='.format(mins, secs)
-        print(timer, end="\r")
-        sleep(1)
-        wait_seconds -= 1
-
-
-def final_formatting(master_progress):
+def wait_for_export_emails(username, password, course, expected, timeout=EXPORT_EMAIL_TIMEOUT,
+                            interval=EXPORT_POLL_INTERVAL, mail=None, state_path=STATE_PATH):
     """
-    Drops unwanted columns from the master progress DataFrame.
+    Polls the mailbox until the expected number of unprocessed export emails has arrived.
 
     Args:
-    master_progress (pd.DataFrame): The master progress DataFrame.
-
-    Returns:
-    pd.DataFrame: The updated master progress DataFrame.
+    username (str): The email username.
+    password (str): The email password.
+    course (Course): The course object.
+    expected (int): The number of export emails to wait for.
+    timeout (float): The number of seconds after which to continue with the emails received so far.
+    interval (float): The number of seconds between mailbox checks.
+    mail (imaplib.IMAP4): An optional logged in IMAP connection, e.g. a local stand-in.
+    state_path (str): The path of the JSON file holding the UID watermarks.
     """
-    drop_list = ['Token', 'last_name', 'first_name']
-    for term in drop_list:
-        master_progress = master_progress[master_progress.columns.drop(list(master_progress.filter(regex=term)))]
+    if mail is None:
+        mail = RUN_REPORT.wrap(imaplib.IMAP4_SSL('imap.gmail.com'), 'imap', IMAP_METHODS)
+        mail.login(username, password)
+    print(f'WAITING FOR {expected} EXPORT EMAILS...')
 
-    return master_progress
+    deadline = monotonic() + timeout
+    try:
+        while True:
+            # Re-select so the server reports newly delivered mail
+            mail.select()
+            validity, last_uid = load_watermark(__watermark_key(username), state_path)
+            if validity != uid_validity(mail):
+                last_uid = None
+
+            received = len(search_uids(mail, last_uid, *EXPORT_EMAIL_CRITERIA))
+            print(f'=== {received}/{expected} export emails received ===', end='\r')
+            if received >= expected:
+                print()
+                return
+            if monotonic() > deadline:
+                print(f'\nTIMED OUT AFTER {timeout} SECONDS, CONTINUING WITH {received} EMAILS.')
+                return
+            sleep(interval)
+    finally:
+        mail.logout()
 
 
 def add_credential_status(gc, master_progress, course):
@@ -608,57 +865,71 @@ def __gdrive_authenticate():
         gauth.Authorize()
     # Save the current credentials to a file
     gauth.SaveCredentialsFile("client_secrets.json")
-    drive = GoogleDrive(gauth)
+    drive = RUN_REPORT.hook_drive(GoogleDrive(gauth))
 
     return drive
 
 
-def write_group_reports(partner_df, master_progress, course):
+def write_group_reports(partner_df, master_progress, course, offline=False, drive=None, fmt='csv'):
     """
-    Writes progress reports for each group to their corresponding Google Drive folder.
+    Writes progress reports for each group to their corresponding Google Drive folder. Reports are
+    generated one at a time and each is kept locally and handed to the uploader as it is produced.
 
     Args:
         partner_df (pd.DataFrame): The partner DataFrame.
         master_progress (pd.DataFrame): The master progress DataFrame.
         course (Course): The Course object.
+        offline (bool): Only write the reports locally, skipping the Google Drive upload.
+        drive (GoogleDrive): The authenticated GoogleDrive client, authenticated here if not given.
+        fmt (str): The file format of the reports, one of report_stream.REPORT_FORMATS.
+
+    Returns:
+        Dict[str, str]: The upload outcome of each group.
     """
-    drive = __gdrive_authenticate()
+    targets = [(row['Group'], folder_id_from_url(row[course.name])) for _, row in partner_df.iterrows()]
+    stream = stream_group_reports(master_progress, [group.lower().title() for group, _ in targets], fmt)
+    reports = ((group, folder_id, report_file_name(group, fmt), data)
+               for (group, folder_id), (_, data) in zip(targets, stream))
 
-    for _, row in partner_df.iterrows():
-        group = row['Group']
-        folder_url = row[course.name]
-        folder_id = folder_url.lstrip('https://drive.google.com/drive/folders/')
-        file_name = f'{group} Progress Report.csv'
-        df = master_progress.loc[master_progress['Group'] == group.lower().title()]     
-        df.to_csv(os.path.join(course.name, 'Reports', file_name), index=None)
-        try:
-            file_list = drive.ListFile({'q': f"'{folder_id}' in parents and trashed=false"}).GetList()
-        
-            for file in file_list:
-                if file_name == file['title']:
-                    file.Trash()
-        except:
+    # Keep a local copy of every report, which binary formats are also uploaded from
+    report_dir = os.path.join(course.name, 'Reports')
+    reports = save_reports(reports, report_dir)
+
+    if offline:
+        for _ in reports:
             pass
-        
-        gfile = drive.CreateFile({'title': f'{file_name}', 'parents': [{'id': folder_id}]})
-       
-        gfile.SetContentFile(os.path.join(course.name, 'Reports', file_name))
-        gfile.Upload() # Upload the file.
-    
-    
-def extended_survey_flag(master_progress):
-    master_progress['Extended Survey Eligibility'] = ''
-    for index, row in master_progress.iterrows():
-        test1 = row['Before You Begin + Welcome Survey_Which best describes you?  Are you currently..._1']
-        test2 = row["Before You Begin + Welcome Survey_Which best describes you? Are you currently..._2"]
-        test3 = row['Before You Begin + Welcome Survey_The Tech Stewardship Practice Program is most effective when it overlays a current experiential or work integrated learning experience. Please let us know what type of experience opportunity(s) you will have this semester:']
-
-        if (test1 in ["Completing a Bachelor's degree",'Completing an apprenticeship or trades qualification', 'Completing a College/CEGEP certificate or diploma', 'Completing a University certificate or diploma'] and
-            test2 in ["A Canadian citizen studying at a Canadian post-secondary institution", "A Canadian permanent resident studying at a Canadian post-secondary institution", "An international student studying at a Canadian post-secondary institution"] and
-            test3 in ['I will not have a current experiential or work integrated learning experience this semester']):
-            master_progress.loc[index, 'Extended Survey Eligibility'] = 'Yes'
-    return master_progress
-    
+        return {}
+
+    if drive is None:
+        drive = __gdrive_authenticate()
+
+    results = ReportUploader(drive, directory=report_dir).upload_all(reports, folder_ids=[folder_id for _, folder_id in targets])
+    for group, outcome in sorted(results.items()):
+        print(f'{group}: {outcome}')
+
+    failed = [group for group, outcome in results.items() if outcome.startswith('FAILED')]
+    if failed:
+        print(f'{len(failed)} PARTNER REPORTS FAILED TO UPLOAD.')
+
+    return results
+
+
+def extended_survey_flag(master_progress, flags=None):
+    """
+    Adds the configured eligibility flag columns, such as 'Extended Survey Eligibility', to the master progress DataFrame.
+
+    Args:
+    master_progress (pd.DataFrame): The master progress DataFrame.
+    flags (Dict[str, Dict[str, Any]]): The eligibility flags, read from the 'eligibility' section of report_config.json if not given.
+
+    Returns:
+    pd.DataFrame: The updated master progress DataFrame.
+    """
+    if flags is None:
+        flags = load_config()['eligibility']
+
+    return apply_flags(master_progress, flags)
+
 
 def print_intro():
     print('\n=================================================================================\n')
@@ -670,67 +941,112 @@ def print_intro():
     print('=================================================================================')
 
 
-def reorder_columns(df):
+def column_plan(columns, path=None):
     """
-    Reorders the columns in the given DataFrame based on a predefined order.
-    The function first reorders the DataFrame based on the col_list, then appends
-    the '_concat_answers' columns along with their corresponding 'thank you for sharing'
-    columns if they exist, and finally appends any remaining columns.
+    Plans the columns of the final report from its column signature: unwanted columns are dropped and
+    the rest are arranged in the predefined order, followed by each '_concat_answers' column with its
+    'thank you for sharing' column if one exists, the overall feedback rating and any remaining columns.
+    Plans are cached in process, and when path is given also persisted there, keyed by a hash of the
+    column signature and the planning rules, so repeat runs of a course skip the planning.
 
-    :param df: DataFrame to be reordered
-    :return: Reordered DataFrame with columns arranged in the desired order
+    Args:
+    columns (Tuple[str]): The column names of the master progress DataFrame.
+    path (str): The JSON file the plans are persisted in, e.g. in the course's Checkpoints folder.
+
+    Returns:
+    Tuple[str]: The columns of the final report, in order.
     """
+    columns = tuple(columns)
+    if path is None or not all(isinstance(col, str) for col in columns):
+        return __plan_columns(columns)
 
-    # predefined column order
-    col_list = ['First Name', 'Last Name', 'Email', 'Credential Status', 'Notes', 'Last Sign In', 'Request a micro-credential_Submitted At', 'Group', 'Company' 'Attendance Count', '% Completed']
+    signature = json.dumps([columns, DROP_TERMS, LEAD_COLUMNS, FEEDBACK_COLUMNS])
+    key = hashlib.sha256(signature.encode()).hexdigest()
+    try:
+        with open(path) as f:
+            plans = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        plans = {}
+    if key in plans:
+        return tuple(plans[key])
+
+    plan = __plan_columns(columns)
+    # Only the most recent signatures of the course are kept
+    plans[key] = list(plan)
+    plans = dict(list(plans.items())[-MAX_COLUMN_PLANS:])
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(plans, f)
+    os.replace(f'{path}.tmp', path)
+    return plan
+
+
+@lru_cache(maxsize=None)
+def __plan_columns(columns):
+    drop_pattern = re.compile('|'.join(DROP_TERMS))
+    kept = [col for col in columns if not drop_pattern.search(str(col))]
+
+    # Index the 'thank you for sharing' columns by module once instead of scanning per concat column
+    sharing = {}
+    for col in kept:
+        if '_Thank' in col:
+            sharing.setdefault(col.split('_Thank')[0], col)
 
-    # Extract all 'concat_answers' columns to be reordered earlier in the df and include 'thank you for sharing' entry if exists
     concat_list = []
-    for col in df.columns:
-        # Check if the column name contains '_concat_answers'
+    for col in kept:
         if '_concat_answers' in col:
             concat_list.append(col)
-
             module_name = col.split('_concat_answers')[0]
-            # Search for the 'thank you for sharing' column with the same module name
-            sharing_col = [c for c in df.columns if f'{module_name}_Thank' in c]
-            # If a matching column is found, add it to the concat_list
-            if sharing_col:
-                concat_list.append(sharing_col[0])
-
+            if module_name in sharing:
+                concat_list.append(sharing[module_name])
 
-    third_col_list = ['Feedback_Overall how do you rate your experience of participating in the TS program?']
+    # Each column appears once, at its first place in the order
+    lead = dict.fromkeys(LEAD_COLUMNS + concat_list + FEEDBACK_COLUMNS)
+    return tuple(lead) + tuple(col for col in kept if col not in lead)
 
 
-    df = df[col_list + concat_list + third_col_list + [col for col in df.columns if col not in col_list + concat_list]]
-    return df
-
+def finalize_report(master_progress, key=('Email', 'Group'), plan_path=None):
+    """
+    Finalizes the master progress DataFrame in a single pass: rows are deduplicated on key, sorted by
+    email and laid out according to the cached column plan with one reindex. Planned columns missing
+    from the DataFrame are left empty.
 
-def main():
-    print_intro()
-    username, password, ts_password = LOGIN_DICT['user'], LOGIN_DICT['pass'], LOGIN_DICT['ts_pass']
-    # Create arg parser instance
-    args = __parser()
+    Args:
+    master_progress (pd.DataFrame): The master progress DataFrame.
+    key (Tuple[str]): The columns identifying a row of the report.
+    plan_path (str): The JSON file column plans are persisted in, only cached in process if not given.
 
-    # Create Google cloud authentication instance
-    gc = gspread_authenticate()
+    Returns:
+    pd.DataFrame: The final report.
+    """
+    if not master_progress.index.is_unique:
+        master_progress = master_progress.reset_index(drop=True)
 
-    # Create Thinkific login object to query API
-    thinkific = Thinkific(LOGIN_DICT['api_key'], 'marsdd')
+    rows = master_progress.loc[~master_progress.duplicated(subset=list(key)), 'Email']
+    rows = rows.sort_values(kind='stable').index
+    plan = column_plan(tuple(master_progress.columns), plan_path)
+    return master_progress.reindex(index=rows, columns=list(plan))
 
-    print('\n=====================')
-    print('Creating courses...')
-    print('=====================')
 
-    course = create_course(COURSE_CONFIG_URL, thinkific, gc)
-    partner_df, participant_group_list = get_reporting_groups(gc, course)
-    
+def acquire_reports(course, participant_group_list, args, browser, username, password, ts_password, batch=False):
+    """
+    Triggers the exports of a course if requested and downloads its reports from the export emails.
+    In a batch run, the export emails of the other courses are left unread for them.
 
+    Args:
+    course (Course): The course object.
+    participant_group_list (List[str]): The groups of the course requiring exports.
+    args (argparse.Namespace): The parsed command line arguments.
+    browser (BrowserSession): The browser session shared by the export and download phases.
+    username (str): The email username.
+    password (str): The email password.
+    ts_password (str): The Tech Stewardship program password.
+    batch (bool): Only read the export emails of this course and its groups.
+    """
     # Export dialog enabled
     if args.exports is True:
-        wait_minutes = input('Enter wait time in minutes:\n')
-        get_exports(participant_group_list, course, username, ts_password)
-        __wait_time(wait_minutes)
+        with RUN_REPORT.stage('exports', course.name):
+            expected = get_exports(participant_group_list, course, username, ts_password, session=browser)
+            wait_for_export_emails(username, password, course, expected)
         print('\n=====================')
 
     # Create course folders
@@ -740,49 +1056,94 @@ def main():
     # Report download via email
     if args.no_emails is False:
         print('\n=====================')
-        files = get_email_link(username, password, course)
-        get_downloads(files, username, ts_password, course.name)
+        with RUN_REPORT.stage('downloads', course.name):
+            # Emails are only consumed once their reports are downloaded
+            groups = participant_group_list if batch else None
+            with get_email_link(username, password, course, groups=groups) as emails:
+                get_downloads(emails, username, ts_password, course.name, session=browser, on_download=emails.downloaded)
         print('=====================\n')
 
-    print('\n=====================')
-    print('Creating groups...')
-    print('=====================\n')
-    groups = create_groups(course)
-    print('Completed.\n')
+
+def build_course(course, client, gc, drive, partner_df, config, args, thinkific=None, participant_group_list=None):
+    """
+    Builds the master progress report of a course from its downloaded reports and sheets, then writes
+    the partner reports and master file. All output is kept under the course's own folder.
+
+    Args:
+    course (Course): The course object.
+    client (gspread.client.Client): The authenticated Google Sheets client used for writes, or None when offline.
+    gc (SheetCache): The cached Google Sheets client used for reads.
+    drive (GoogleDrive): The authenticated GoogleDrive client, or None when offline.
+    partner_df (pd.DataFrame): The partner reporting groups of the course.
+    config (Dict[str, Any]): The reporting rules configuration.
+    args (argparse.Namespace): The parsed command line arguments.
+    thinkific (ThinkificSource): The Thinkific API client, used as the data source when args.api is set.
+    participant_group_list (List[str]): The participant groups of the course, the only groups read from the API.
+
+    Returns:
+    Dict[str, Any]: A summary of the run with the course, number of students and groups, upload outcomes and status.
+    """
+    summary = {'course': course.name, 'students': 0, 'groups': 0, 'uploads': {}, 'status': 'completed'}
+    checkpoints = PipelineCheckpoints(os.path.join(course.name, 'Checkpoints'), args.from_stage, args.to_stage, label=course.name)
+
     print('\n=====================')
     print('Generating progress reports...')
     print('=====================\n')
-
-    master_progress = generate_prog_reports(course, groups)
-    write_to_gs(gc, master_progress, course.thinkific_url, 'Sheet1')
+    if args.api is True:
+        inventory = ThinkificInventory(thinkific, course.name, os.path.join(course.name, 'Checkpoints', 'thinkific.json'),
+                                       groups=participant_group_list, full_sync=args.full_sync)
+    else:
+        inventory = ReportInventory(os.path.join(course.name, 'Downloaded Reports'))
+    master_progress = checkpoints.run('progress', build_progress_report, course, inventory, key=[inventory.fingerprint()])
+    if args.offline is False:
+        # The API has no lesson-level progress, so a sheet holding exported lesson columns is left untouched
+        write_to_gs(client, master_progress, course.thinkific_url, 'Sheet1', dry_run=args.dry_run, keep_columns=args.api)
+    summary['students'] = master_progress['Email'].nunique()
+    summary['groups'] = master_progress['Group'].nunique()
     print('Completed.\n')
+    if checkpoints.stop('progress'):
+        return dict(summary, status='stopped after progress')
+
     print('\n=====================')
     print('Adding attendance...')
     print('=====================\n')
-    master_progress = add_attendance(master_progress, course, gc)
+    master_progress = checkpoints.run('attendance', add_attendance, master_progress, course, gc,
+                                      key=[master_progress, gc.revision(course.attendance_url)])
     print('Completed.\n')
+    if checkpoints.stop('attendance'):
+        return dict(summary, status='stopped after attendance')
+
     print('\n=====================')
     print('Adding survey answers...')
     print('=====================\n')
-    master_progress = add_quiz_answers(master_progress, course, gc)
+    master_progress = checkpoints.run('answers', add_quiz_answers, master_progress, course, gc, config['concat_answers'],
+                                      key=[master_progress, gc.revision(course.data_url), config['concat_answers']])
+    if checkpoints.stop('answers'):
+        return dict(summary, status='stopped after answers')
 
-    # This extended survey is a tad hard coded, isn't currently working for fall
-    if 'Fall 2022' not in course.name:
-        master_progress = extended_survey_flag(master_progress)
+    # Flags whose survey columns are missing this term are left blank
+    master_progress = checkpoints.run('eligibility', extended_survey_flag, master_progress, config['eligibility'],
+                                      key=[master_progress, config['eligibility']])
+    if checkpoints.stop('eligibility'):
+        return dict(summary, status='stopped after eligibility')
 
     print('Completed.\n')
     print('\n=====================')
     print('Building Partner Reports...')
     print('=====================\n')
     
-    # should i put this loweR?
-    master_progress.drop_duplicates(inplace=True)
-    
-    master_progress = final_formatting(master_progress)
-    master_progress = add_credential_status(gc, master_progress, course)
-    master_progress = reorder_columns(master_progress)
-    master_progress.sort_values(by='Email', inplace=True)
-    write_group_reports(partner_df, master_progress, course)
+    master_progress = checkpoints.run('credentials', add_credential_status, gc, master_progress, course,
+                                      key=[master_progress, gc.revision(course.credential_url)])
+    if checkpoints.stop('credentials'):
+        return dict(summary, status='stopped after credentials')
+
+    # Deduplication, column selection, ordering and sorting in one stage
+    plan_path = os.path.join(course.name, 'Checkpoints', COLUMN_PLANS_FILE)
+    master_progress = checkpoints.run('finalize', finalize_report, master_progress, ('Email', 'Group'), plan_path,
+                                      key=[master_progress])
+    with RUN_REPORT.stage('partner reports', course.name, len(master_progress)):
+        summary['uploads'] = write_group_reports(partner_df, master_progress, course, offline=args.offline, drive=drive,
+                                                 fmt=args.report_format)
 
     print('Completed.\n')
     
@@ -792,8 +1153,163 @@ def main():
     print('\n=====================')
     print('Writing to Master File...')
     print('=====================\n')
-    master_progress.to_csv("Master.csv", index=None)
-    write_to_gs(gc, master_progress, course.master_url, 'Sheet1')
+    master_progress.to_csv(os.path.join(course.name, 'Master.csv'), index=None)
+    if args.offline is False:
+        with RUN_REPORT.stage('master write', course.name, len(master_progress)):
+            write_to_gs(client, master_progress, course.master_url, 'Sheet1', dry_run=args.dry_run, keep_columns=args.api)
+    print('Completed.\n')
+
+    return summary
+
+
+def build_courses(courses, client, gc, drive, participants, config, args, thinkific=None, max_workers=COURSE_WORKERS):
+    """
+    Builds several courses concurrently through a bounded thread pool. A failing course is
+    recorded in its summary without stopping the others.
+
+    Args:
+    courses (List[Course]): The course objects.
+    client (gspread.client.Client): The authenticated Google Sheets client used for writes, or None when offline.
+    gc (SheetCache): The cached Google Sheets client used for reads.
+    drive (GoogleDrive): The authenticated GoogleDrive client, or None when offline.
+    participants (pd.DataFrame): The participant configuration shared by all courses.
+    config (Dict[str, Any]): The reporting rules configuration.
+    args (argparse.Namespace): The parsed command line arguments.
+    thinkific (ThinkificSource): The Thinkific API client, used as the data source when args.api is set.
+    max_workers (int): The maximum number of courses built at once.
+
+    Returns:
+    List[Dict[str, Any]]: The summary of each course, in course order.
+    """
+    def build(course):
+        try:
+            partner_df, participant_group_list = get_reporting_groups(gc, course, participants)
+            return build_course(course, client, gc, drive, partner_df, config, args, thinkific, participant_group_list)
+        except Exception as e:
+            return {'course': course.name, 'students': 0, 'groups': 0, 'uploads': {}, 'status': f'FAILED: {e}'}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(courses)))) as executor:
+        return list(executor.map(build, courses))
+
+
+def print_batch_summary(summaries):
+    """
+    Prints the combined outcome of a multi-course run, one line per course.
+
+    Args:
+    summaries (List[Dict[str, Any]]): The summary of each course.
+    """
+    print('\n=====================')
+    print('Batch summary')
+    print('=====================\n')
+    width = max(len(summary['course']) for summary in summaries)
+    for summary in summaries:
+        outcomes = list(summary['uploads'].values())
+        failed = sum(outcome.startswith('FAILED') for outcome in outcomes)
+        print(f"{summary['course']:<{width}}  {summary['students']:>6} students  {summary['groups']:>4} groups  "
+              f"{len(outcomes) - failed:>4} uploads ok  {failed:>3} failed  {summary['status']}")
+
+
+def main():
+    print_intro()
+    # Create arg parser instance
+    args = __parser()
+    if args.profile is True:
+        RUN_REPORT.start_profile()
+
+    # The run report is written even when the run fails part way
+    try:
+        run(args)
+    finally:
+        path = RUN_REPORT.write()
+        if args.stats is True:
+            RUN_REPORT.print_summary()
+        print(f'Run report written to {path}')
+
+
+def run(args):
+    """
+    Runs the report pipeline for the course, or every selected course, described by the command line arguments.
+
+    Args:
+    args (argparse.Namespace): The parsed command line arguments.
+    """
+    configure_pandas()
+
+    # Credentials are only loaded to run the pipeline, so its stages can be imported offline
+    from credentials import login_credentials
+    login_dict = login_credentials()
+    username, password, ts_password = login_dict['user'], login_dict['pass'], login_dict['ts_pass']
+    batch = args.all_courses is True or bool(args.courses)
+
+    # Create Google cloud authentication instance, reading sheets through the local cache
+    if args.offline is True:
+        client, thinkific, drive = None, None, None
+        args.exports, args.no_emails, args.api = False, True, False
+    else:
+        client = gspread_authenticate()
+
+        # Create Thinkific login object to query API
+        thinkific = ThinkificSource(login_dict['api_key'], 'marsdd')
+
+        # Drive is authenticated once and shared by every course's uploads
+        drive = __gdrive_authenticate()
+
+    gc = SheetCache(client, offline=args.offline)
+
+    # Resuming past the progress stage reuses the reports already downloaded, and the API replaces them
+    if args.api is True or (args.from_stage is not None and STAGES.index(args.from_stage) > 0):
+        args.exports, args.no_emails = False, True
+
+    print('\n=====================')
+    print('Creating courses...')
+    print('=====================')
+
+    if batch:
+        courses = load_courses(COURSE_CONFIG_URL, thinkific, gc, names=args.courses)
+        print(f'{len(courses)} courses selected: {", ".join(course.name for course in courses)}')
+        if not courses:
+            return
+    else:
+        courses = [create_course(COURSE_CONFIG_URL, thinkific, gc)]
+
+    participants = participant_config(gc)
+    config = load_config()
+
+    # One browser session, launched on first use, is shared by the export and download phases of every
+    # course. Downloads go through a single staging folder and mailbox, so courses are acquired one at a time
+    failed = {}
+    with BrowserSession(headless=not args.show_browser, download_dir=os.path.join('.', 'Downloaded Reports')) as browser:
+        for course in courses:
+            try:
+                _, participant_group_list = get_reporting_groups(gc, course, participants)
+                acquire_reports(course, participant_group_list, args, browser, username, password, ts_password, batch)
+            except NoExportEmails:
+                # A course without new export emails is built from the reports already downloaded
+                if not batch:
+                    raise
+                print(f'No new reports acquired for {course.name}, using existing downloads.')
+            except (Exception, SystemExit) as e:
+                # A course failing to acquire its reports is skipped, the others are still built
+                if not batch:
+                    raise
+                print(f'FAILED to acquire reports for {course.name}: {e!r}, SKIPPING COURSE')
+                failed[course.name] = {'course': course.name, 'students': 0, 'groups': 0, 'uploads': {},
+                                       'status': f'FAILED: {e!r}'}
+
+    if not batch:
+        course = courses[0]
+        partner_df, participant_group_list = get_reporting_groups(gc, course, participants)
+        build_course(course, client, gc, drive, partner_df, config, args, thinkific, participant_group_list)
+        gc.flush()
+        print('Completed, EXITING...\n')
+        return
+
+    built = iter(build_courses([course for course in courses if course.name not in failed],
+                               client, gc, drive, participants, config, args, thinkific))
+    summaries = [failed[course.name] if course.name in failed else next(built) for course in courses]
+    print_batch_summary(summaries)
+    gc.flush()
     print('Completed, EXITING...\n')
 
 if __name__ == '__main__':
@@ -2,48 +2,103 @@ from selenium_setup import *
 import pandas as pd
 import csv
 import os
-from time import sleep
+import hashlib
+import json
+import requests
+from email.message import Message
+from urllib.parse import urlparse, parse_qs, unquote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from download_watcher import DownloadWatcher
+from instrumentation import RUN_REPORT
+from time import sleep, monotonic
 from random import randint
 
 
-def signin(driver, username, password):
+MAX_DOWNLOAD_WORKERS = 8
+MAX_BROWSER_DOWNLOADS = 4
+DOWNLOAD_TIMEOUT = 300
+CHUNK_SIZE = 1024 * 1024
+
+
+SIGNIN_URL = 'https://programs.techstewardship.com/users/sign_in'
+REPORTS_URL = 'https://programs.techstewardship.com/manage/reports'
+
+
+def signin(driver, username, password, headless=True):
     '''
     This function signs into the Tech Stewardship website using the provided login credentials.
+    When the sign in does not go through on its own, e.g. because of a captcha, a visible browser
+    waits for it to be completed by hand, while a headless one fails.
 
     Args:
     driver (WebDriver): The WebDriver object for the Chrome browser.
     username (str): The email address associated with the user's account.
     password (str): The password associated with the user's account.
+    headless (bool): Whether the browser is hidden, so the sign in cannot be completed by hand.
+
+    Raises:
+    RuntimeError: If a headless sign in does not complete.
     '''
 
-    link ='https://programs.techstewardship.com/users/sign_in'
+    link = SIGNIN_URL
     driver.get(link)
-    driver.find_element(By.XPATH, '//*[@id="user[email]"]').send_keys(username)
-    sleep(1)
-    submit = driver.find_element(By.XPATH, '//*[@id="user[password]"]')
-    sleep(1)
-    submit.send_keys(password)
-    sleep(1)
+    wait = WebDriverWait(driver, 10)
+    wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="user[email]"]'))).send_keys(username)
+    driver.find_element(By.XPATH, '//*[@id="user[password]"]').send_keys(password)
     driver.find_element(By.XPATH, '/html/body/main/div/div/article/form/div[5]/button').click()
-    sleep(2)
-    if driver.current_url == 'https://programs.techstewardship.com/users/sign_in':
-        input('Press any key to continue')
+    try:
+        wait.until(EC.url_changes(link))
+    except TimeoutException:
+        if headless:
+            raise RuntimeError('Sign in did not complete, it may need to be finished by hand. '
+                               'Rerun with --show-browser to complete it in the browser window.')
+        input('Complete the sign in in the browser window, then press any key to continue')
     print('SIGN IN COMPLETE.\n')
 
 
+def session_signin(session, username, password):
+    '''
+    This function makes sure a shared browser session is signed in, reusing the cookies persisted
+    by a previous run when they are still valid.
 
-def __move_files(entry, course_name, downloaded_filename):
+    Args:
+    session (BrowserSession): The shared browser session.
+    username (str): The email address associated with the user's account.
+    password (str): The password associated with the user's account.
+
+    Returns:
+    WebDriver: The signed in WebDriver object.
     '''
-    This function sorts through various downloaded files, names them and organizes them accordingly.
+    driver, wait, actions = session.start()
+    if session.signed_in:
+        return driver
+
+    if session.restore_cookies(SIGNIN_URL):
+        driver.get(REPORTS_URL)
+        if driver.current_url.startswith(REPORTS_URL):
+            print('SIGN IN RESTORED FROM SAVED SESSION.\n')
+            session.signed_in = True
+            return driver
+
+    signin(driver, username, password, headless=session.headless)
+    session.save_cookies()
+    session.signed_in = True
+    return driver
+
+
+def report_filename(subject, course_name):
+    '''
+    This function derives the local filename of an export from its email subject.
 
     Args:
-    entry (tuple): A tuple of the download link and filename.
+    subject (str): The subject of the export email.
     course_name (str): The name of the course for which the file is being downloaded.
-    downloaded_filename (str): The name of the file that has been downloaded.
-    '''
 
-    subject = entry[1]
-    print(f'Renamed {subject}\n')
+    Returns:
+    str: The filename the export is stored under in the course's Downloaded Reports folder.
+    '''
 
     tmp = subject.lower().split(': ')[1].split(' for ')
     report_type = tmp[0].title()
@@ -57,43 +112,261 @@ def __move_files(entry, course_name, downloaded_filename):
         else:
             new_filename = f'{report_type}_{report_name}.csv'
 
+    return new_filename
+
+
+def __move_files(entry, course_name, downloaded_filename):
+    '''
+    This function sorts through various downloaded files, names them and organizes them accordingly.
+
+    Args:
+    entry (tuple): A tuple of the download link and filename.
+    course_name (str): The name of the course for which the file is being downloaded.
+    downloaded_filename (str): The name of the file that has been downloaded.
+    '''
+
+    subject = entry[1]
+    print(f'Renamed {subject}\n')
+
+    new_filename = report_filename(subject, course_name)
     os.rename(os.path.join('Downloaded Reports', downloaded_filename), os.path.join(course_name, 'Downloaded Reports', new_filename))
 
 
-def get_downloads(files, username, password, course_name):
+def session_from_driver(driver, pool_size=MAX_DOWNLOAD_WORKERS):
     '''
-    This function logs in to the Tech Stewardship website using the provided credentials, downloads the files
-    specified in the input list of tuples, and saves them in the appropriate directory.
+    This function lifts the cookies of a signed in WebDriver into a pooled HTTP session.
 
     Args:
-    files (List[Tuple[str,str]]): A list of tuples, where each tuple contains a download link and a filename.
-    username (str): The email address associated with the user's account.
-    password (str): The password associated with the user's account.
+    driver (WebDriver): The signed in WebDriver object.
+    pool_size (int): The number of connections kept open per host.
+
+    Returns:
+    requests.Session: The authenticated HTTP session.
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = driver.execute_script('return navigator.userAgent')
+
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+
+    return RUN_REPORT.hook_session(session, 'thinkific_web')
+
+
+def download_file(session, link, path, timeout=DOWNLOAD_TIMEOUT):
+    '''
+    This function streams a single export to disk, resuming a partial download left by a previous run.
+    The file is written to a .part file and only renamed to its final name once complete.
+
+    Args:
+    session (requests.Session): The authenticated HTTP session.
+    link (str): The download link.
+    path (str): The final path of the file.
+    timeout (float): The maximum number of seconds the whole download may take.
+
+    Returns:
+    str: The SHA-256 checksum of the downloaded file.
+    '''
+    part_path = f'{path}.{hashlib.sha1(link.encode()).hexdigest()[:8]}.part'
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    deadline = monotonic() + timeout
+
+    with session.get(link, headers=headers, stream=True, timeout=(10, 30)) as response:
+        if response.status_code == 416:
+            # Partial file is already complete
+            response.close()
+        else:
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+
+            expected = response.headers.get('Content-Length')
+            expected = offset + int(expected) if expected is not None else None
+
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if monotonic() > deadline:
+                        raise TimeoutError(f'Download of {os.path.basename(path)} exceeded {timeout}s')
+                    f.write(chunk)
+
+            if expected is not None and os.path.getsize(part_path) != expected:
+                raise IOError(f'Incomplete download of {os.path.basename(path)}: '
+                              f'{os.path.getsize(part_path)} of {expected} bytes')
+
+    digest = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    os.replace(part_path, path)
+    return digest.hexdigest()
+
+
+def __record_checksums(course_name, checksums):
+    path = os.path.join(course_name, 'Downloaded Reports', 'checksums.json')
+    try:
+        with open(path) as f:
+            recorded = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        recorded = {}
+
+    recorded.update(checksums)
+    with open(path, 'w') as f:
+        json.dump(recorded, f, indent=2)
+
+
+def http_downloads(files, session, course_name, max_workers=MAX_DOWNLOAD_WORKERS, timeout=DOWNLOAD_TIMEOUT, on_download=None):
+    '''
+    This function downloads every export link concurrently through an authenticated HTTP session,
+    streaming each file straight to its final name. Links are submitted as they are produced,
+    so a generator of email links is consumed while earlier downloads are still running, and each
+    finished download is handed to on_download as soon as it is seen.
+
+    Args:
+    files (Iterable[Tuple[str,str]]): Tuples of download link and email subject.
+    session (requests.Session): The authenticated HTTP session.
+    course_name (str): The name of the course for which the files are being downloaded.
+    max_workers (int): The maximum number of concurrent downloads.
+    timeout (float): The maximum number of seconds a single download may take.
+    on_download (Callable): Called with each entry once its file is in place.
+
+    Returns:
+    List[Tuple[str,str]]: The entries whose download failed.
+    '''
+    futures = {}
+    checksums = {}
+    failed = []
+
+    def finish(done):
+        for future in done:
+            entry, filename = futures.pop(future)
+            try:
+                checksums[filename] = future.result()
+                print(f'Downloaded {entry[1]}')
+            except (requests.RequestException, IOError) as e:
+                print(f'FAILED to download {entry[1]}: {e}')
+                failed.append(entry)
+                continue
+            if on_download is not None:
+                on_download(entry)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for entry in files:
+            filename = report_filename(entry[1], course_name)
+            path = os.path.join(course_name, 'Downloaded Reports', filename)
+            futures[executor.submit(download_file, session, entry[0], path, timeout)] = (entry, filename)
+
+            # Hand over the downloads finished so far without waiting for the remaining links
+            finish([future for future in futures if future.done()])
+
+        finish(as_completed(list(futures)))
+
+    __record_checksums(course_name, checksums)
+    return failed
+
+
+def download_name(session, link):
+    '''
+    This function finds the name a browser saves an export under, from the Content-Disposition the link
+    asks for in its query string or answers a HEAD request with, or else the last part of its path.
+
+    Args:
+    session (requests.Session): The authenticated HTTP session.
+    link (str): The download link.
+
+    Returns:
+    str: The filename, or None if the link does not give one.
+    '''
+    url = urlparse(link)
+    disposition = parse_qs(url.query).get('response-content-disposition', [None])[0]
+    if disposition is None:
+        try:
+            with session.head(link, allow_redirects=True, timeout=(10, 30)) as response:
+                disposition = response.headers.get('Content-Disposition')
+        except requests.RequestException:
+            disposition = None
+
+    if disposition:
+        message = Message()
+        message['Content-Disposition'] = disposition
+        filename = message.get_filename()
+        if filename:
+            return os.path.basename(filename)
+
+    filename = unquote(os.path.basename(url.path))
+    return filename if os.path.splitext(filename)[1] else None
+
+
+def __browser_downloads(driver, files, course_name, session, max_in_flight=MAX_BROWSER_DOWNLOADS, timeout=DOWNLOAD_TIMEOUT, on_download=None):
+    '''
+    This function downloads the files through the browser, keeping up to max_in_flight downloads
+    running at once, and moves each one into place as it finishes. Each download is matched to its
+    entry by the filename its link is saved under, so downloads may finish in any order.
+
+    Args:
+    driver (WebDriver): The signed in WebDriver object.
+    files (Iterable[Tuple[str,str]]): Tuples of download link and email subject.
     course_name (str): The name of the course for which the files are being downloaded.
+    session (requests.Session): The authenticated HTTP session used to look up the download filenames.
+    max_in_flight (int): The maximum number of downloads running in the browser at once.
+    timeout (float): The number of seconds after which an unfinished download raises TimeoutError.
+    on_download (Callable): Called with each entry once its file is in place.
     '''
-    driver, wait, actions = setup(headless=False, download_dir=f"{os.path.join('.', 'Downloaded Reports')}")
-    signin(driver, username, password)
-    sleep(2)
+    def finish(finished, downloaded_filename):
+        __move_files(finished, course_name, downloaded_filename)
+        if on_download is not None:
+            on_download(finished)
+
+    with DownloadWatcher('Downloaded Reports', timeout=timeout) as watcher:
+        for entry in files:
+            if watcher.in_flight >= max_in_flight:
+                for finished, downloaded_filename in watcher.wait():
+                    finish(finished, downloaded_filename)
+
+            filename = download_name(session, entry[0])
+            driver.get(entry[0])
+            watcher.expect(entry, filename)
+            print(f'Downloading {entry[1]}')
 
+        while watcher.in_flight:
+            for finished, downloaded_filename in watcher.wait():
+                finish(finished, downloaded_filename)
 
-    for entry in files:
 
-        link = entry[0]
-        old_filenames = set(os.listdir('Downloaded Reports'))
-        driver.get(link)
-        print(f'Downloaded {entry[1]}')
-        downloaded = False
-        sleep(1)
+def get_downloads(files, username, password, course_name, use_browser=False, session=None, on_download=None):
+    '''
+    This function logs in to the Tech Stewardship website using the provided credentials, downloads the files
+    specified in the input list of tuples, and saves them in the appropriate directory.
+
+    Downloads go through an HTTP session carrying the browser's sign in cookies, several at a time.
+    Any download that fails over HTTP is retried through the browser.
 
-    
-        while downloaded is False:
-            current_filenames = set(os.listdir('Downloaded Reports'))
-            num_files = len(current_filenames - old_filenames) == 1
-            not_downloaded = any(filename.endswith('.crdownload') for filename in current_filenames - old_filenames)
-            # Check if a new file has been added to the directory
-            if len(current_filenames - old_filenames) == 1 and not not_downloaded:
-                downloaded = True
-                downloaded_filename = list(current_filenames - old_filenames)[0]
+    Args:
+    files (Iterable[Tuple[str,str]]): Tuples, where each tuple contains a download link and an email subject.
+    username (str): The email address associated with the user's account.
+    password (str): The password associated with the user's account.
+    course_name (str): The name of the course for which the files are being downloaded.
+    use_browser (bool): Download every file through the browser instead of over HTTP.
+    session (BrowserSession): An optional browser session shared with the other phases of the run.
+    on_download (Callable): Called with each entry once its file is in place, e.g. ExportEmails.downloaded.
+    '''
+    owns_session = session is None
+    if owns_session:
+        session = BrowserSession(download_dir=os.path.join('.', 'Downloaded Reports'))
+    driver = session_signin(session, username, password)
 
-        __move_files(entry, course_name, downloaded_filename)
+    try:
+        http = session_from_driver(driver)
+        if not use_browser:
+            files = http_downloads(files, http, course_name, on_download=on_download)
+            if files:
+                print(f'{len(files)} downloads failed, retrying through the browser...')
 
+        __browser_downloads(driver, files, course_name, http, on_download=on_download)
+    finally:
+        if owns_session:
+            session.close()
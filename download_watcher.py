@@ -0,0 +1,160 @@
+import os
+import re
+from time import sleep, monotonic
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+DOWNLOAD_TIMEOUT = 300
+POLL_INTERVAL = 0.5
+TEMP_SUFFIXES = ('.crdownload', '.part', '.tmp')
+
+
+def _is_complete(filename):
+    return not filename.startswith('.') and not filename.startswith('Unconfirmed') and not filename.endswith(TEMP_SUFFIXES)
+
+
+def _same_download(name, filename):
+    '''
+    Checks whether a file in the download directory is the download expected under filename,
+    which the browser saves as 'name (1).ext' when the name is already taken.
+    '''
+    if filename is None:
+        return False
+    root, ext = os.path.splitext(filename)
+    return name == filename or re.fullmatch(re.escape(root) + r' \(\d+\)' + re.escape(ext), name) is not None
+
+
+class DownloadWatcher():
+    '''
+    Watches a browser download directory and reports every finished download together with the
+    entry (link, subject) that started it. Each download name is claimed when it first appears in
+    the directory, in progress or complete, by the entry expecting that filename, or a browser
+    renamed duplicate of it such as 'name (1).csv'. A name no entry expects goes to the oldest
+    entry started without a filename, so downloads finishing out of order are still told apart
+    as long as their filenames are known. Directory changes are
+    picked up through inotify when inotify_simple is installed, otherwise the directory is polled
+    every poll_interval seconds.
+    '''
+    def __init__(self, directory, timeout=DOWNLOAD_TIMEOUT, poll_interval=POLL_INTERVAL):
+        self.directory = directory
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.pending = []
+        self.claimed = set()
+        os.makedirs(directory, exist_ok=True)
+        self.known = {name: self.__identity(name) for name in os.listdir(directory)}
+
+        self.inotify = None
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(directory, flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE)
+            except OSError:
+                self.inotify = None
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    def expect(self, entry, filename=None):
+        '''
+        Registers a download that has just been started.
+
+        Args:
+        entry (Tuple[str, str]): The download link and email subject.
+        filename (str): The name the browser saves the download under, if known.
+        '''
+        self.pending.append((entry, monotonic(), None, filename))
+
+    def wait(self):
+        '''
+        Blocks until at least one in-flight download has finished.
+
+        Returns:
+        List[Tuple[Tuple[str, str], str]]: The finished entries and the filename each was saved under.
+        '''
+        while True:
+            finished = self.__collect()
+            if finished:
+                return finished
+
+            entry, started, claimed, _ = self.pending[0]
+            if monotonic() - started > self.timeout:
+                self.pending.pop(0)
+                self.claimed.discard(claimed)
+                raise TimeoutError(f'Download of {entry[1]} did not complete within {self.timeout}s')
+
+            if self.inotify is not None:
+                self.inotify.read(timeout=int(self.poll_interval * 1000))
+            else:
+                sleep(self.poll_interval)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __collect(self):
+        # Files are known by name and identity, so a later download replacing a moved file is seen
+        listing = {name: self.__identity(name) for name in os.listdir(self.directory)}
+        self.known = {name: identity for name, identity in self.known.items() if listing.get(name) == identity}
+        current = [name for name in listing if name not in self.known]
+        names = sorted(current, key=lambda f: self.__mtime(f))
+
+        # Claim each download name as soon as it first appears, whether still in progress or already
+        # complete, for the entry expecting it or else the oldest entry without a filename
+        for name in names:
+            stem = self.__stem(name)
+            if stem is None or stem in self.claimed:
+                continue
+            unclaimed = [i for i, (_, _, claimed, _) in enumerate(self.pending) if claimed is None]
+            expected = [i for i in unclaimed if _same_download(stem, self.pending[i][3])]
+            unnamed = [i for i in unclaimed if self.pending[i][3] is None]
+            match = expected or unnamed
+            if match:
+                entry, started, _, filename = self.pending[match[0]]
+                self.pending[match[0]] = (entry, started, stem, filename)
+                self.claimed.add(stem)
+
+        finished = []
+        for name in names:
+            if not _is_complete(name):
+                continue
+            match = [i for i, (_, _, claimed, _) in enumerate(self.pending) if claimed == name]
+            if match:
+                entry, _, _, _ = self.pending.pop(match[0])
+                self.known[name] = listing[name]
+                self.claimed.discard(name)
+                finished.append((entry, name))
+
+        return finished
+
+    def __stem(self, name):
+        if name.startswith('.') or name.startswith('Unconfirmed'):
+            return None
+        for suffix in TEMP_SUFFIXES:
+            if name.endswith(suffix):
+                return name[:-len(suffix)]
+        return name
+
+    def __identity(self, name):
+        try:
+            stat = os.stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def __mtime(self, name):
+        try:
+            return os.path.getmtime(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return 0
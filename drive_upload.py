@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+UPLOAD_WORKERS = 8
+FOLDER_QUERY_CHUNK = 40
+MIME_TYPES = {
+    '.csv': 'text/csv',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.parquet': 'application/vnd.apache.parquet',
+}
+
+
+def folder_id_from_url(folder_url):
+    '''
+    Extracts the folder ID from a Google Drive folder URL.
+
+    Args:
+    folder_url (str): A URL such as https://drive.google.com/drive/folders/<id>?usp=sharing.
+
+    Returns:
+    str: The folder ID.
+    '''
+    return folder_url.split('/folders/')[-1].split('?')[0].strip('/')
+
+
+def list_folders(drive, folder_ids, chunk_size=FOLDER_QUERY_CHUNK):
+    '''
+    Lists the files of many Drive folders with one query per chunk of folders.
+
+    Args:
+    drive (GoogleDrive): The authenticated GoogleDrive client.
+    folder_ids (Iterable[str]): The folder IDs to list.
+    chunk_size (int): The number of folders combined into one query.
+
+    Returns:
+    Dict[Tuple[str, str], GoogleDriveFile]: The first file found for each (folder ID, title) pair.
+    '''
+    folder_ids = list(dict.fromkeys(folder_ids))
+    files = {}
+
+    for start in range(0, len(folder_ids), chunk_size):
+        chunk = folder_ids[start:start + chunk_size]
+        parents = ' or '.join(f"'{folder_id}' in parents" for folder_id in chunk)
+        query = {'q': f'({parents}) and trashed=false', 'maxResults': 1000,
+                 'fields': 'items(id,title,md5Checksum,parents(id)),nextPageToken'}
+
+        for file in drive.ListFile(query).GetList():
+            for parent in file.get('parents', []):
+                if parent['id'] in chunk:
+                    files.setdefault((parent['id'], file['title']), file)
+
+    return files
+
+
+class ReportUploader():
+    '''
+    Uploads in-memory reports to Drive through a bounded thread pool. Existing files are
+    updated in place, and uploads whose content matches the Drive md5Checksum are skipped.
+    Reports can be streamed in, at most a few per worker being held while waiting for upload.
+    Binary reports are uploaded from their local copy in directory, such as the one written by
+    report_stream.save_reports, or from a temporary file when there is none.
+    '''
+    def __init__(self, drive, max_workers=UPLOAD_WORKERS, directory=None):
+        self.drive = drive
+        self.max_workers = max_workers
+        self.directory = directory
+        self._local = threading.local()
+
+    def __http(self):
+        # httplib2 connections are not thread safe, so every worker thread gets its own
+        if not hasattr(self._local, 'http'):
+            self._local.http = self.drive.auth.Get_Http_Object()
+        return self._local.http
+
+    def upload(self, folder_id, file_name, data, existing=None):
+        '''
+        Uploads a single report.
+
+        Args:
+        folder_id (str): The ID of the target folder.
+        file_name (str): The title of the file in Drive.
+        data (bytes): The content of the file.
+        existing (GoogleDriveFile): The file currently holding this report, if any.
+
+        Returns:
+        str: 'created', 'updated' or 'unchanged'.
+        '''
+        if existing is not None and existing.get('md5Checksum') == hashlib.md5(data).hexdigest():
+            return 'unchanged'
+
+        mime_type = MIME_TYPES.get(os.path.splitext(file_name)[1], 'text/csv')
+        if existing is not None:
+            gfile = self.drive.CreateFile({'id': existing['id'], 'mimeType': mime_type})
+        else:
+            gfile = self.drive.CreateFile({'title': file_name, 'parents': [{'id': folder_id}], 'mimeType': mime_type})
+
+        if mime_type.startswith('text/'):
+            gfile.SetContentString(data.decode('utf-8'))
+            gfile.Upload(param={'http': self.__http()})
+        elif self.directory is not None:
+            gfile.SetContentFile(os.path.join(self.directory, file_name))
+            gfile.Upload(param={'http': self.__http()})
+        else:
+            # PyDrive2 only sets binary content from a file path
+            with tempfile.TemporaryDirectory() as directory:
+                local_path = os.path.join(directory, file_name)
+                with open(local_path, 'wb') as f:
+                    f.write(data)
+                gfile.SetContentFile(local_path)
+                gfile.Upload(param={'http': self.__http()})
+        return 'updated' if existing is not None else 'created'
+
+    def upload_all(self, reports, folder_ids=None):
+        '''
+        Uploads every report, listing all target folders once beforehand.
+
+        Args:
+        reports (Iterable[Tuple[str, str, str, bytes]]): The group, folder ID, file name and content of each report.
+        folder_ids (Iterable[str]): The target folders, so reports can be uploaded as they are generated.
+        If not given, they are taken from the reports, which are then all held in memory.
+
+        Returns:
+        Dict[str, str]: The outcome of each group's upload, or the error that made it fail.
+        '''
+        if folder_ids is None:
+            reports = list(reports)
+            folder_ids = [folder_id for _, folder_id, _, _ in reports]
+        existing = list_folders(self.drive, folder_ids)
+        results = {}
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for group, folder_id, file_name, data in reports:
+                # Wait for uploads to finish before generating more reports than the workers can take
+                if len(pending) >= 2 * self.max_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self.__collect(done, pending, results)
+                future = executor.submit(self.upload, folder_id, file_name, data, existing.get((folder_id, file_name)))
+                pending[future] = group
+
+            self.__collect(wait(pending).done, pending, results)
+
+        return results
+
+    def __collect(self, done, pending, results):
+        for future in done:
+            group = pending.pop(future)
+            try:
+                results[group] = future.result()
+            except Exception as e:
+                results[group] = f'FAILED: {e}'
@@ -0,0 +1,65 @@
+import pandas as pd
+
+try:
+    import pyarrow
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    STRING_DTYPE = None
+
+
+CATEGORY_RATIO = 0.5
+
+
+def configure_pandas():
+    '''
+    Enables copy-on-write on pandas versions where it is still opt-in, and the default from pandas 3.
+    String inference is deliberately not switched on globally: it would change the dtype of every text
+    column read anywhere in the process, so pyarrow strings are only applied by compact_columns.
+    '''
+    major = int(pd.__version__.split('.')[0])
+    if major != 2:
+        return
+
+    # Stage outputs are reassigned rather than mutated, so intermediate copies become lazy views
+    pd.set_option('mode.copy_on_write', True)
+
+
+def compact_columns(df, columns=None, max_ratio=CATEGORY_RATIO):
+    '''
+    Shrinks text columns: columns whose values repeat, such as choice answers, become categoricals,
+    and other text columns become pyarrow-backed strings where pyarrow is available. Columns that
+    are not purely text are left as they are.
+
+    Args:
+    df (pd.DataFrame): The DataFrame to compact.
+    columns (List[str]): The columns to consider, or None for all of them.
+    max_ratio (float): The highest share of distinct values for which a column becomes categorical.
+
+    Returns:
+    pd.DataFrame: The compacted DataFrame.
+    '''
+    converted = {}
+    for col in (df.columns if columns is None else columns):
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        if series.dtype != object and not pd.api.types.is_string_dtype(series.dtype):
+            continue
+
+        values = series.dropna()
+        if pd.api.types.infer_dtype(values, skipna=True) != 'string':
+            continue
+
+        if values.nunique() <= max_ratio * len(values):
+            converted[col] = series.astype('category')
+        elif STRING_DTYPE is not None and series.dtype == object:
+            converted[col] = series.astype(STRING_DTYPE)
+
+    return df.assign(**converted) if converted else df
+
+
+def frame_bytes(df):
+    '''
+    Returns the memory held by a DataFrame, including the text it references.
+    '''
+    return int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,175 @@
+import email
+import json
+import os
+import re
+
+
+STATE_PATH = '.imap_state.json'
+FETCH_CHUNK_SIZE = 50
+
+# Subject, headers of the first body part and the first body part itself, without setting \Seen
+PART_QUERY = '(UID BODY.PEEK[HEADER.FIELDS (SUBJECT)] BODY.PEEK[1.MIME] BODY.PEEK[1])'
+FULL_QUERY = '(UID BODY.PEEK[])'
+
+UID_REGEX = re.compile(rb'UID (\d+)')
+SECTION_REGEX = re.compile(rb'BODY\[([^\]]*)\](?:<\d+>)? \{\d+\}$')
+
+
+def load_watermark(key, state_path=STATE_PATH):
+    '''
+    Reads the last processed UID of a mailbox.
+
+    Args:
+    key (str): The mailbox key.
+    state_path (str): The path of the JSON state file.
+
+    Returns:
+    Tuple[int, int]: The UIDVALIDITY and last processed UID, or (None, None) if unknown.
+    '''
+    try:
+        with open(state_path) as f:
+            entry = json.load(f).get(key)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None, None
+
+    if entry is None:
+        return None, None
+    return entry['uidvalidity'], entry['last_uid']
+
+
+def save_watermark(key, uidvalidity, last_uid, state_path=STATE_PATH):
+    '''
+    Persists the last processed UID of a mailbox.
+
+    Args:
+    key (str): The mailbox key.
+    uidvalidity (int): The UIDVALIDITY of the mailbox.
+    last_uid (int): The last processed UID.
+    state_path (str): The path of the JSON state file.
+    '''
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+
+    state[key] = {'uidvalidity': uidvalidity, 'last_uid': last_uid}
+    with open(f'{state_path}.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(f'{state_path}.tmp', state_path)
+
+
+def uid_validity(mail):
+    '''
+    Returns the UIDVALIDITY of the currently selected mailbox.
+    '''
+    typ, data = mail.response('UIDVALIDITY')
+    if not data or data[0] is None:
+        return None
+    return int(data[0])
+
+
+def search_uids(mail, last_uid, *criteria):
+    '''
+    Searches the selected mailbox for unseen messages above the watermark matching the given criteria.
+    Consumed messages are marked as seen, so the UNSEEN filter also holds without a watermark.
+
+    Args:
+    mail (imaplib.IMAP4): The logged in IMAP connection with a mailbox selected.
+    last_uid (int): The last processed UID, or None.
+    criteria (str): IMAP search criteria.
+
+    Returns:
+    List[int]: The matching UIDs in ascending order.
+    '''
+    if last_uid is None:
+        typ, data = mail.uid('search', None, *criteria, 'UNSEEN')
+    else:
+        typ, data = mail.uid('search', None, f'UID {last_uid + 1}:*', *criteria, 'UNSEEN')
+
+    # 'UID n:*' always matches the newest message, even when it is below n
+    uids = sorted(int(uid) for uid in data[0].split())
+    return [uid for uid in uids if last_uid is None or uid > last_uid]
+
+
+def parse_fetch_response(data):
+    '''
+    Groups an imaplib FETCH response into per-message sections.
+
+    Args:
+    data (list): The data returned by imaplib for a FETCH command.
+
+    Returns:
+    Dict[int, Dict[str, bytes]]: The fetched sections of each message keyed by UID.
+    '''
+    messages = {}
+    current = None
+    pending = {}
+
+    for item in data:
+        prefix = item[0] if isinstance(item, tuple) else item
+        if not isinstance(prefix, bytes):
+            continue
+
+        # A new message starts with its sequence number
+        if re.match(rb'^\d+ \(', prefix):
+            current, pending = None, {}
+        uid = UID_REGEX.search(prefix)
+        if uid:
+            current = int(uid.group(1))
+            messages.setdefault(current, {}).update(pending)
+            pending = {}
+
+        if isinstance(item, tuple):
+            section = SECTION_REGEX.search(prefix)
+            if section:
+                target = messages[current] if current is not None else pending
+                target[section.group(1).decode()] = item[1]
+
+    return messages
+
+
+def fetch_messages(mail, uids, chunk_size=FETCH_CHUNK_SIZE):
+    '''
+    Fetches the subject and plain text body of messages with one UID FETCH per chunk.
+    Messages whose first body part is not plain text are fetched in full instead.
+
+    Args:
+    mail (imaplib.IMAP4): The logged in IMAP connection with a mailbox selected.
+    uids (List[int]): The UIDs to fetch.
+    chunk_size (int): The number of messages per FETCH command.
+
+    Yields:
+    Tuple[int, str, List[email.message.Message]]: The UID, subject and text/plain parts of each message.
+    '''
+    for start in range(0, len(uids), chunk_size):
+        chunk = uids[start:start + chunk_size]
+        typ, data = mail.uid('fetch', ','.join(str(uid) for uid in chunk), PART_QUERY)
+        sections = parse_fetch_response(data)
+
+        full_uids = []
+        for uid in chunk:
+            message = sections.get(uid, {})
+            if '1.MIME' not in message or '1' not in message:
+                full_uids.append(uid)
+                continue
+            part = email.message_from_string(message['1.MIME'].decode('utf-8'))
+            if part.get_content_type() != 'text/plain':
+                full_uids.append(uid)
+
+        if full_uids:
+            typ, data = mail.uid('fetch', ','.join(str(uid) for uid in full_uids), FULL_QUERY)
+            full = parse_fetch_response(data)
+
+        for uid in chunk:
+            if uid in full_uids:
+                email_message = email.message_from_string(full.get(uid, {}).get('', b'').decode('utf-8'))
+                subject = email_message.get('subject')
+                parts = [part for part in email_message.walk() if part.get_content_type() == 'text/plain']
+            else:
+                message = sections[uid]
+                header = email.message_from_string(message.get('HEADER.FIELDS (SUBJECT)', b'').decode('utf-8'))
+                subject = header.get('subject')
+                parts = [email.message_from_string(message['1.MIME'].decode('utf-8') + message['1'].decode('utf-8'))]
+
+            yield uid, subject, parts
@@ -4,63 +4,176 @@ import os
 from time import sleep
 from random import randint
 import sys
+import lxml.html
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
 
-def get_exports(group_list, course, username, password):
+
+TABLE_ROWS_XPATH = '//*[@id="main-content"]/div[4]/div/div/div/table/tbody/tr'
+EXPORT_WORKERS = 8
+EXPORT_RETRIES = 3
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def get_exports(group_list, course, username, password, session=None):
+    '''
+    Handler function. Creates selenium instance, signs in then triggers the course
+    progress export and every group export, which are sent out via email. An optional
+    BrowserSession is reused, and left open, so the download phase can share its sign in.
+    Returns the number of export emails to expect.
+    '''
+    owns_session = session is None
+    if owns_session:
+        session = BrowserSession(download_dir=os.path.join('.', 'Downloaded Reports'), browser='Firefox')
+    driver = session_signin(session, username, password)
+    wait = session.wait
+
+    try:
+        expected = 1 if __progress(driver, wait, course) else 0
+        print('Progress Report retrieved...')
+        link_list = __groups(group_list, driver, wait)
+        print('Group links retrieved. Generating export emails...')
+        expected += __open_group_links(driver, link_list)
+        return expected
+    finally:
+        if owns_session:
+            session.close()
+
+
+def parse_report_table(html, link_xpath, base_url=REPORTS_URL):
     '''
-    Handler function. Creates selenium instance, signs in then proceeds to open
-    every download link scraped via email, beginning file download. Calls
-    __move_files to sort files for later processing
+    Parses every row of a reports table in a single pass over the page source.
+
+    Args:
+    html (str): The page source, e.g. driver.page_source or a saved HTML fixture.
+    link_xpath (str): The XPath of the wanted link's href, relative to the row.
+    base_url (str): The page URL, used to resolve relative links.
+
+    Returns:
+    Dict[str, str]: The absolute link of each row keyed by the row's name (first cell).
     '''
-    url ='https://programs.techstewardship.com/manage/reports'
-    driver, wait, actions = setup(headless=False, download_dir=f"{os.path.join('.', 'Downloaded Reports')}", browser='Firefox')
-    signin(driver, username, password)
-    sleep(2)
-    __progress(driver, wait, course)
-    print('Progress Report retrieved...')
-    link_list = __groups(group_list, driver, wait)
-    print('Group links retrieved. Generating export emails...')
-    __open_group_links(driver, link_list)
+    tree = lxml.html.fromstring(html)
+    rows = {}
+    for row in tree.xpath(TABLE_ROWS_XPATH):
+        name = row.xpath('string(td[1])').strip().split('\n')[0].strip()
+        href = row.xpath(link_xpath)
+        if name and href:
+            rows[name] = urljoin(base_url, href[0])
+
+    return rows
+
+
+def next_page_url(html, base_url):
+    '''
+    Finds the link to the next page of a paginated reports table.
+
+    Args:
+    html (str): The page source.
+    base_url (str): The page URL, used to resolve relative links.
+
+    Returns:
+    str: The absolute URL of the next page, or None on the last page.
+    '''
+    tree = lxml.html.fromstring(html)
+    href = tree.xpath('//a[@rel="next"]/@href | //*[contains(@class, "pagination")]//a[normalize-space()="Next" or normalize-space()="›"]/@href')
+    return urljoin(base_url, href[0]) if href else None
+
+
+def __scrape_table(driver, url, link_xpath):
+    '''
+    Collects the rows of every page of a reports table, reading each page's source once.
+    '''
+    rows = {}
+    visited = set()
+    while url and url not in visited:
+        visited.add(url)
+        driver.get(url)
+        html = driver.page_source
+        rows.update(parse_report_table(html, link_xpath, url))
+        url = next_page_url(html, url)
+
+    return rows
 
 
 def __progress(driver, wait, course):
-    url ='https://programs.techstewardship.com/manage/reports'
-    driver.get(url)
-    courses = driver.find_elements(By.XPATH, '//*[@id="main-content"]/div[4]/div/div/div/table/tbody/tr')
+    url = REPORTS_URL
+    courses = __scrape_table(driver, url, 'td[2]/div/div/a/@href')
 
-    for index, _ in enumerate(courses):
-        ts_course = driver.find_element(By.XPATH, f'//*[@id="main-content"]/div[4]/div/div/div/table/tbody/tr[{index+1}]/td[1]')
-        if course.name == ts_course.text:
-            driver.find_element(By.XPATH, f'/html/body/main/div[4]/div/div/div/table/tbody/tr[{index+1}]/td[2]/div/div/a').click()
-            wait.until(EC.presence_of_element_located((By.XPATH, f'/html/body/main/div[5]/div[1]/div/a[3]'))).click()
+    if course.name not in courses:
+        return False
+
+    driver.get(courses[course.name])
+    wait.until(EC.presence_of_element_located((By.XPATH, f'/html/body/main/div[5]/div[1]/div/a[3]'))).click()
+    return True
 
 
 def __groups(group_list, driver, wait):
     url ='https://programs.techstewardship.com/manage/reports/groups'
-    driver.get(url)
-    groups = driver.find_elements(By.XPATH, '//*[@id="main-content"]/div[4]/div/div/div/table/tbody/tr')
+    groups = __scrape_table(driver, url, 'td[2]/div/div/div/a/@href')
     print(f'{len(groups)} groups found!')
-    link_list = []
-    for index, group in enumerate(groups):
 
-        # Extracting group name from element
-        group_name = group.text.split('\n')[0]
+    wanted = set(group_list)
 
-        if group_name in group_list:
+    #LINK NOW NOT INCLUDING CSV EXTENSIONS
+    link_list = [f'{link}.csv' for group_name, link in groups.items() if group_name in wanted]
 
-            element = driver.find_element(By.XPATH, f'/html/body/main/div[4]/div/div/div/table/tbody/tr[{index+1}]/td[2]/div/div/button')
-            driver.execute_script("arguments[0].scrollIntoView();", element)
-            link = driver.find_element(By.XPATH, f'//*[@id="main-content"]/div[4]/div/div/div/table/tbody/tr[{index+1}]/td[2]/div/div/div/a').get_attribute('href')
+    return link_list
 
-            #LINK NOW NOT INCLUDING CSV EXTENSIONS
-            link_list.append(f'{link}.csv')
 
-    return link_list
+def __trigger_export(session, link, retries=EXPORT_RETRIES):
+    '''
+    Requests a single export link, retrying on connection errors, rate limiting and server errors.
+
+    Returns:
+    bool: True if the export was accepted.
+
+    Raises:
+    RuntimeError: If the request was redirected to the sign in page, as the session has expired.
+    '''
+    for attempt in range(retries):
+        try:
+            with session.get(link, timeout=30, stream=True) as response:
+                status = response.status_code
+                url = response.url
+            if url.startswith(SIGNIN_URL):
+                raise RuntimeError(f'Redirected to the sign in page requesting {link}, the session has expired')
+            if status < 400:
+                return True
+            if status not in RETRY_STATUS_CODES:
+                return False
+        except requests.RequestException:
+            pass
+        sleep(2 ** attempt)
+
+    return False
 
 
 def __open_group_links(driver, link_list):
+    '''
+    Triggers every group export concurrently through an HTTP session carrying the browser's cookies.
+
+    Returns:
+    int: The number of exports that were accepted.
+
+    Raises:
+    RuntimeError: If the browser's sign in has expired, rather than waiting for emails that will not come.
+    '''
     print(f'{len(link_list)} links retrieved!')
-    for i, link in enumerate(link_list):
-        sys.stdout.write(f"Generating exports: Link {i+1}/{len(link_list)}   \r")
-        sys.stdout.flush()
-        driver.get(link)
-        sleep(0.05)
+    session = session_from_driver(driver, pool_size=EXPORT_WORKERS)
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=EXPORT_WORKERS) as executor:
+        futures = {executor.submit(__trigger_export, session, link): link for link in link_list}
+        for i, future in enumerate(as_completed(futures)):
+            sys.stdout.write(f"Generating exports: Link {i+1}/{len(link_list)}   \r")
+            sys.stdout.flush()
+            if not future.result():
+                failed.append(futures[future])
+
+    if failed:
+        print(f'\n{len(failed)} exports could not be triggered:')
+        for link in failed:
+            print(link)
+
+    return len(link_list) - len(failed)
@@ -0,0 +1,232 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from time import perf_counter, strftime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+REPORT_DIR = 'Run Reports'
+IMAP_METHODS = {'select', 'search', 'uid', 'fetch', 'store', 'status', 'response'}
+SELENIUM_METHODS = {'get', 'refresh', 'find_element', 'find_elements', 'execute_script', 'get_cookies', 'add_cookie'}
+
+
+def peak_rss():
+    '''
+    Returns the peak resident set size of the process in bytes, or None where it is unavailable.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss():
+    '''
+    Returns the current resident set size of the process in bytes, or None where /proc is unavailable.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _payload_size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8', errors='ignore'))
+    if isinstance(value, (list, tuple)):
+        return sum(_payload_size(item) for item in value)
+    return 0
+
+
+class RunReport():
+    '''
+    Collects the wall time, rows and memory of every pipeline stage and the call counts,
+    time and bytes of every external client over a run. Clients are instrumented either through
+    a proxy around selected methods or through the hooks of their HTTP layer.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = perf_counter()
+        self.started_at = strftime('%Y-%m-%d %H:%M:%S')
+        self.stages = []
+        self.clients = {}
+        self.profiler = None
+
+    @contextmanager
+    def stage(self, name, course=None, rows_in=None):
+        '''
+        Times a stage and records the resident memory of the process when it starts and ends, along with
+        the process-wide peak so far. Stages of concurrently built courses share the process, so their
+        memory figures overlap. The yielded record can be updated with 'rows_out' and 'source' before it closes.
+
+        Args:
+        name (str): The name of the stage.
+        course (str): The course the stage runs for.
+        rows_in (int): The number of rows the stage received.
+
+        Yields:
+        Dict[str, Any]: The record of the stage.
+        '''
+        record = {'stage': name, 'course': course, 'source': 'run', 'rows_in': rows_in, 'rows_out': None,
+                  'rss_start': current_rss()}
+        start = perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(perf_counter() - start, 4)
+            record['rss_end'] = current_rss()
+            record['peak_rss'] = peak_rss()
+            with self._lock:
+                self.stages.append(record)
+
+    def record_call(self, client, seconds, sent=0, received=0):
+        with self._lock:
+            stats = self.clients.setdefault(client, {'calls': 0, 'seconds': 0.0, 'bytes_sent': 0, 'bytes_received': 0})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['bytes_sent'] += sent
+            stats['bytes_received'] += received
+
+    def wrap(self, obj, client, methods):
+        '''
+        Returns a proxy of obj that records every call of the given methods under client.
+        '''
+        return InstrumentedClient(obj, client, methods, self)
+
+    def hook_session(self, session, client):
+        '''
+        Records every response of a requests.Session under client.
+        '''
+        def hook(response, *args, **kwargs):
+            # Streamed bodies are left unread, so only their announced length is counted
+            if kwargs.get('stream'):
+                received = int(response.headers.get('Content-Length') or 0)
+            else:
+                received = len(response.content)
+            body = response.request.body
+            self.record_call(client, response.elapsed.total_seconds(), _payload_size(body), received)
+
+        session.hooks['response'].append(hook)
+        return session
+
+    def hook_http(self, http, client):
+        '''
+        Records every request of an httplib2.Http object under client.
+        '''
+        request = http.request
+
+        def instrumented(*args, **kwargs):
+            start = perf_counter()
+            response, content = request(*args, **kwargs)
+            body = kwargs.get('body', args[2] if len(args) > 2 else None)
+            self.record_call(client, perf_counter() - start, _payload_size(body), _payload_size(content))
+            return response, content
+
+        http.request = instrumented
+        return http
+
+    def hook_drive(self, drive, client='drive'):
+        '''
+        Records the requests of a GoogleDrive client, including those of the per-thread HTTP objects it hands out.
+        '''
+        auth = drive.auth
+        if getattr(auth, 'http', None) is not None:
+            self.hook_http(auth.http, client)
+
+        get_http = auth.Get_Http_Object
+        auth.Get_Http_Object = lambda *args, **kwargs: self.hook_http(get_http(*args, **kwargs), client)
+        return drive
+
+    def start_profile(self):
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'seconds': round(perf_counter() - self.started, 4),
+                'peak_rss': peak_rss(),
+                'stages': list(self.stages),
+                'clients': {client: dict(stats, seconds=round(stats['seconds'], 4)) for client, stats in self.clients.items()},
+            }
+
+    def write(self, directory=REPORT_DIR):
+        '''
+        Writes the run report as JSON, and the cProfile statistics when profiling, to directory.
+
+        Returns:
+        str: The path of the JSON report.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        name = f"run_{self.started_at.replace(' ', '_').replace(':', '')}"
+        path = os.path.join(directory, f'{name}.json')
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+
+        return path
+
+    def print_summary(self):
+        report = self.as_dict()
+        print('\n=====================')
+        print('Run summary')
+        print('=====================\n')
+        print(f"{'Stage':<24}{'Course':<28}{'Source':<12}{'Seconds':>10}{'Rows in':>10}{'Rows out':>10}{'RSS MB':>10}{'Change MB':>10}")
+        for record in report['stages']:
+            rows_in = '' if record['rows_in'] is None else record['rows_in']
+            rows_out = '' if record['rows_out'] is None else record['rows_out']
+            rss, change = '', ''
+            if record['rss_end'] is not None:
+                rss = f"{record['rss_end'] / 2 ** 20:.0f}"
+                change = f"{(record['rss_end'] - record['rss_start']) / 2 ** 20:+.0f}"
+            print(f"{record['stage']:<24}{str(record['course'] or ''):<28}{record['source']:<12}"
+                  f"{record['seconds']:>10.2f}{rows_in:>10}{rows_out:>10}{rss:>10}{change:>10}")
+
+        print(f"\n{'Client':<24}{'Calls':>10}{'Seconds':>10}{'MB sent':>10}{'MB received':>14}")
+        for client, stats in sorted(report['clients'].items()):
+            print(f"{client:<24}{stats['calls']:>10}{stats['seconds']:>10.2f}"
+                  f"{stats['bytes_sent'] / 2 ** 20:>10.2f}{stats['bytes_received'] / 2 ** 20:>14.2f}")
+        peak = '' if report['peak_rss'] is None else f", peak memory {report['peak_rss'] / 2 ** 20:.0f} MB"
+        print(f"\nTotal: {report['seconds']:.1f}s{peak}")
+
+
+class InstrumentedClient():
+    '''
+    Proxy recording the time and payload size of selected method calls of a client
+    '''
+    def __init__(self, obj, client, methods, report):
+        self.__dict__.update(_obj=obj, _client=client, _methods=methods, _report=report)
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if name not in self._methods or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            start = perf_counter()
+            result = attr(*args, **kwargs)
+            self._report.record_call(self._client, perf_counter() - start, _payload_size(args), _payload_size(result))
+            return result
+
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._obj, name, value)
+
+
+RUN_REPORT = RunReport()
@@ -0,0 +1,120 @@
+import os
+import re
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+# The pyarrow engine infers types before applying dtype, turning e.g. '007' into '7.0', so reports are parsed by the C engine
+CSV_ENGINE = 'c'
+
+
+LOADER_WORKERS = 8
+
+
+def read_report(path, usecols=None):
+    '''
+    Reads a downloaded report with every column pinned to text, so no type inference runs
+    and values are kept exactly as exported.
+
+    Args:
+    path (str): The path of the CSV file.
+    usecols (List[str]): The columns to read, or None for all of them.
+
+    Returns:
+    pd.DataFrame: The report, or None if a requested column is missing.
+
+    Raises:
+    ValueError: If the file cannot be parsed, naming the file.
+    '''
+    try:
+        return pd.read_csv(path, usecols=usecols, dtype=str, engine=CSV_ENGINE)
+    except (ValueError, KeyError) as e:
+        if usecols is not None and __missing_columns(path, usecols):
+            return None
+        raise ValueError(f'Could not read report "{path}": {e}') from e
+
+
+def __missing_columns(path, columns):
+    '''
+    Checks the header of a report for columns it lacks. Unreadable headers count as no missing columns.
+    '''
+    try:
+        header = pd.read_csv(path, nrows=0).columns
+    except ValueError:
+        return False
+    return any(col not in header for col in columns)
+
+
+class ReportInventory():
+    '''
+    Inventory of a course's Downloaded Reports folder, classified by the naming scheme of
+    download_reports.report_filename with a single directory scan
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.user_report = None
+        self.progress_reports = {}
+        self.group_reports = {}
+        self.other_reports = {}
+
+        for file in sorted(os.listdir(directory)):
+            if not file.endswith('.csv'):
+                continue
+            path = os.path.join(directory, file)
+            name = re.sub(r'\.csv$', '', file)
+
+            if file == 'User Report.csv':
+                self.user_report = path
+            elif file.startswith('Group'):
+                self.group_reports.setdefault(name.split('_')[-1], []).append(path)
+            elif file.startswith('Progress Report'):
+                self.progress_reports[name.split('_')[-1].lower()] = path
+            else:
+                self.other_reports[name] = path
+
+    def fingerprint(self):
+        '''
+        Identifies the current content of the folder by the name, size and modification time of each report.
+
+        Returns:
+        List[Tuple[str, int, float]]: One entry per report file.
+        '''
+        paths = [self.user_report] if self.user_report else []
+        paths += list(self.progress_reports.values()) + list(self.other_reports.values())
+        paths += [path for group_paths in self.group_reports.values() for path in group_paths]
+
+        return sorted((os.path.basename(path), os.path.getsize(path), os.path.getmtime(path)) for path in paths)
+
+    def progress_report(self, course_name):
+        '''
+        Reads the progress report of a course.
+
+        Args:
+        course_name (str): The name of the course.
+
+        Returns:
+        pd.DataFrame: The progress report.
+        '''
+        path = self.progress_reports.get(course_name.lower())
+        if path is None:
+            raise FileNotFoundError(f'No progress report for {course_name} in {self.directory}')
+        return read_report(path)
+
+    def group_emails(self, max_workers=LOADER_WORKERS):
+        '''
+        Reads the Email column of every group report concurrently.
+
+        Args:
+        max_workers (int): The maximum number of files read at once.
+
+        Returns:
+        List[Tuple[str, str, pd.DataFrame]]: The group name, file path and emails of each group
+        report, with None in place of the emails for files lacking an Email column.
+        '''
+        files = [(group, path) for group, paths in self.group_reports.items() for path in paths]
+        if not files:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+            frames = list(executor.map(lambda file: read_report(file[1], usecols=['Email']), files))
+
+        return [(group, path, df) for (group, path), df in zip(files, frames)]
@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import pandas as pd
+from functools import lru_cache
+
+
+# Read next to this module, so the pipeline can be started from any working directory
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_config.json')
+
+
+def load_config(path=CONFIG_PATH):
+    '''
+    Loads the reporting rules configuration.
+
+    Args:
+    path (str): The path of the JSON configuration file.
+
+    Returns:
+    Dict[str, Any]: The configuration, with the eligibility flags under 'eligibility' and the
+    answer concatenation rules under 'concat_answers'.
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+
+def matching_columns(columns, pattern):
+    '''
+    Selects the columns whose name matches a case-insensitive regular expression.
+
+    Args:
+    columns (Iterable[str]): The column names to search.
+    pattern (str): The regular expression, matched anywhere in the column name.
+
+    Returns:
+    List[str]: The matching column names, in order.
+    '''
+    regex = re.compile(pattern, re.IGNORECASE)
+    return [col for col in columns if regex.search(str(col))]
+
+
+def evaluate_rule(df, rule, conditions=None):
+    '''
+    Evaluates a rule over every row of a DataFrame at once.
+
+    A rule is either a condition {"column": pattern, "in": [values]}, met when any column matching
+    the pattern holds one of the values, or a composition {"all": [rules]}, {"any": [rules]} or
+    {"not": rule}. A condition whose pattern matches no column is unmet, so a term whose survey
+    text differs simply leaves its flags unset.
+
+    Args:
+    df (pd.DataFrame): The DataFrame to evaluate.
+    rule (Dict[str, Any]): The rule.
+    conditions (Dict[Tuple, pd.Series]): Masks of conditions already evaluated, shared between rules.
+
+    Returns:
+    pd.Series: A boolean mask of the rows meeting the rule.
+    '''
+    if conditions is None:
+        conditions = {}
+
+    if 'all' in rule:
+        mask = pd.Series(True, index=df.index)
+        for item in rule['all']:
+            mask &= evaluate_rule(df, item, conditions)
+        return mask
+
+    if 'any' in rule:
+        mask = pd.Series(False, index=df.index)
+        for item in rule['any']:
+            mask |= evaluate_rule(df, item, conditions)
+        return mask
+
+    if 'not' in rule:
+        return ~evaluate_rule(df, rule['not'], conditions)
+
+    key = (rule['column'], tuple(rule['in']))
+    if key not in conditions:
+        columns = matching_columns(df.columns, rule['column'])
+        if not columns:
+            print(f'No column matches "{rule["column"]}", condition treated as unmet.')
+            conditions[key] = pd.Series(False, index=df.index)
+        else:
+            conditions[key] = df[columns].isin(rule['in']).any(axis=1)
+
+    return conditions[key]
+
+
+def apply_flags(df, flags):
+    '''
+    Computes every configured flag column in a single pass over the DataFrame.
+
+    Args:
+    df (pd.DataFrame): The DataFrame to flag.
+    flags (Dict[str, Dict[str, Any]]): The flags keyed by output column, each with a 'rule' and
+    optionally the 'value' written for matching rows (default 'Yes') and the 'default' for the rest (default '').
+
+    Returns:
+    pd.DataFrame: The DataFrame with one column per flag.
+    '''
+    conditions = {}
+    columns = {}
+    for name, flag in flags.items():
+        mask = evaluate_rule(df, flag['rule'], conditions)
+        columns[name] = mask.map({True: flag.get('value', 'Yes'), False: flag.get('default', '')})
+
+    return df.assign(**columns)
+
+
+def concat_terms(module_name, rules):
+    '''
+    Looks up the column terms whose answers are concatenated for a module.
+
+    Args:
+    module_name (str): The name of the module.
+    rules (List[Dict[str, List[str]]]): The concatenation rules, each listing the 'modules' it applies to
+    and the 'terms' selecting its columns. The first rule naming part of the module name applies.
+
+    Returns:
+    Tuple[str]: The lowercase column terms, or None if no answers are concatenated for the module.
+    '''
+    module_name = module_name.lower()
+    for rule in rules:
+        if any(module.lower() in module_name for module in rule['modules']):
+            return tuple(term.lower() for term in rule['terms'])
+    return None
+
+
+@lru_cache(maxsize=None)
+def concat_columns(columns, terms):
+    '''
+    Resolves the columns containing any of the terms, cached per column signature and terms.
+
+    Args:
+    columns (Tuple[str]): The column names of the worksheet.
+    terms (Tuple[str]): The lowercase column terms.
+
+    Returns:
+    Tuple[int]: The positions of the selected columns.
+    '''
+    return tuple(i for i, col in enumerate(columns) if any(term in str(col).lower() for term in terms))
+
+
+def join_columns(df, positions, sep=' '):
+    '''
+    Joins the text of the given columns of every row, with missing values as empty text.
+
+    Args:
+    df (pd.DataFrame): The DataFrame holding the columns.
+    positions (Tuple[int]): The positions of the columns to join, in order.
+    sep (str): The separator between values.
+
+    Returns:
+    pd.Series: The joined text of each row.
+    '''
+    if not positions:
+        return pd.Series('', index=df.index, dtype=object)
+
+    text = df.iloc[:, list(positions)].fillna('').astype(str)
+    return text.iloc[:, 0].str.cat([text.iloc[:, i] for i in range(1, len(positions))], sep=sep)
@@ -0,0 +1,93 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+
+
+REPORT_FORMATS = ['csv', 'xlsx', 'parquet']
+
+
+def report_file_name(group, fmt='csv'):
+    return f'{group} Progress Report.{fmt}'
+
+
+def group_positions(values):
+    '''
+    Locates the rows of every group in a single pass over the group column, without copying any rows.
+
+    Args:
+    values (pd.Series): The group of each row.
+
+    Returns:
+    Dict[str, np.ndarray]: The row positions of each group, in row order.
+    '''
+    codes, groups = pd.factorize(values, sort=False)
+    order = np.argsort(codes, kind='stable')
+    # Rows without a group have code -1 and sort first, outside every group's bounds
+    bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+    return {group: order[bounds[i]:bounds[i + 1]] for i, group in enumerate(groups)}
+
+
+def serialize_report(df, fmt='csv'):
+    '''
+    Serializes a report in memory.
+
+    Args:
+    df (pd.DataFrame): The report.
+    fmt (str): One of REPORT_FORMATS. xlsx requires openpyxl and parquet requires pyarrow.
+
+    Returns:
+    bytes: The content of the report file.
+    '''
+    if fmt == 'csv':
+        return df.to_csv(index=None).encode('utf-8')
+
+    buffer = io.BytesIO()
+    if fmt == 'xlsx':
+        df.to_excel(buffer, index=False)
+    elif fmt == 'parquet':
+        df.to_parquet(buffer, index=False)
+    else:
+        raise ValueError(f'Unknown report format "{fmt}", expected one of {REPORT_FORMATS}')
+    return buffer.getvalue()
+
+
+def stream_group_reports(master_progress, groups, fmt='csv', column='Group'):
+    '''
+    Generates the report of every group from the master progress report. Rows are located in one pass
+    and each report is only materialized while it is being serialized, so memory stays bounded by the
+    largest group however many groups there are.
+
+    Args:
+    master_progress (pd.DataFrame): The master progress report, in the row order the reports should keep.
+    groups (Iterable[str]): The groups to report, as they appear in column. Unknown groups get an empty report.
+    fmt (str): One of REPORT_FORMATS.
+    column (str): The column holding the group of each row.
+
+    Yields:
+    Tuple[str, bytes]: The group and the content of its report, in the order of groups.
+    '''
+    positions = group_positions(master_progress[column])
+    empty = np.array([], dtype=np.intp)
+    for group in groups:
+        yield group, serialize_report(master_progress.take(positions.get(group, empty)), fmt)
+
+
+def save_reports(reports, directory):
+    '''
+    Writes every report passing through to directory and passes it on, so a stream can be both
+    kept locally and consumed by another sink such as drive_upload.ReportUploader.
+
+    Args:
+    reports (Iterable[Tuple]): Reports whose last two items are the file name and content.
+    directory (str): The folder the reports are written to.
+
+    Yields:
+    Tuple: Each report, once written.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    for report in reports:
+        *_, file_name, data = report
+        with open(os.path.join(directory, file_name), 'wb') as f:
+            f.write(data)
+        yield report
@@ -12,8 +12,43 @@ from selenium.common.exceptions import NoSuchElementException
 from selenium.common.exceptions import StaleElementReferenceException
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.firefox.service import Service as FirefoxService
+import json
+import os
+from instrumentation import RUN_REPORT, SELENIUM_METHODS
 
-# def setup(headless=False, download_dir=None):
+
+DRIVER_CACHE_PATH = '.driver_cache.json'
+COOKIE_PATH = '.session_cookies.json'
+
+
+def driver_path(browser='Chrome'):
+    '''
+    Resolves the driver binary for the browser. The last resolved path is reused while it still
+    exists on disk, so webdriver_manager only checks for driver updates when the binary is missing.
+
+    Args:
+    browser (str): 'Chrome' or 'Firefox'.
+
+    Returns:
+    str: The path of the driver binary.
+    '''
+    try:
+        with open(DRIVER_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache = {}
+
+    path = cache.get(browser)
+    if path and os.path.exists(path):
+        return path
+
+    path = ChromeDriverManager().install() if browser == 'Chrome' else GeckoDriverManager().install()
+    cache[browser] = path
+    with open(DRIVER_CACHE_PATH, 'w') as f:
+        json.dump(cache, f)
+
+    return path
 
 
 # CHROME VERSION
@@ -23,7 +58,8 @@ def setup(headless=True, download_dir=None, browser='Chrome'):
     if browser == 'Chrome':
         # Initialize driver setup
         options = Options()
-        options.headless = headless
+        if headless:
+            options.add_argument("--headless=new")
         options.add_argument("--log-level=3")
         options.add_argument('--ignore-certificate-errors-spki-list')
         options.add_argument('--ignore-certificate-errors')
@@ -32,17 +68,18 @@ def setup(headless=True, download_dir=None, browser='Chrome'):
         options.add_argument("enable-experimental-web-platform-features")
         options.add_experimental_option("excludeSwitches", ["enable-automation"])
         options.add_experimental_option('useAutomationExtension', False)
-        if dir:
-            options.add_experimental_option('prefs', {'download.default_directory': download_dir})
+        if download_dir:
+            options.add_experimental_option('prefs', {'download.default_directory': os.path.abspath(download_dir)})
 
-        # Create instance of webdriver using webdriver_manager library (chrome)
-        service = Service(ChromeDriverManager().install())
+        # Create instance of webdriver using the cached webdriver_manager binary (chrome)
+        service = Service(driver_path('Chrome'))
         driver = webdriver.Chrome(service=service, options=options)
 
         # change download directory
-        driver.command_executor._commands["send_command"] = ("POST", '/session/$sessionId/chromium/send_command')
-        params = {'cmd': 'Page.setDownloadBehavior', 'params': {'behavior': 'allow', 'downloadPath': download_dir}}
-        command_result = driver.execute("send_command", params)
+        if download_dir:
+            driver.command_executor._commands["send_command"] = ("POST", '/session/$sessionId/chromium/send_command')
+            params = {'cmd': 'Page.setDownloadBehavior', 'params': {'behavior': 'allow', 'downloadPath': os.path.abspath(download_dir)}}
+            command_result = driver.execute("send_command", params)
 
         driver.implicitly_wait(1)
         ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)
@@ -54,18 +91,18 @@ def setup(headless=True, download_dir=None, browser='Chrome'):
     else:
         # Initialize driver setup
         options = FirefoxOptions()
-        options.headless = headless
+        if headless:
+            options.add_argument("-headless")
         options.add_argument("--log-level=3")
         options.add_argument('--ignore-certificate-errors-spki-list')
         options.add_argument('--ignore-certificate-errors')
         options.add_argument('--ignore-ssl-errors')
         options.add_argument("--start-maximized")
-        options
-        if dir:
-            options.set_preference("browser.download.dir", download_dir)
+        if download_dir:
+            options.set_preference("browser.download.dir", os.path.abspath(download_dir))
 
-        # Create instance of webdriver using webdriver_manager library (firefox)
-        service = Service(GeckoDriverManager().install())
+        # Create instance of webdriver using the cached webdriver_manager binary (firefox)
+        service = FirefoxService(driver_path('Firefox'))
         driver = webdriver.Firefox(service=service, options=options)
 
 
@@ -75,3 +112,68 @@ def setup(headless=True, download_dir=None, browser='Chrome'):
         actions = ActionChains(driver)
 
         return driver, wait, actions
+
+
+class BrowserSession():
+    '''
+    Context manager holding one WebDriver shared by every browser phase of a run. The browser is
+    only launched when first needed, its cookies are persisted to cookie_path so later runs can
+    skip signing in, and it is shut down on exit.
+    '''
+    def __init__(self, headless=True, download_dir=None, browser='Chrome', cookie_path=COOKIE_PATH):
+        self.headless = headless
+        self.download_dir = download_dir
+        self.browser = browser
+        self.cookie_path = cookie_path
+        self.driver, self.wait, self.actions = None, None, None
+        self.signed_in = False
+
+    def start(self):
+        if self.driver is None:
+            driver, self.wait, self.actions = setup(headless=self.headless, download_dir=self.download_dir, browser=self.browser)
+            self.driver = RUN_REPORT.wrap(driver, 'selenium', SELENIUM_METHODS)
+        return self.driver, self.wait, self.actions
+
+    def restore_cookies(self, url):
+        '''
+        Loads the persisted cookies into the browser.
+
+        Args:
+        url (str): A page on the cookies' domain, which must be open before cookies can be set.
+
+        Returns:
+        bool: True if any cookie was restored.
+        '''
+        try:
+            with open(self.cookie_path) as f:
+                cookies = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+        driver, _, _ = self.start()
+        driver.get(url)
+        restored = False
+        for cookie in cookies:
+            try:
+                driver.add_cookie(cookie)
+                restored = True
+            except Exception:
+                continue
+
+        return restored
+
+    def save_cookies(self):
+        with open(self.cookie_path, 'w') as f:
+            json.dump(self.driver.get_cookies(), f)
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver, self.wait, self.actions = None, None, None
+            self.signed_in = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
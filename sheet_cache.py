@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from time import time
+from gspread.utils import extract_id_from_url
+from sheet_fetch import with_backoff
+
+
+CACHE_DIR = '.sheet_cache'
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def _modified_time(spreadsheet):
+    '''
+    Retrieves the Drive modifiedTime of a spreadsheet, used as its cache revision.
+
+    Args:
+    spreadsheet (gspread.spreadsheet.Spreadsheet): The opened spreadsheet.
+
+    Returns:
+    str: The modifiedTime of the spreadsheet, or None if it could not be retrieved.
+    '''
+    try:
+        if hasattr(spreadsheet, 'get_lastUpdateTime'):
+            return with_backoff(spreadsheet.get_lastUpdateTime)
+        return spreadsheet.lastUpdateTime
+    except Exception as e:
+        print(f'Could not read revision of spreadsheet {spreadsheet.id} ({e}), bypassing cache.')
+        return None
+
+
+class SheetCache():
+    '''
+    Google Sheets client wrapper that serves worksheet reads from a local on-disk cache.
+
+    Records are stored content-addressed under cache_dir, with a manifest keyed by spreadsheet ID
+    and worksheet title. Entries are invalidated when the Drive modifiedTime of their spreadsheet
+    changes, and the least recently used entries are evicted once the cache exceeds max_bytes.
+    Each spreadsheet is opened once per run, and the use of cache hits is only written to the
+    manifest with the next store or flush(). In offline mode no API call is made and every read
+    is served from the cache.
+    '''
+    def __init__(self, gc, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, offline=False):
+        self.gc = gc
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self._lock = threading.Lock()
+        self._opened = {}
+        self._dirty = False
+        os.makedirs(cache_dir, exist_ok=True)
+        self.manifest = self.__load_manifest()
+
+    def __getattr__(self, name):
+        # Pass any other client call through to gspread
+        return getattr(self.gc, name)
+
+    def open_by_url(self, url):
+        spreadsheet_id = extract_id_from_url(url)
+        if self.offline:
+            return CachedSpreadsheet(self, spreadsheet_id)
+
+        # The spreadsheet and its revision are fetched once and reused for the rest of the run
+        with self._lock:
+            cached = self._opened.get(spreadsheet_id)
+        if cached is not None:
+            return cached
+
+        spreadsheet = with_backoff(self.gc.open_by_url, url)
+        cached = CachedSpreadsheet(self, spreadsheet_id, spreadsheet, _modified_time(spreadsheet))
+        with self._lock:
+            return self._opened.setdefault(spreadsheet_id, cached)
+
+    def revision(self, url):
+        '''
+        Returns the Drive modifiedTime of a spreadsheet, or the cached revision when offline.
+
+        Args:
+        url (str): The URL of the spreadsheet.
+
+        Returns:
+        str: The revision, or None if it is unknown.
+        '''
+        if not self.offline:
+            return self.open_by_url(url).modified
+
+        spreadsheet_id = extract_id_from_url(url)
+        with self._lock:
+            revisions = [entry['modified'] for key, entry in self.manifest['entries'].items()
+                         if key.startswith(f'{spreadsheet_id}/')]
+        return max(revisions, default=None, key=str)
+
+    def titles(self, spreadsheet_id, modified):
+        '''
+        Returns the cached worksheet titles of a spreadsheet, or None if they are missing or stale.
+        '''
+        with self._lock:
+            entry = self.manifest['spreadsheets'].get(spreadsheet_id)
+            if entry is None or not self.__is_fresh(entry, modified):
+                return None
+            return entry['titles']
+
+    def store_titles(self, spreadsheet_id, modified, titles):
+        with self._lock:
+            self.manifest['spreadsheets'][spreadsheet_id] = {'modified': modified, 'titles': titles}
+            self.__save_manifest()
+
+    def load(self, spreadsheet_id, title, modified):
+        '''
+        Returns the cached records of a worksheet, or None if they are missing or stale.
+        '''
+        key = f'{spreadsheet_id}/{title}'
+        with self._lock:
+            entry = self.manifest['entries'].get(key)
+            if entry is None or not self.__is_fresh(entry, modified):
+                return None
+            try:
+                with open(os.path.join(self.cache_dir, entry['digest']), 'rb') as f:
+                    records = pickle.load(f)
+            except (OSError, pickle.UnpicklingError):
+                del self.manifest['entries'][key]
+                self._dirty = True
+                return None
+            entry['last_used'] = time()
+            self._dirty = True
+
+        return records
+
+    def store(self, spreadsheet_id, title, modified, records):
+        '''
+        Writes the records of a worksheet to the cache and evicts entries above the size limit.
+        '''
+        data = pickle.dumps(records)
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            path = os.path.join(self.cache_dir, digest)
+            if not os.path.exists(path):
+                with open(f'{path}.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(f'{path}.tmp', path)
+
+            self.manifest['entries'][f'{spreadsheet_id}/{title}'] = {
+                'digest': digest, 'modified': modified, 'size': len(data), 'last_used': time()
+            }
+            self.__evict()
+            self.__save_manifest()
+
+    def flush(self):
+        '''
+        Writes the use of the entries read since the last save to the manifest.
+        '''
+        with self._lock:
+            if self._dirty:
+                self.__save_manifest()
+
+    def __is_fresh(self, entry, modified):
+        # Offline reads accept any cached revision, online reads require a known, matching one
+        return self.offline or (modified is not None and entry['modified'] == modified)
+
+    def __evict(self):
+        entries = self.manifest['entries']
+        sizes = {entry['digest']: entry['size'] for entry in entries.values()}
+        total = sum(sizes.values())
+
+        for key in sorted(entries, key=lambda k: entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            digest = entries.pop(key)['digest']
+            if any(entry['digest'] == digest for entry in entries.values()):
+                continue
+            total -= sizes[digest]
+            try:
+                os.remove(os.path.join(self.cache_dir, digest))
+            except FileNotFoundError:
+                pass
+
+    def __load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'spreadsheets': {}, 'entries': {}}
+
+    def __save_manifest(self):
+        self._dirty = False
+        with open(f'{self.manifest_path}.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(f'{self.manifest_path}.tmp', self.manifest_path)
+
+
+class CachedSpreadsheet():
+    '''
+    Spreadsheet stand-in whose worksheet list and records are served through a SheetCache
+    '''
+    def __init__(self, cache, spreadsheet_id, spreadsheet=None, modified=None):
+        self.cache = cache
+        self.id = spreadsheet_id
+        self.spreadsheet = spreadsheet
+        self.modified = modified
+
+    def __getattr__(self, name):
+        return getattr(self.__require_spreadsheet(), name)
+
+    def worksheets(self):
+        titles = self.cache.titles(self.id, self.modified)
+        if titles is not None:
+            return [CachedWorksheet(self, title) for title in titles]
+
+        sheets = with_backoff(self.__require_spreadsheet().worksheets)
+        self.cache.store_titles(self.id, self.modified, [sheet.title for sheet in sheets])
+        return [CachedWorksheet(self, sheet.title, sheet) for sheet in sheets]
+
+    def worksheet(self, title):
+        return CachedWorksheet(self, title)
+
+    def __require_spreadsheet(self):
+        if self.spreadsheet is None:
+            raise FileNotFoundError(f'Spreadsheet {self.id} is not available in the offline cache.')
+        return self.spreadsheet
+
+
+class CachedWorksheet():
+    '''
+    Worksheet stand-in whose records are served through a SheetCache
+    '''
+    def __init__(self, spreadsheet, title, worksheet=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.worksheet = worksheet
+
+    def __getattr__(self, name):
+        return getattr(self.__require_worksheet(), name)
+
+    def get_all_records(self):
+        parent = self.spreadsheet
+        records = parent.cache.load(parent.id, self.title, parent.modified)
+        if records is not None:
+            return records
+
+        records = with_backoff(self.__require_worksheet().get_all_records)
+        parent.cache.store(parent.id, self.title, parent.modified, records)
+        return records
+
+    def __require_worksheet(self):
+        if self.worksheet is None:
+            if self.spreadsheet.spreadsheet is None:
+                raise FileNotFoundError(f'Worksheet "{self.title}" of spreadsheet {self.spreadsheet.id} '
+                                        'is not available in the offline cache.')
+            self.worksheet = with_backoff(self.spreadsheet.spreadsheet.worksheet, self.title)
+        return self.worksheet
@@ -0,0 +1,58 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from gspread.exceptions import APIError
+from random import uniform
+from time import sleep
+
+
+MAX_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def with_backoff(func, *args, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS, statuses=RETRY_STATUS_CODES, **kwargs):
+    '''
+    Calls a Google Sheets API function, retrying with exponential backoff when rate limited.
+
+    Args:
+    func (Callable): The API function to call.
+    retries (int): The maximum number of attempts.
+    backoff (float): The initial delay in seconds, doubled after every failed attempt.
+    statuses (Set[int]): The HTTP statuses that are retried.
+
+    Returns:
+    Any: The return value of func.
+    '''
+    for attempt in range(retries):
+        try:
+            return func(*args, **kwargs)
+        except APIError as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status not in statuses or attempt == retries - 1:
+                raise
+            delay = backoff * 2 ** attempt + uniform(0, backoff)
+            print(f'Sheets API returned {status}, retrying in {delay:.1f}s...')
+            sleep(delay)
+
+
+def fetch_worksheets(spreadsheet, max_workers=MAX_WORKERS):
+    '''
+    Reads every worksheet of a spreadsheet with a single metadata call and a bounded thread pool.
+
+    Args:
+    spreadsheet (gspread.spreadsheet.Spreadsheet): The opened spreadsheet.
+    max_workers (int): The maximum number of worksheets read at the same time.
+
+    Returns:
+    Dict[str, pd.DataFrame]: The records of each worksheet keyed by title, in worksheet order.
+    '''
+    sheets = with_backoff(spreadsheet.worksheets)
+    if not sheets:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(sheets))) as executor:
+        futures = [executor.submit(with_backoff, sheet.get_all_records) for sheet in sheets]
+        records = [future.result() for future in futures]
+
+    return {sheet.title: pd.DataFrame(rows) for sheet, rows in zip(sheets, records)}
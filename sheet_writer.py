@@ -0,0 +1,312 @@
+import math
+import re
+import pandas as pd
+from bisect import bisect_left
+from gspread.utils import rowcol_to_a1, ValueRenderOption, DateTimeOption
+from sheet_fetch import with_backoff
+
+
+MAX_CELLS_PER_REQUEST = 20000
+MAX_RANGES_PER_REQUEST = 500
+MAX_SPAN_GAP = 3
+KEY_COLUMNS = ['Email', 'Group']
+NUMBER_REGEX = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+
+
+def _cellrepr(value):
+    '''
+    Renders a DataFrame value the way it is entered into a sheet cell.
+    '''
+    if value is None:
+        return ''
+    if isinstance(value, float) and math.isnan(value):
+        return ''
+    if value is pd.NA or value is pd.NaT:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _entered_value(value):
+    '''
+    Returns the value a cell holds once value is entered with USER_ENTERED, as read back with
+    UNFORMATTED_VALUE: numbers and percentages become floats and TRUE/FALSE booleans, while other
+    text, including dates read back as FORMATTED_STRING, is kept as it is.
+    '''
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value)
+    if text.upper() in ('TRUE', 'FALSE'):
+        return text.upper() == 'TRUE'
+    if text.endswith('%') and NUMBER_REGEX.match(text[:-1]):
+        return float(text[:-1]) / 100
+    if NUMBER_REGEX.match(text):
+        return float(text)
+    return text
+
+
+def _same(current, target):
+    '''
+    Compares a cell as read from the sheet, unformatted, with the value about to be written. Both
+    sides are brought to the value the sheet stores, so a cell is only rewritten when its content
+    actually changed, however it is displayed.
+    '''
+    if current == target:
+        return True
+    current, target = _entered_value(current), _entered_value(target)
+    if type(current) is not type(target):
+        return False
+    if isinstance(current, float):
+        return math.isclose(current, target, rel_tol=1e-9, abs_tol=1e-12)
+    return current == target
+
+
+def dataframe_grid(df):
+    '''
+    Converts a DataFrame into the grid of cell values written to the sheet, header included.
+
+    Args:
+    df (pd.DataFrame): The DataFrame to be written.
+
+    Returns:
+    List[List[str]]: The rows of cell values.
+    '''
+    header = [str(col) for col in df.columns]
+    rows = [[_cellrepr(value) for value in row] for row in df.itertuples(index=False, name=None)]
+    return [header] + rows
+
+
+def diff_grid(current, target, max_gap=MAX_SPAN_GAP):
+    '''
+    Computes the changed spans between the current sheet content and the target grid.
+    Changed cells of a row closer than max_gap apart are merged into a single span.
+
+    Args:
+    current (List[List[str]]): The current cell values of the sheet.
+    target (List[List[str]]): The cell values to be written.
+    max_gap (int): The number of unchanged cells allowed inside a span.
+
+    Returns:
+    List[Tuple[int, int, List[str]]]: The 1-based row, 1-based start column and values of each span.
+    '''
+    spans = []
+    for r, row in enumerate(target):
+        existing = current[r] if r < len(current) else []
+        changed = [c for c, value in enumerate(row) if not _same(existing[c] if c < len(existing) else '', value)]
+
+        start = None
+        for i, c in enumerate(changed):
+            if start is None:
+                start = c
+            if i + 1 == len(changed) or changed[i + 1] - c > max_gap + 1:
+                spans.append((r + 1, start + 1, row[start:c + 1]))
+                start = None
+
+    return spans
+
+
+def row_keys(grid, key_columns=KEY_COLUMNS):
+    '''
+    Extracts the key of every data row of a grid.
+
+    Args:
+    grid (List[List[str]]): The cell values, header included.
+    key_columns (List[str]): The columns identifying a row.
+
+    Returns:
+    List[Tuple[str]]: The key of each row below the header, or None if the header lacks every key column.
+    '''
+    if not grid:
+        return []
+    header = grid[0]
+    positions = [header.index(col) for col in key_columns if col in header]
+    if not positions:
+        return None
+    # Sheet cells read unformatted may be numbers, compared in their written form
+    return [tuple(_cellrepr(row[p]) if p < len(row) else '' for p in positions) for row in grid[1:]]
+
+
+def align_rows(current_keys, target_keys):
+    '''
+    Matches the rows of the sheet to the rows about to be written by key. The longest run of matches
+    in the same relative order is kept, found as a longest increasing subsequence in O(n log n), and
+    every other row counts as deleted from or inserted into the sheet.
+
+    Args:
+    current_keys (List[Tuple[str]]): The key of each data row of the sheet.
+    target_keys (List[Tuple[str]]): The key of each data row to be written.
+
+    Returns:
+    List[int]: For each target row, the index of the sheet row it replaces, or None for a new row.
+    '''
+    positions = {}
+    for c, key in enumerate(current_keys):
+        positions.setdefault(key, []).append(c)
+    taken = {}
+    pairs = []
+    for t, key in enumerate(target_keys):
+        candidates = positions.get(key)
+        n = taken.get(key, 0)
+        if candidates and n < len(candidates):
+            pairs.append((t, candidates[n]))
+            taken[key] = n + 1
+
+    # Patience sort over the sheet positions of the matches, which come in target order
+    tails, tail_pairs, previous = [], [], []
+    for i, (_, c) in enumerate(pairs):
+        k = bisect_left(tails, c)
+        previous.append(tail_pairs[k - 1] if k else None)
+        if k == len(tails):
+            tails.append(c)
+            tail_pairs.append(i)
+        else:
+            tails[k] = c
+            tail_pairs[k] = i
+
+    matched = [None] * len(target_keys)
+    i = tail_pairs[-1] if tail_pairs else None
+    while i is not None:
+        t, c = pairs[i]
+        matched[t] = c
+        i = previous[i]
+    return matched
+
+
+def __runs(indices):
+    runs = []
+    for i in indices:
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return runs
+
+
+def row_operations(current, target, key_columns=KEY_COLUMNS):
+    '''
+    Plans the row deletions and insertions that line the sheet's rows up with the rows about to be written,
+    so a student added or removed near the top does not shift and rewrite every row below.
+
+    Args:
+    current (List[List[str]]): The current cell values of the sheet.
+    target (List[List[str]]): The cell values to be written.
+    key_columns (List[str]): The columns identifying a row.
+
+    Returns:
+    Tuple[List[List[str]], List[Tuple[str, int, int]], int, int]: The current rows aligned to the target
+    rows, the ('delete' | 'insert', start, end) 0-based row ranges to apply in order, and the number of
+    rows deleted and inserted.
+    '''
+    current_keys, target_keys = row_keys(current, key_columns), row_keys(target, key_columns)
+    if not current or current_keys is None or target_keys is None:
+        # Without keys to match on, rows are compared by position
+        return current[:len(target)], [], 0, 0
+
+    matched = align_rows(current_keys, target_keys)
+    kept = {c for c in matched if c is not None}
+    deleted = [c for c in range(len(current_keys)) if c not in kept]
+
+    # Rows after the last kept row are written in place, only rows above it need to be inserted
+    last = max((t for t, c in enumerate(matched) if c is not None), default=-1)
+    inserted = [t for t in range(last) if matched[t] is None]
+
+    # Deletions bottom up, then insertions top down, so every range refers to the sheet as it is at that point
+    operations = [('delete', start + 1, end + 1) for start, end in reversed(__runs(deleted))]
+    operations += [('insert', start + 1, end + 1) for start, end in __runs(inserted)]
+
+    aligned = [current[0]] + [current[c + 1] if c is not None else [] for c in matched]
+    return aligned, operations, len(deleted), len(inserted)
+
+
+def summarize_diff(current, target, spans, key_columns=KEY_COLUMNS):
+    '''
+    Summarizes a diff by cells written and students added, removed and changed.
+
+    Args:
+    current (List[List[str]]): The full current cell values of the sheet.
+    target (List[List[str]]): The cell values to be written.
+    spans (List[Tuple[int, int, List[str]]]): The changed spans.
+    key_columns (List[str]): The columns identifying a student.
+
+    Returns:
+    Dict[str, int]: The counts of the diff.
+    '''
+    current_keys = set(row_keys(current, key_columns) or [])
+    target_keys = set(row_keys(target, key_columns) or [])
+
+    return {
+        'cells': sum(len(values) for _, _, values in spans),
+        'ranges': len(spans),
+        'rows_changed': len({row for row, _, _ in spans}),
+        'students_added': len(target_keys - current_keys),
+        'students_removed': len(current_keys - target_keys),
+    }
+
+
+def __chunks(spans, max_cells=MAX_CELLS_PER_REQUEST, max_ranges=MAX_RANGES_PER_REQUEST):
+    chunk, cells = [], 0
+    for span in spans:
+        if chunk and (cells + len(span[2]) > max_cells or len(chunk) == max_ranges):
+            yield chunk
+            chunk, cells = [], 0
+        chunk.append(span)
+        cells += len(span[2])
+    if chunk:
+        yield chunk
+
+
+def write_dataframe_diff(worksheet, df, dry_run=False):
+    '''
+    Writes a DataFrame to a worksheet, sending only the cells that differ from the current content.
+    The sheet is read unformatted, so cells are compared by the value they hold rather than how they
+    are displayed. Sheet rows are matched to DataFrame rows on KEY_COLUMNS, and rows of students added
+    or removed are inserted or deleted in a single request first. The worksheet is then resized to fit
+    the DataFrame exactly, and the changed spans are sent in chunked batch_update calls with backoff.
+
+    Args:
+    worksheet (gspread.worksheet.Worksheet): The worksheet to be written.
+    df (pd.DataFrame): The DataFrame to be written.
+    dry_run (bool): Only report what would be written.
+
+    Returns:
+    Dict[str, int]: The counts of the diff.
+    '''
+    target = dataframe_grid(df)
+    width = len(target[0])
+    current = with_backoff(worksheet.get_all_values, value_render_option=ValueRenderOption.unformatted,
+                           date_time_render_option=DateTimeOption.formatted_string)
+
+    # Rows are matched on their key, anything outside the target grid is removed by the resize
+    aligned, operations, deleted, inserted = row_operations(current, target)
+    spans = diff_grid([row[:width] for row in aligned], target)
+    summary = dict(summarize_diff(current, target, spans), rows_deleted=deleted, rows_inserted=inserted)
+
+    print(f"{worksheet.title}: {summary['cells']} cells in {summary['ranges']} ranges to write "
+          f"({summary['rows_changed']} rows changed, {summary['students_added']} added, {summary['students_removed']} removed, "
+          f"{inserted} rows inserted, {deleted} deleted)")
+    if dry_run:
+        return summary
+
+    rows, cols = worksheet.row_count, worksheet.col_count
+    if operations:
+        requests = [{f'{operation}Dimension': {'range': {'sheetId': worksheet.id, 'dimension': 'ROWS',
+                                                         'startIndex': start, 'endIndex': end}}}
+                    for operation, start, end in operations]
+        # Row insertions and deletions are not idempotent, so they are only retried when rate limited,
+        # as the request was then refused, never after an error that may have followed their application
+        with_backoff(worksheet.spreadsheet.batch_update, {'requests': requests}, statuses={429})
+
+    if (rows - deleted + inserted, cols) != (len(target), width):
+        with_backoff(worksheet.resize, rows=len(target), cols=width)
+
+    for chunk in __chunks(spans):
+        data = [{'range': f'{rowcol_to_a1(row, col)}:{rowcol_to_a1(row, col + len(values) - 1)}', 'values': [values]}
+                for row, col, values in chunk]
+        with_backoff(worksheet.batch_update, data, value_input_option='USER_ENTERED')
+
+    return summary
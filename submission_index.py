@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+
+SUBMITTED_FORMAT = '%m/%d/%Y %H:%M:%S'
+
+
+def submission_times(values):
+    '''
+    Parses 'Submitted At' values into nanosecond timestamps. Unparseable values sort before
+    any real submission.
+
+    Args:
+    values (pd.Series): The 'Submitted At' values.
+
+    Returns:
+    pd.Series: The timestamps as integers, with the index of values.
+    '''
+    submitted = pd.to_datetime(values, format=SUBMITTED_FORMAT, errors='coerce')
+    return submitted.fillna(pd.Timestamp.min).astype('int64')
+
+
+def _rows_hash(df, rows, columns):
+    digest = hashlib.sha256(repr(columns).encode())
+    digest.update(pd.util.hash_pandas_object(df[columns].iloc[:rows], index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+class SubmissionIndex():
+    '''
+    Per-module index mapping every email to the row position of its latest survey submission.
+    The index is persisted as JSON with the number of sheet rows it covers and a hash of those
+    rows, so a sheet that only had rows appended is indexed from the new rows alone, while any
+    other edit rebuilds the module's index.
+    '''
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def latest(self, module, df):
+        '''
+        Updates the index of a module and returns the position of each student's latest submission.
+        Without a 'Submitted At' column the last submission is taken.
+
+        Args:
+        module (str): The name of the module.
+        df (pd.DataFrame): The full survey worksheet of the module, in sheet order.
+
+        Returns:
+        List[int]: The row position of each email's latest submission, in order of first appearance.
+        '''
+        columns = ['email', 'Submitted At'] if 'Submitted At' in df.columns else ['email']
+        entry = self.entries.get(module)
+
+        if (entry is None or entry['columns'] != columns or entry['rows'] > len(df)
+                or entry['hash'] != _rows_hash(df, entry['rows'], columns)):
+            entry = {'columns': columns, 'rows': 0, 'hash': None, 'latest': {}}
+
+        new = df.iloc[entry['rows']:].reset_index(drop=True)
+        if not new.empty:
+            keep_last = 'Submitted At' not in columns
+            if keep_last:
+                times = pd.Series(0, index=new.index)
+                best = new.index.to_series().groupby(new['email'], sort=False).max()
+            else:
+                # First row holding each email's latest time within the new rows
+                times = submission_times(new['Submitted At'])
+                best = times.groupby(new['email'], sort=False).idxmax()
+
+            latest = entry['latest']
+            rows = best.to_numpy()
+            for email, row, time in zip(best.index, rows.tolist(), times.to_numpy()[rows].tolist()):
+                current = latest.get(str(email))
+                if current is None or keep_last or time > current[1]:
+                    latest[str(email)] = [entry['rows'] + row, time]
+
+            entry['rows'] = len(df)
+            entry['hash'] = _rows_hash(df, len(df), columns)
+
+        self.entries[module] = entry
+        return [position for position, _ in entry['latest'].values()]
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f'{self.path}.tmp', 'w') as f:
+            f.write(json.dumps(self.entries))
+        os.replace(f'{self.path}.tmp', self.path)
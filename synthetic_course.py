@@ -0,0 +1,331 @@
+import hashlib
+import io
+import os
+import re
+import numpy as np
+import pandas as pd
+from types import SimpleNamespace
+
+
+COURSE_NAME = 'Synthetic Course'
+SHEET_URL = 'https://docs.google.com/spreadsheets/d/{}/edit#gid=0'
+FOLDER_URL = 'https://drive.google.com/drive/folders/{}?usp=sharing'
+SUBMITTED_FORMAT = '%m/%d/%Y %H:%M:%S'
+WELCOME_COLUMNS = [
+    'Which best describes you?  Are you currently..._1',
+    'Which best describes you? Are you currently..._2',
+    'The Tech Stewardship Practice Program is most effective when it overlays a current experiential or work integrated learning experience. Please let us know what type of experience opportunity(s) you will have this semester:',
+]
+WELCOME_ANSWERS = [
+    ["Completing a Bachelor's degree", 'Completing a College/CEGEP certificate or diploma', 'Working full time'],
+    ['A Canadian citizen studying at a Canadian post-secondary institution',
+     'An international student studying at a Canadian post-secondary institution', 'Not currently studying'],
+    ['I will not have a current experiential or work integrated learning experience this semester', 'A co-op placement'],
+]
+MODULE_QUESTIONS = {
+    'Before You Begin + Welcome Survey': WELCOME_COLUMNS,
+    'Share a Story': ['What kind of story do you want to share this week?', 'Describe the situation',
+                      'How does this relate to tech stewardship?', 'What opportunities do you see?', 'Thank you for sharing'],
+    'Advance Understanding': ['What questions are you currently exploring?', 'What stood out to you?', 'How was this module?'],
+    'Career Management': ['Describe a situation', 'What new opportunity did you find?', 'What small action will you take?'],
+    'Request a micro-credential': ['Why do you want the micro-credential?'],
+    'Feedback': ['Overall how do you rate your experience of participating in the TS program?', 'Any other comments?'],
+}
+
+
+def _sheet_id(name):
+    return hashlib.md5(name.encode()).hexdigest()
+
+
+def _timestamps(rng, count):
+    seconds = rng.integers(0, 120 * 24 * 3600, count)
+    return list((pd.Timestamp('2023-01-01') + pd.to_timedelta(seconds, unit='s')).strftime(SUBMITTED_FORMAT))
+
+
+def _records(df):
+    return df.to_dict('records')
+
+
+def generate_course(directory, students=1000, groups=20, modules=6, sessions=10, duplicate_rate=0.2,
+                    response_rate=0.8, seed=0, course_name=COURSE_NAME):
+    '''
+    Generates a synthetic course: its downloaded progress and group reports on disk, and the records of its
+    answer, attendance, credential and participant configuration sheets.
+
+    Args:
+    directory (str): The folder the course folder is created in.
+    students (int): The number of enrolled students.
+    groups (int): The number of groups, about 5% of students belong to two.
+    modules (int): The number of survey modules, the first six being the modules the reports special-case.
+    sessions (int): The number of attendance sessions.
+    duplicate_rate (float): The share of survey and attendance responses submitted twice.
+    response_rate (float): The share of students answering each survey and attending each session.
+    seed (int): The random seed.
+    course_name (str): The name of the course.
+
+    Returns:
+    SimpleNamespace: The course name and sheet URLs as accepted by construct.Course, the spreadsheets
+    keyed by URL for FakeSheetsClient, and the participant configuration as 'participants'.
+    '''
+    rng = np.random.default_rng(seed)
+    course_dir = os.path.join(directory, course_name)
+    downloads = os.path.join(course_dir, 'Downloaded Reports')
+    os.makedirs(downloads, exist_ok=True)
+    os.makedirs(os.path.join(course_dir, 'Reports'), exist_ok=True)
+
+    # Students and their groups
+    group_names = [f'School {i:03d}' for i in range(groups)]
+    emails = np.array([f'student{i}@example.ca' for i in range(students)])
+    progress = pd.DataFrame({
+        'First Name': [f'First{i}' for i in range(students)],
+        'Last Name': [f'Last{i % 997}' for i in range(students)],
+        'Email': emails,
+        'Company': rng.choice(group_names, students),
+        'Last Sign In': _timestamps(rng, students),
+        '% Completed': [f'{value}%' for value in rng.integers(0, 101, students)],
+    })
+    for lesson in range(1, 11):
+        progress[f'Lesson {lesson}'] = rng.choice(['Completed', 'Not Started', 'In Progress'], students)
+    progress.to_csv(os.path.join(downloads, f'Progress Report_{course_name}.csv'), index=False)
+
+    membership = rng.integers(0, groups, students)
+    second = rng.random(students) < 0.05
+    for g, group in enumerate(group_names):
+        members = emails[(membership == g) | (second & ((membership + 1) % groups == g))]
+        pd.DataFrame({'Email': members}).to_csv(os.path.join(downloads, f'Group Report_{group}.csv'), index=False)
+
+    # Survey answers, one worksheet per module
+    module_names = list(MODULE_QUESTIONS)[:modules] + [f'Module {i}' for i in range(len(MODULE_QUESTIONS), modules)]
+    answers = {}
+    for m, module in enumerate(module_names):
+        questions = MODULE_QUESTIONS.get(module, [f'Question {q}' for q in range(1, 6)])
+        respondents = emails[rng.random(students) < response_rate]
+        respondents = np.concatenate([respondents, rng.choice(respondents, int(len(respondents) * duplicate_rate))])
+        df = pd.DataFrame({'email': respondents, 'Submitted At': _timestamps(rng, len(respondents)),
+                           'Token': [f'{i:x}' for i in rng.integers(0, 2 ** 32, len(respondents))]})
+        for q, question in enumerate(questions):
+            if module == 'Before You Begin + Welcome Survey':
+                df[question] = rng.choice(WELCOME_ANSWERS[q], len(respondents))
+            else:
+                df[question] = [f'Answer {value}' for value in rng.integers(0, 1000, len(respondents))]
+        answers[f'{m + 1:02d} - {module}'] = _records(df)
+
+    # Attendance, one worksheet per session
+    attendance = {}
+    for s in range(sessions):
+        attendees = emails[rng.random(students) < response_rate]
+        attendees = np.concatenate([attendees, rng.choice(attendees, int(len(attendees) * duplicate_rate))])
+        df = pd.DataFrame({'First name': 'First', 'Last name': 'Last', 'Email': attendees,
+                           'Submitted At': _timestamps(rng, len(attendees))})
+        attendance[f'TSPS - 2023-{1 + s // 28:02d}-{1 + s % 28:02d}'] = _records(df)
+
+    credentials = pd.DataFrame({'Email': emails[rng.random(students) < 0.3]})
+    credentials['Credential Status'] = rng.choice(['Issued', 'Pending'], len(credentials))
+    credentials['Notes'] = ''
+
+    participants = pd.DataFrame({'Group': group_names,
+                                 course_name: [FOLDER_URL.format(_sheet_id(group)) for group in group_names]})
+
+    urls = {name: SHEET_URL.format(_sheet_id(f'{course_name} {name}'))
+            for name in ['answers', 'attendance', 'thinkific', 'master', 'credentials']}
+    return SimpleNamespace(
+        name=course_name,
+        data_url=urls['answers'],
+        attendance_url=urls['attendance'],
+        thinkific_url=urls['thinkific'],
+        master_url=urls['master'],
+        credential_url=urls['credentials'],
+        participants=participants,
+        spreadsheets={
+            urls['answers']: answers,
+            urls['attendance']: attendance,
+            urls['thinkific']: {'Sheet1': []},
+            urls['master']: {'Sheet1': []},
+            urls['credentials']: {'Sheet1': _records(credentials)},
+        },
+    )
+
+
+def _entered(text):
+    '''
+    Parses text entered with USER_ENTERED like Sheets does for numbers, percentages and booleans.
+
+    Returns:
+    Tuple[Any, bool]: The stored value and whether it is shown as a percentage.
+    '''
+    if text.upper() in ('TRUE', 'FALSE'):
+        return text.upper() == 'TRUE', False
+    try:
+        if text.endswith('%'):
+            return float(text[:-1]) / 100, True
+        number = float(text)
+    except ValueError:
+        return text, False
+    return (int(number) if number.is_integer() else number), False
+
+
+def _unformatted(text):
+    return _entered(text)[0]
+
+
+def _formatted(text):
+    value, percent = _entered(text)
+    if isinstance(value, bool):
+        return str(value).upper()
+    if percent:
+        return f'{value * 100:g}%'
+    if isinstance(value, (int, float)):
+        return f'{value:g}'
+    return value
+
+
+class FakeWorksheet():
+    '''
+    In-memory stand-in for a gspread worksheet, counting the calls made to it
+    '''
+    def __init__(self, title, records, spreadsheet=None, sheet_id=0):
+        self.title = title
+        self.records = records
+        self.calls = 0
+        self.values = None
+        self.id = sheet_id
+        if spreadsheet is None:
+            spreadsheet = FakeSpreadsheet(None, {})
+            spreadsheet.sheets.append(self)
+        self.spreadsheet = spreadsheet
+
+    @property
+    def row_count(self):
+        return len(self.__grid())
+
+    @property
+    def col_count(self):
+        return max((len(row) for row in self.__grid()), default=0)
+
+    def get_all_records(self):
+        self.calls += 1
+        return list(self.records)
+
+    def get_all_values(self, value_render_option=None, date_time_render_option=None):
+        # Cells hold the text entered with USER_ENTERED, and are read back like Sheets renders them
+        render = _unformatted if value_render_option == 'UNFORMATTED_VALUE' else _formatted
+        return [[render(value) for value in row] for row in self.__grid()]
+
+    def __grid(self):
+        if self.values is None:
+            header = list(self.records[0]) if self.records else []
+            self.values = [header] + [['' if value is None else str(value) for value in record.values()] for record in self.records]
+        return self.values
+
+    def row_values(self, row):
+        self.calls += 1
+        values = self.get_all_values()
+        return list(values[row - 1]) if row <= len(values) else []
+
+    def resize(self, rows=None, cols=None):
+        self.calls += 1
+        values = self.__grid()
+        rows = len(values) if rows is None else rows
+        cols = self.col_count if cols is None else cols
+        self.values = [(row + [''] * cols)[:cols] for row in (values + [[]] * rows)[:rows]]
+
+    def batch_update(self, data, value_input_option=None):
+        self.calls += 1
+        values = self.__grid()
+        for update in data:
+            start = update['range'].split(':')[0]
+            letters, row = re.match(r'([A-Z]+)(\d+)', start).groups()
+            col = 0
+            for letter in letters:
+                col = col * 26 + ord(letter) - 64
+            for offset, value in enumerate(update['values'][0]):
+                values[int(row) - 1][col - 1 + offset] = value
+
+
+class FakeSpreadsheet():
+    def __init__(self, spreadsheet_id, sheets):
+        self.id = spreadsheet_id
+        self.lastUpdateTime = '2023-01-01T00:00:00.000Z'
+        self.sheets = [FakeWorksheet(title, records, self, i) for i, (title, records) in enumerate(sheets.items())]
+
+    def batch_update(self, body):
+        # Row insertions and deletions, as sent by sheet_writer
+        touched = set()
+        for request in body['requests']:
+            (kind, dimension), = request.items()
+            sheet = next(sheet for sheet in self.sheets if sheet.id == dimension['range']['sheetId'])
+            if sheet.id not in touched:
+                sheet.calls += 1
+                touched.add(sheet.id)
+            values = sheet.values
+            start, end = dimension['range']['startIndex'], dimension['range']['endIndex']
+            if kind == 'deleteDimension':
+                del values[start:end]
+            else:
+                values[start:start] = [[''] * sheet.col_count for _ in range(end - start)]
+
+    def worksheets(self):
+        return list(self.sheets)
+
+    def worksheet(self, title):
+        for sheet in self.sheets:
+            if sheet.title == title:
+                return sheet
+        raise KeyError(title)
+
+
+class FakeSheetsClient():
+    '''
+    In-memory stand-in for an authenticated gspread client serving the spreadsheets of generate_course
+    '''
+    def __init__(self, spreadsheets):
+        self.spreadsheets = {url: FakeSpreadsheet(_sheet_id(url), sheets) for url, sheets in spreadsheets.items()}
+
+    def open_by_url(self, url):
+        return self.spreadsheets[url]
+
+
+class FakeDriveFile(dict):
+    def __init__(self, drive, metadata):
+        super().__init__(metadata)
+        self.drive = drive
+        self.content = None
+
+    def SetContentString(self, content):
+        self.content = io.BytesIO(content.encode('utf-8'))
+
+    def SetContentFile(self, filename):
+        # Like PyDrive2, the file is opened here and read and closed by Upload
+        self.content = open(filename, 'rb')
+        if self.get('id') is None:
+            self.setdefault('title', os.path.basename(filename))
+
+    def Upload(self, param=None):
+        with self.content:
+            data = self.content.read()
+        self.content = io.BytesIO(data)
+        self.drive.uploads += 1
+        existing = self.drive.files.get(self.get('id'), {})
+        self.setdefault('id', _sheet_id(f'{self.get("title")}{len(self.drive.files)}'))
+        self['title'] = self.get('title', existing.get('title'))
+        self['parents'] = self.get('parents', existing.get('parents', []))
+        self['md5Checksum'] = hashlib.md5(data).hexdigest()
+        self.drive.files[self['id']] = self
+
+
+class FakeDrive():
+    '''
+    In-memory stand-in for an authenticated PyDrive2 GoogleDrive client, as used by drive_upload.ReportUploader
+    '''
+    def __init__(self):
+        self.files = {}
+        self.uploads = 0
+        self.auth = SimpleNamespace(Get_Http_Object=lambda: None)
+
+    def CreateFile(self, metadata):
+        return FakeDriveFile(self, metadata)
+
+    def ListFile(self, query):
+        parents = set(re.findall(r"'([^']+)' in parents", query['q']))
+        files = [file for file in self.files.values() if any(parent['id'] in parents for parent in file['parents'])]
+        return SimpleNamespace(GetList=lambda: files)
@@ -0,0 +1,39 @@
+import json
+import os
+import pytest
+import benchmark as report_benchmark
+
+
+BENCHMARK_STUDENTS = 1000
+# Committed reference timings, saved with benchmark.py --sizes 1000 --save-baseline --baseline tests/benchmark_baseline.json
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# Loose enough for slower or busier CI machines, tight enough to catch a stage becoming several times slower
+CI_TOLERANCE = 3.0
+CI_NOISE_SECONDS = 0.25
+
+
+def test_no_stage_regressed_against_the_baseline(tmp_path):
+    '''
+    Runs the offline benchmark at a small size and fails on any stage slower than the committed baseline allows.
+    '''
+    results = {str(BENCHMARK_STUDENTS): report_benchmark.bench_course(BENCHMARK_STUDENTS, str(tmp_path), repeats=1)}
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+
+    assert set(results[str(BENCHMARK_STUDENTS)]) == set(baseline[str(BENCHMARK_STUDENTS)])
+    assert report_benchmark.find_regressions(results, baseline, tolerance=CI_TOLERANCE, noise=CI_NOISE_SECONDS) == []
+
+
+def test_report_build(tmp_path_factory, request):
+    '''
+    Times the whole report build with pytest-benchmark, with each stage's time kept in extra_info.
+    '''
+    pytest.importorskip('pytest_benchmark')
+    benchmark = request.getfixturevalue('benchmark')
+
+    def run():
+        return report_benchmark.bench_course(BENCHMARK_STUDENTS, str(tmp_path_factory.mktemp('course')), repeats=1)
+
+    timings = benchmark.pedantic(run, rounds=3, iterations=1)
+    benchmark.extra_info.update(timings)
+    assert set(timings) >= {'progress', 'answers', 'finalize', 'partner reports', 'sheet write'}
@@ -0,0 +1,42 @@
+import pandas as pd
+import checkpoints
+from checkpoints import PipelineCheckpoints
+
+
+def double(df):
+    double.calls += 1
+    return df.assign(value=df['value'] * 2)
+
+
+def run(directory):
+    double.calls = 0
+    df = pd.DataFrame({'value': [1, 2, 3]})
+    out = PipelineCheckpoints(directory).run('progress', double, df, key=[df])
+    return out, double.calls
+
+
+def test_unchanged_inputs_load_the_checkpoint(tmp_path):
+    first, calls = run(str(tmp_path))
+    assert calls == 1
+    again, calls = run(str(tmp_path))
+    assert calls == 0
+    pd.testing.assert_frame_equal(again, first)
+
+
+def test_editing_a_stage_module_invalidates_checkpoints(tmp_path, monkeypatch):
+    helper = tmp_path / 'helper.py'
+    helper.write_text('def scale(value):\n    return value * 2\n')
+    monkeypatch.setattr(checkpoints, 'CODE_DIR', str(tmp_path))
+    monkeypatch.setattr(checkpoints, 'STAGE_MODULES', ['helper.py'])
+    directory = str(tmp_path / 'Checkpoints')
+
+    assert run(directory)[1] == 1
+    assert run(directory)[1] == 0
+    helper.write_text('def scale(value):\n    return value * 3\n')
+    assert run(directory)[1] == 1
+
+
+def test_checkpoint_version_invalidates_checkpoints(tmp_path, monkeypatch):
+    assert run(str(tmp_path))[1] == 1
+    monkeypatch.setattr(checkpoints, 'CHECKPOINT_VERSION', checkpoints.CHECKPOINT_VERSION + 1)
+    assert run(str(tmp_path))[1] == 1
@@ -0,0 +1,138 @@
+import requests
+import pytest
+import construct
+import download_reports
+from download_reports import http_downloads, download_name, signin
+from imap_ingest import load_watermark
+from test_imap_ingest import FakeMailbox, BODY
+
+
+class FakeResponse():
+    def __init__(self, content):
+        self.status_code = 200
+        self.headers = {'Content-Length': str(len(content))}
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        yield self.content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeSession():
+    '''
+    Stand-in for the authenticated HTTP session, failing the links in broken
+    '''
+    def __init__(self, broken=(), dispositions=None):
+        self.broken = set(broken)
+        self.dispositions = dispositions or {}
+
+    def head(self, link, allow_redirects=False, timeout=None):
+        if link in self.broken:
+            raise requests.ConnectionError(f'Connection reset requesting {link}')
+        response = FakeResponse(b'')
+        if link in self.dispositions:
+            response.headers['Content-Disposition'] = self.dispositions[link]
+        return response
+
+    def get(self, link, headers=None, stream=False, timeout=None):
+        if link in self.broken:
+            raise requests.ConnectionError(f'Connection reset downloading {link}')
+        return FakeResponse(f'Email\n{link}@example.ca\n'.encode())
+
+
+@pytest.fixture
+def course_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Course' / 'Downloaded Reports').mkdir(parents=True)
+    return tmp_path / 'Course' / 'Downloaded Reports'
+
+
+def test_failed_download_leaves_its_email_for_the_next_run(course_dir, tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    mail = FakeMailbox({uid: (f'Export: Progress Report for Group {uid}', BODY.format(uid)) for uid in (1, 2, 3)})
+    session = FakeSession(broken=['https://example.com/2'])
+
+    with construct.get_email_link('user', 'pw', construct.Course('Course', None, None, None, None, None),
+                                  mail=mail, state_path=state_path) as emails:
+        failed = http_downloads(emails, session, 'Course', max_workers=2, on_download=emails.downloaded)
+
+    assert [link for link, _ in failed] == ['https://example.com/2']
+    assert sorted(path.name for path in course_dir.glob('Group_*.csv')) == ['Group_Progress Report_Group 1.csv', 'Group_Progress Report_Group 3.csv']
+    # Only the emails whose reports landed are consumed, and the watermark stops below the failed one
+    assert [uid for uid, message in sorted(mail.messages.items()) if not message['seen']] == [2]
+    assert load_watermark('user/INBOX', state_path) == (11, 1)
+
+    session.broken.clear()
+    with construct.get_email_link('user', 'pw', construct.Course('Course', None, None, None, None, None),
+                                  mail=mail, state_path=state_path) as emails:
+        assert http_downloads(emails, session, 'Course', on_download=emails.downloaded) == []
+    assert (course_dir / 'Group_Progress Report_Group 2.csv').exists()
+    assert not any(not message['seen'] for message in mail.messages.values())
+    with pytest.raises(construct.NoExportEmails):
+        construct.get_email_link('user', 'pw', construct.Course('Course', None, None, None, None, None),
+                                 mail=mail, state_path=state_path)
+
+
+def test_download_name_comes_from_the_link():
+    session = FakeSession(broken={'https://files.example.ca/broken/export-9.csv'},
+                          dispositions={'https://example.ca/exports/1': 'attachment; filename="progress-1.csv"',
+                                        'https://example.ca/exports/2': "attachment; filename*=UTF-8''users%20list.csv"})
+    assert download_name(session, 'https://example.ca/exports/1') == 'progress-1.csv'
+    assert download_name(session, 'https://example.ca/exports/2') == 'users list.csv'
+    assert download_name(session, 'https://s3.example.ca/x?response-content-disposition=attachment%3B%20filename%3D%22survey.csv%22') == 'survey.csv'
+    assert download_name(session, 'https://files.example.ca/broken/export-9.csv') == 'export-9.csv'
+    assert download_name(session, 'https://example.ca/exports/3') is None
+
+
+class SigninDriver():
+    '''
+    Stand-in for a WebDriver whose sign in form is submitted without leaving the page, as when a captcha shows
+    '''
+    def __init__(self):
+        self.current_url = None
+
+    def get(self, url):
+        self.current_url = url
+
+    def find_element(self, by, value):
+        return self
+
+    def send_keys(self, keys):
+        pass
+
+    def click(self):
+        pass
+
+
+class ImmediateWait():
+    def __init__(self, driver, timeout):
+        self.driver = driver
+
+    def until(self, condition):
+        result = condition(self.driver)
+        if not result:
+            raise download_reports.TimeoutException()
+        return result
+
+
+def test_headless_signin_fails_instead_of_prompting(monkeypatch):
+    monkeypatch.setattr(download_reports, 'WebDriverWait', ImmediateWait)
+    monkeypatch.setattr('builtins.input', lambda prompt='': pytest.fail('prompted for input'))
+    with pytest.raises(RuntimeError, match='--show-browser'):
+        signin(SigninDriver(), 'user', 'pw', headless=True)
+
+
+def test_visible_signin_waits_to_be_completed_by_hand(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(download_reports, 'WebDriverWait', ImmediateWait)
+    monkeypatch.setattr('builtins.input', prompts.append)
+    signin(SigninDriver(), 'user', 'pw', headless=False)
+    assert len(prompts) == 1
@@ -0,0 +1,58 @@
+import os
+from download_watcher import DownloadWatcher
+
+
+def download(directory, name, content='data'):
+    with open(os.path.join(directory, f'{name}.crdownload'), 'w') as f:
+        f.write(content)
+    os.rename(os.path.join(directory, f'{name}.crdownload'), os.path.join(directory, name))
+
+
+def test_finished_downloads_are_matched_to_their_entries(tmp_path):
+    with DownloadWatcher(str(tmp_path), timeout=5, poll_interval=0.01) as watcher:
+        watcher.expect(('link', 'Export: Progress Report'))
+        download(str(tmp_path), 'report.csv')
+        assert watcher.wait() == [(('link', 'Export: Progress Report'), 'report.csv')]
+
+
+def test_a_moved_download_can_be_downloaded_again_under_the_same_name(tmp_path):
+    directory, moved = tmp_path / 'downloads', tmp_path / 'moved'
+    directory.mkdir()
+    moved.mkdir()
+
+    with DownloadWatcher(str(directory), timeout=5, poll_interval=0.01) as watcher:
+        for run in range(2):
+            watcher.expect(('link', f'run {run}'))
+            download(str(directory), 'report.csv', content=str(run))
+            assert watcher.wait() == [(('link', f'run {run}'), 'report.csv')]
+            os.replace(directory / 'report.csv', moved / f'report {run}.csv')
+
+
+def test_files_present_beforehand_are_ignored(tmp_path):
+    download(str(tmp_path), 'old.csv')
+    with DownloadWatcher(str(tmp_path), timeout=5, poll_interval=0.01) as watcher:
+        watcher.expect(('link', 'Export'))
+        download(str(tmp_path), 'new.csv')
+        assert watcher.wait() == [(('link', 'Export'), 'new.csv')]
+
+
+def test_downloads_finishing_out_of_order_are_matched_by_filename(tmp_path):
+    with DownloadWatcher(str(tmp_path), timeout=5, poll_interval=0.01) as watcher:
+        watcher.expect(('link1', 'Export: Progress Report'), 'progress.csv')
+        watcher.expect(('link2', 'Export: Users'), 'users.csv')
+        watcher.expect(('link3', 'Export: Survey Results'), 'survey.csv')
+        download(str(tmp_path), 'users.csv')
+        assert watcher.wait() == [(('link2', 'Export: Users'), 'users.csv')]
+        download(str(tmp_path), 'survey (1).csv')
+        download(str(tmp_path), 'progress.csv')
+        assert sorted(watcher.wait()) == [(('link1', 'Export: Progress Report'), 'progress.csv'),
+                                          (('link3', 'Export: Survey Results'), 'survey (1).csv')]
+
+
+def test_unexpected_names_go_to_the_oldest_entry_without_a_filename(tmp_path):
+    with DownloadWatcher(str(tmp_path), timeout=5, poll_interval=0.01) as watcher:
+        watcher.expect(('link1', 'Export: Progress Report'), 'progress.csv')
+        watcher.expect(('link2', 'Export: Users'))
+        download(str(tmp_path), 'export-1234.csv')
+        assert watcher.wait() == [(('link2', 'Export: Users'), 'export-1234.csv')]
+        assert watcher.in_flight == 1
@@ -0,0 +1,70 @@
+import io
+import os
+import pandas as pd
+import pytest
+import construct
+from drive_upload import ReportUploader
+from report_stream import report_file_name
+from synthetic_course import FakeDrive, FakeDriveFile
+
+
+FOLDERS = {'School A': 'folderA', 'School B': 'folderB'}
+
+
+@pytest.fixture
+def master():
+    return pd.DataFrame({'Email': [f'student{i}@example.ca' for i in range(6)], 'Group': ['School A', 'School B'] * 3,
+                         'Progress': [i / 10 for i in range(6)]})
+
+
+def uploaded(drive, folder_id, file_name):
+    files = [file for file in drive.files.values() if file['title'] == file_name and file['parents'][0]['id'] == folder_id]
+    assert len(files) == 1
+    return files[0].content.getvalue()
+
+
+def test_parquet_reports_are_uploaded_from_their_local_copy(master, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    course = construct.Course('Course', None, None, None, None, None)
+    partner_df = pd.DataFrame({'Group': list(FOLDERS), 'Course': [f'https://drive.google.com/drive/folders/{f}?usp=sharing' for f in FOLDERS.values()]})
+    drive = FakeDrive()
+    set_from = []
+    monkeypatch.setattr(FakeDriveFile, 'SetContentFile', lambda self, filename, set_content=FakeDriveFile.SetContentFile: set_from.append(filename) or set_content(self, filename))
+
+    results = construct.write_group_reports(partner_df, master, course, drive=drive, fmt='parquet')
+
+    assert results == {'School A': 'created', 'School B': 'created'}
+    for group, folder_id in FOLDERS.items():
+        file_name = report_file_name(group, 'parquet')
+        local_path = os.path.join('Course', 'Reports', file_name)
+        with open(local_path, 'rb') as f:
+            assert uploaded(drive, folder_id, file_name) == f.read()
+        report = pd.read_parquet(io.BytesIO(uploaded(drive, folder_id, file_name)))
+        pd.testing.assert_frame_equal(report, master.loc[master['Group'] == group].reset_index(drop=True))
+    assert sorted(set_from) == [os.path.join('Course', 'Reports', report_file_name(group, 'parquet')) for group in FOLDERS]
+
+
+def test_binary_reports_without_a_local_copy(master):
+    drive = FakeDrive()
+    data = master.to_parquet(index=False)
+    uploader = ReportUploader(drive)
+
+    assert uploader.upload_all([('School A', 'folderA', 'School A Progress Report.parquet', data)]) == {'School A': 'created'}
+    assert uploaded(drive, 'folderA', 'School A Progress Report.parquet') == data
+
+    # Unchanged content is recognized from the Drive checksum
+    assert uploader.upload_all([('School A', 'folderA', 'School A Progress Report.parquet', data)]) == {'School A': 'unchanged'}
+    assert drive.uploads == 1
+
+
+def test_csv_reports_are_updated_in_place(master):
+    drive = FakeDrive()
+    uploader = ReportUploader(drive)
+    file_name = report_file_name('School A')
+
+    uploader.upload_all([('School A', 'folderA', file_name, master.to_csv(index=None).encode('utf-8'))])
+    changed = master.assign(Progress=1.0).to_csv(index=None).encode('utf-8')
+    assert uploader.upload_all([('School A', 'folderA', file_name, changed)]) == {'School A': 'updated'}
+
+    assert len(drive.files) == 1
+    assert uploaded(drive, 'folderA', file_name) == changed
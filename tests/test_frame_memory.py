@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+import frame_memory
+from frame_memory import configure_pandas, compact_columns
+
+
+@pytest.mark.parametrize('version, expected', [('2.0.3', {'mode.copy_on_write': True}), ('2.2.3', {'mode.copy_on_write': True}), ('3.0.0', {})])
+def test_configure_pandas_only_enables_copy_on_write(monkeypatch, version, expected):
+    options = {}
+    monkeypatch.setattr(frame_memory.pd, '__version__', version)
+    monkeypatch.setattr(frame_memory.pd, 'set_option', lambda key, value: options.__setitem__(key, value))
+
+    configure_pandas()
+
+    # String inference would change every text column in the process, not only the compacted ones
+    assert options == expected
+
+
+def test_compact_columns_only_converts_text():
+    df = pd.DataFrame({
+        'Email': pd.Series([f'student{i}@example.ca' for i in range(10)], dtype=object),
+        'Answer': pd.Series(['Yes', 'No'] * 5, dtype=object),
+        'Mixed': pd.Series(['1', 2] * 5, dtype=object),
+        'Count': range(10),
+    })
+
+    compacted = compact_columns(df)
+
+    assert isinstance(compacted['Answer'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_string_dtype(compacted['Email'].dtype)
+    assert compacted['Mixed'].dtype == object
+    assert compacted['Count'].dtype == df['Count'].dtype
+    # The input frame is left as it was
+    assert df['Email'].dtype == object and df['Answer'].dtype == object
+    pd.testing.assert_frame_equal(compacted.astype(object), df.astype(object))
@@ -0,0 +1,164 @@
+import re
+import construct
+from imap_ingest import load_watermark, search_uids
+import pytest
+
+
+BODY = 'Hi\r\nClick here\r\n( https://example.com/{} )\n to download\r\n'
+MIME = b'Content-Type: text/plain; charset=utf-8\r\n\r\n'
+
+
+class FakeMailbox():
+    '''
+    In-memory stand-in for a selected imaplib.IMAP4 mailbox, supporting the UID commands used by imap_ingest
+    '''
+    def __init__(self, messages, uidvalidity=11):
+        self.messages = {uid: {'subject': subject, 'body': body, 'seen': False} for uid, (subject, body) in messages.items()}
+        self.uidvalidity = uidvalidity
+        self.logged_out = False
+
+    def select(self, mailbox='INBOX'):
+        return 'OK', [str(len(self.messages)).encode()]
+
+    def response(self, code):
+        return 'OK', [str(self.uidvalidity).encode()]
+
+    def uid(self, command, *args):
+        if command == 'search':
+            return 'OK', [b' '.join(str(uid).encode() for uid in self.__search(args[1:]))]
+        if command == 'store':
+            self.messages[int(args[0])]['seen'] = True
+            return 'OK', [None]
+        if command == 'fetch':
+            data = []
+            for number, uid in enumerate(args[0].split(',')):
+                message = self.messages[int(uid)]
+                subject = f"Subject: {message['subject']}\r\n\r\n".encode()
+                body = message['body'].encode()
+                data += [(f'{number + 1} (UID {uid} BODY[HEADER.FIELDS (SUBJECT)] {{{len(subject)}}}'.encode(), subject),
+                         (f' BODY[1.MIME] {{{len(MIME)}}}'.encode(), MIME),
+                         (f' BODY[1] {{{len(body)}}}'.encode(), body), b')']
+            return 'OK', data
+        raise ValueError(command)
+
+    def __search(self, criteria):
+        uids = sorted(self.messages)
+        for criterion in criteria:
+            match = re.match(r'UID (\d+):\*', criterion)
+            if match:
+                # Like a real server, 'n:*' also matches the newest message
+                uids = [uid for uid in uids if uid >= int(match.group(1)) or uid == max(self.messages)]
+            elif criterion == 'UNSEEN':
+                uids = [uid for uid in uids if not self.messages[uid]['seen']]
+        return uids
+
+    def close(self):
+        pass
+
+    def logout(self):
+        self.logged_out = True
+
+
+def course(name):
+    return construct.Course(name, None, None, None, None, None)
+
+
+def test_search_skips_seen_and_processed_messages():
+    mail = FakeMailbox({3: ('Export', ''), 5: ('Export', ''), 9: ('Export', '')})
+    mail.messages[9]['seen'] = True
+    assert search_uids(mail, None) == [3, 5]
+    assert search_uids(mail, 3) == [5]
+    assert search_uids(mail, 9) == []
+
+
+def read_links(course_name, mail, state_path, downloaded=None, groups=None):
+    '''
+    Reads the export links of a course, reporting every link, or those in downloaded, as downloaded.
+    '''
+    links = []
+    with construct.get_email_link('user', 'pw', course(course_name), mail=mail, state_path=state_path, groups=groups) as emails:
+        for entry in emails:
+            links.append(entry[0])
+            if downloaded is None or entry[0] in downloaded:
+                emails.downloaded(entry)
+    return links
+
+
+def test_exports_consumed_by_one_course_are_not_ingested_by_the_next(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    mail = FakeMailbox({uid: ('Export: Group Report', BODY.format(uid)) for uid in (4, 6, 8)})
+
+    assert read_links('Course A', mail, state_path) == [f'https://example.com/{uid}' for uid in (4, 6, 8)]
+    assert load_watermark('user/INBOX', state_path) == (11, 8)
+
+    # A second course sharing the mailbox finds nothing new, and the connection is still closed
+    mail.logged_out = False
+    with pytest.raises(construct.NoExportEmails):
+        read_links('Course B', mail, state_path)
+    assert mail.logged_out
+
+    mail.messages[10] = {'subject': 'Export: Group Report', 'body': BODY.format(10), 'seen': False}
+    assert read_links('Course B', mail, state_path) == ['https://example.com/10']
+
+
+def test_emails_are_only_consumed_once_downloaded(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    mail = FakeMailbox({uid: ('Export: Group Report', BODY.format(uid)) for uid in (1, 2, 3)})
+
+    with construct.get_email_link('user', 'pw', course('Course A'), mail=mail, state_path=state_path) as emails:
+        entries = list(emails)
+        # Reading every link consumes nothing
+        assert load_watermark('user/INBOX', state_path) == (None, None)
+        assert not any(message['seen'] for message in mail.messages.values())
+
+        # The watermark only moves past emails below which every email is downloaded
+        emails.downloaded(entries[1])
+        assert mail.messages[2]['seen']
+        assert load_watermark('user/INBOX', state_path) == (None, None)
+        emails.downloaded(entries[0])
+        assert load_watermark('user/INBOX', state_path) == (11, 2)
+
+    assert read_links('Course A', mail, state_path) == ['https://example.com/3']
+
+
+def test_interrupted_run_resumes_after_last_downloaded_email(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    mail = FakeMailbox({uid: ('Export: Group Report', BODY.format(uid)) for uid in (1, 2, 3)})
+
+    with construct.get_email_link('user', 'pw', course('Course A'), mail=mail, state_path=state_path) as emails:
+        reader = iter(emails)
+        emails.downloaded(next(reader))
+        next(reader)
+
+    assert read_links('Course A', mail, state_path) == ['https://example.com/2', 'https://example.com/3']
+
+
+def test_export_of_another_course_is_not_mistaken_for_missing_emails(tmp_path):
+    mail = FakeMailbox({1: ('Export: Survey Results For Course B Winter 2023 - Welcome', BODY.format(1))})
+    with pytest.raises(SystemExit) as exit_info:
+        read_links('Course A Winter 2023', mail, str(tmp_path / 'state.json'))
+    assert not isinstance(exit_info.value, construct.NoExportEmails)
+    assert exit_info.value.code == 1
+    assert mail.logged_out
+
+
+def test_batch_course_leaves_the_exports_of_other_courses_unread(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    mail = FakeMailbox({1: ('Export: Progress Report for Course B Winter 2023', BODY.format(1)),
+                        2: ('Export: Progress Report for School 1', BODY.format(2)),
+                        3: ('Export: Survey Results For Course B Winter 2023 - Welcome', BODY.format(3)),
+                        4: ('Export: Users', BODY.format(4))})
+
+    assert read_links('Course A Winter 2023', mail, state_path, groups=['School 1']) == ['https://example.com/2', 'https://example.com/4']
+    assert [uid for uid, message in mail.messages.items() if not message['seen']] == [1, 3]
+    assert load_watermark('user/INBOX', state_path) == (None, None)
+
+    assert read_links('Course B Winter 2023', mail, state_path, groups=['School 2']) == ['https://example.com/1', 'https://example.com/3']
+    assert load_watermark('user/INBOX', state_path) == (11, 3)
+    assert not any(not message['seen'] for message in mail.messages.values())
+
+
+def test_export_name_reads_the_course_or_group_from_the_subject():
+    assert construct.export_name('Export: Progress Report for School\r\n 1') == 'School 1'
+    assert construct.export_name('Export: Survey Results For Course B Winter 2023 - Welcome') == 'Course B Winter 2023'
+    assert construct.export_name('Export: Users') is None
@@ -0,0 +1,136 @@
+import os
+import pytest
+import initiate_exports
+from initiate_exports import parse_report_table, next_page_url
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+GROUPS_URL = 'https://programs.techstewardship.com/manage/reports/groups'
+PAGES = {
+    GROUPS_URL: 'groups_page1.html',
+    f'{GROUPS_URL}?page=2': 'groups_page2.html',
+    initiate_exports.REPORTS_URL: 'course_reports.html',
+}
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+class FixtureDriver():
+    '''
+    Stand-in for a selenium driver serving the saved report pages.
+    '''
+    def __init__(self):
+        self.visited = []
+        self.clicked = 0
+
+    def get(self, url):
+        self.visited.append(url)
+
+    @property
+    def page_source(self):
+        return fixture(PAGES[self.visited[-1]])
+
+
+class FixtureWait():
+    def __init__(self, driver):
+        self.driver = driver
+
+    def until(self, condition):
+        return self
+
+    def click(self):
+        self.driver.clicked += 1
+
+
+def test_parse_report_table_reads_names_and_absolute_links():
+    rows = parse_report_table(fixture('groups_page1.html'), 'td[2]/div/div/div/a/@href', GROUPS_URL)
+
+    # Rows without an export link are skipped
+    assert rows == {
+        'University of Toronto': 'https://programs.techstewardship.com/manage/reports/groups/1001',
+        'McGill University': 'https://programs.techstewardship.com/manage/reports/groups/1002',
+    }
+
+
+def test_next_page_url():
+    assert next_page_url(fixture('groups_page1.html'), GROUPS_URL) == f'{GROUPS_URL}?page=2'
+    assert next_page_url(fixture('groups_page2.html'), f'{GROUPS_URL}?page=2') is None
+    assert next_page_url(fixture('course_reports.html'), initiate_exports.REPORTS_URL) is None
+
+
+def test_groups_collects_wanted_links_across_pages():
+    driver = FixtureDriver()
+    groups = getattr(initiate_exports, '__groups')
+
+    links = groups(['McGill University', 'University of Waterloo', 'Unknown College'], driver, None)
+
+    assert links == [
+        'https://programs.techstewardship.com/manage/reports/groups/1002.csv',
+        'https://programs.techstewardship.com/manage/reports/groups/1004.csv',
+    ]
+    # Each page is loaded once
+    assert driver.visited == [GROUPS_URL, f'{GROUPS_URL}?page=2']
+
+
+@pytest.mark.parametrize('name, found', [('Tech Stewardship Practice Program (Winter 2024)', True), ('Retired Course', False)])
+def test_progress_opens_the_course_report(name, found):
+    driver = FixtureDriver()
+    course = type('Course', (), {'name': name})
+
+    assert getattr(initiate_exports, '__progress')(driver, FixtureWait(driver), course) is found
+    if found:
+        assert driver.visited[-1] == 'https://programs.techstewardship.com/manage/reports/courses/2002'
+    assert driver.clicked == int(found)
+
+
+class ExportResponse():
+    def __init__(self, status_code, url):
+        self.status_code = status_code
+        self.url = url
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class ExportSession():
+    '''
+    Stand-in for the HTTP session triggering exports, answering every link with the given status and final URL.
+    '''
+    def __init__(self, status_code, url=None):
+        self.status_code = status_code
+        self.url = url
+        self.requests = []
+
+    def get(self, link, **kwargs):
+        self.requests.append(link)
+        return ExportResponse(self.status_code, self.url or link)
+
+
+@pytest.fixture
+def trigger_export(monkeypatch):
+    monkeypatch.setattr(initiate_exports, 'sleep', lambda seconds: None)
+    return getattr(initiate_exports, '__trigger_export')
+
+
+def test_trigger_export_accepts_the_export(trigger_export):
+    assert trigger_export(ExportSession(200), f'{GROUPS_URL}/1001.csv') is True
+
+
+def test_trigger_export_retries_server_errors(trigger_export):
+    session = ExportSession(503)
+    assert trigger_export(session, f'{GROUPS_URL}/1001.csv', retries=3) is False
+    assert len(session.requests) == 3
+
+
+def test_trigger_export_rejects_a_redirect_to_sign_in(trigger_export):
+    # An expired session lands on the sign in page, which answers 200
+    session = ExportSession(200, url=f'{initiate_exports.SIGNIN_URL}?redirect=export')
+    with pytest.raises(RuntimeError, match='sign in'):
+        trigger_export(session, f'{GROUPS_URL}/1001.csv')
+    assert len(session.requests) == 1
@@ -0,0 +1,37 @@
+import sys
+import pytest
+import instrumentation
+from instrumentation import RunReport
+
+
+MB = 2 ** 20
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='resident memory is read from /proc')
+def test_stage_memory_is_measured_over_the_stage():
+    report = RunReport()
+    held = []
+
+    with report.stage('allocate', course='Course'):
+        held.append(bytearray(64 * MB))
+    with report.stage('idle', course='Course'):
+        pass
+
+    allocate, idle = report.stages
+    assert allocate['rss_end'] - allocate['rss_start'] >= 48 * MB
+    # The process-wide peak still includes the earlier allocation, the stage's own change does not
+    assert abs(idle['rss_end'] - idle['rss_start']) < 16 * MB
+    assert idle['peak_rss'] >= allocate['rss_start'] + 48 * MB
+
+
+def test_summary_without_memory_figures(monkeypatch, capsys):
+    monkeypatch.setattr(instrumentation, 'current_rss', lambda: None)
+    monkeypatch.setattr(instrumentation, 'peak_rss', lambda: None)
+    report = RunReport()
+
+    with report.stage('progress', course='Course', rows_in=10) as record:
+        record['rows_out'] = 8
+    report.print_summary()
+
+    line = next(line for line in capsys.readouterr().out.splitlines() if line.startswith('progress'))
+    assert line.split() == ['progress', 'Course', 'run', '0.00', '10', '8']
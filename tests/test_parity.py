@@ -0,0 +1,198 @@
+'''
+Parity of the vectorized report stages with the per-student loops they replaced, run against the
+in-memory Sheets stand-in of synthetic_course.
+'''
+import random
+from datetime import datetime
+from functools import reduce
+import pandas as pd
+import pytest
+import construct
+from report_rules import load_config, CONFIG_PATH
+from submission_index import SubmissionIndex
+from synthetic_course import FakeSheetsClient
+
+
+SURVEY_URL = 'https://docs.google.com/spreadsheets/d/survey/edit'
+ATTENDANCE_URL = 'https://docs.google.com/spreadsheets/d/attendance/edit'
+MODULE_QUESTIONS = {
+    'Share a Story 1': ['What kind of story do you want to share this week?', 'Describe the situation',
+                        'How does this relate to tech stewardship?', 'What opportunities do you see?', 'Thank you for sharing'],
+    'Advance Understanding': ['What questions are you currently exploring?', 'What stood out to you?', 'How was this module?'],
+    'Career Management': ['Describe a situation', 'What new opportunity did you find?', 'What small action will you take?'],
+    'Welcome Survey': ['Which best describes you?', 'Token'],
+}
+
+
+def loop_concat_answers(df, module_name):
+    # The column selection of the original concat_answers
+    module_name = module_name.lower()
+    if 'share a story' in module_name:
+        concat_list = ['what kind of story do you want to share this week?', 'describe the situation', 'how does', 'what opportunities']
+    elif 'advance understanding' in module_name or 'deliberate values' in module_name:
+        concat_list = ['what questions are you currently', 'what stood', 'how was']
+    elif 'career management' in module_name:
+        concat_list = ['situation', 'new opportunity', 'small action']
+    else:
+        return df
+    df = df.copy()
+    df['concat_answers'] = df.apply(lambda x: ' '.join(x[col] for col in df.columns if any(term in col.lower() for term in concat_list)), axis=1)
+    return df
+
+
+def loop_add_quiz_answers(master_progress, course, gc):
+    '''
+    The original per-student, per-module implementation of construct.add_quiz_answers.
+    '''
+    survey = gc.open_by_url(course.data_url)
+    module_names = [str(sheet.title).split(' - ', 1)[1] for sheet in survey.worksheets()]
+    answers = [pd.DataFrame(sheet.get_all_records()) for sheet in survey.worksheets()]
+    zipped_df = list(zip(module_names, answers))
+
+    answers_master = pd.DataFrame()
+    for index, row in master_progress.iterrows():
+        user_email = row['Email']
+        user_answers = [pd.DataFrame([user_email], columns=['email'])]
+        for module_name, df in zipped_df:
+            try:
+                answer_list = df.loc[df['email'] == user_email]
+            except KeyError:
+                continue
+
+            if answer_list.shape[0] > 1:
+                submission_dates = answer_list['Submitted At'].to_list()
+                formatted_submission_dates = [datetime.strptime(date, '%m/%d/%Y %H:%M:%S') for date in submission_dates]
+                latest_date = max(formatted_submission_dates).strftime('%-m/%-d/%Y %-H:%M:%S')
+                answer_list = answer_list.loc[answer_list['Submitted At'] == latest_date]
+            elif answer_list.empty:
+                continue
+
+            answer_list = loop_concat_answers(answer_list, module_name)
+            answer_list.columns = [f'{module_name}_' + str(col) if str(col) != 'email' else str(col) for col in answer_list.columns]
+            user_answers.append(answer_list)
+
+        user_answers = reduce(lambda x, y: pd.merge(x, y, on='email') if not y.empty else x, user_answers)
+        answers_master = pd.concat([answers_master, user_answers], ignore_index=True)
+
+    answers_master.rename(columns={'email': 'Email'}, inplace=True)
+    return pd.merge(master_progress, answers_master, on='Email')
+
+
+def loop_add_attendance(master_progress, course, gc):
+    '''
+    The original per-student implementation of construct.add_attendance.
+    '''
+    sheets = gc.open_by_url(course.attendance_url).worksheets()
+    att_df = pd.concat([pd.DataFrame(sheet.get_all_records()).assign(Date=str(sheet.title).strip('TSPS - ')) for sheet in sheets], ignore_index=True)
+    for index, row in master_progress.iterrows():
+        att_list = set(att_df.loc[att_df['Email'] == row['Email']]['Date'].values)
+        master_progress.at[index, 'Attendance Count'] = len(att_list)
+        for date in att_list:
+            master_progress.at[index, f'Attendance - {date}'] = 'ATTENDED'
+
+    return master_progress
+
+
+def comparable(df):
+    df = df.drop_duplicates()
+    df = df[sorted(df.columns)].astype(str)
+    return df.sort_values(['Email', 'Group']).reset_index(drop=True)
+
+
+def survey_sheets(emails, seed=0):
+    '''
+    Builds survey worksheets with repeated submissions. Times are unpadded like the sheet exports, and
+    unique per student, so the original string match on the latest time selects a single row.
+    '''
+    rng = random.Random(seed)
+    sheets = {}
+    for m, (module, questions) in enumerate(MODULE_QUESTIONS.items()):
+        records = []
+        for email in rng.sample(emails, int(len(emails) * 0.7)) + ['not.enrolled@example.ca']:
+            for day in rng.sample(range(1, 28), rng.choice([1, 1, 2, 3])):
+                record = {'email': email, 'Submitted At': f'{rng.randint(1, 12)}/{day}/2023 {rng.randint(0, 23)}:{rng.randint(10, 59)}:05'}
+                record.update({question: f'{question[:8]} {rng.randint(0, 50)}' for question in questions})
+                records.append(record)
+        sheets[f'{m + 1:02d} - {module}'] = records
+    sheets['05 - Not Yet Opened'] = []
+    return sheets
+
+
+def attendance_sheets(emails, seed=0):
+    '''
+    Builds a sheet of sign ins per session, with repeated sign ins and drop ins from outside the course.
+    '''
+    rng = random.Random(seed)
+    sheets = {}
+    for day in range(1, 9):
+        signed_in = rng.sample(emails, int(len(emails) * 0.4)) + rng.sample(emails, 5) + ['drop.in@example.ca']
+        sheets[f'TSPS - 2023-09-{day:02d}'] = [{'First name': email.split('@')[0], 'Last name': 'Student', 'Email': email,
+                                                'Submitted At': f'9/{day}/2023 18:{i % 60}:00'} for i, email in enumerate(signed_in)]
+    return sheets
+
+
+@pytest.fixture
+def course():
+    return construct.Course('Parity Course', SURVEY_URL, ATTENDANCE_URL, None, None, None)
+
+
+@pytest.fixture
+def master():
+    emails = [f'student{i}@example.ca' for i in range(80)]
+    master = pd.DataFrame({'First Name': [f'First{i}' for i in range(80)], 'Email': emails, 'Group': 'School A'})
+    # Students in a second group get a row per group
+    return pd.concat([master, master.iloc[:15].assign(Group='School B')], ignore_index=True)
+
+
+def test_quiz_answers_match_the_per_student_loop(course, master, tmp_path):
+    gc = FakeSheetsClient({SURVEY_URL: survey_sheets(list(master['Email'].unique()))})
+    rules = load_config(CONFIG_PATH)['concat_answers']
+
+    expected = loop_add_quiz_answers(master.copy(), course, gc)
+    actual = construct.add_quiz_answers(master.copy(), course, gc, rules, SubmissionIndex(str(tmp_path / 'submissions.json')))
+
+    pd.testing.assert_frame_equal(comparable(actual), comparable(expected))
+
+
+def test_quiz_answers_are_unchanged_when_read_through_the_submission_index(course, master, tmp_path):
+    gc = FakeSheetsClient({SURVEY_URL: survey_sheets(list(master['Email'].unique()), seed=1)})
+    rules = load_config(CONFIG_PATH)['concat_answers']
+    path = str(tmp_path / 'submissions.json')
+
+    first = construct.add_quiz_answers(master.copy(), course, gc, rules, SubmissionIndex(path))
+    again = construct.add_quiz_answers(master.copy(), course, gc, rules, SubmissionIndex(path))
+    pd.testing.assert_frame_equal(comparable(again), comparable(first))
+
+
+def test_attendance_matches_the_per_student_loop(course, master):
+    gc = FakeSheetsClient({ATTENDANCE_URL: attendance_sheets(list(master['Email'].unique()))})
+
+    expected = loop_add_attendance(master.copy(), course, gc)
+    actual = construct.add_attendance(master.copy(), course, gc)
+
+    # The loop stored counts through .at on a new column, which made them floats
+    expected['Attendance Count'] = expected['Attendance Count'].astype(int)
+    assert actual['Attendance Count'].dtype == int
+    pd.testing.assert_frame_equal(comparable(actual), comparable(expected))
+
+
+def test_column_plan_is_reused_from_the_course_checkpoints(tmp_path, monkeypatch):
+    columns = ('Email', 'Group', 'Token', 'Share a Story 1_Thank you for sharing', 'Share a Story 1_concat_answers', 'First Name')
+    path = str(tmp_path / construct.COLUMN_PLANS_FILE)
+    plan = construct.column_plan(columns, path)
+    assert plan[:3] == ('First Name', 'Last Name', 'Email')
+    assert 'Token' not in plan
+
+    def replanned(columns):
+        raise AssertionError('planned again')
+
+    # A later run with the same columns reads the plan instead of planning
+    monkeypatch.setattr(construct, '__plan_columns', replanned)
+    assert construct.column_plan(columns, path) == plan
+    with pytest.raises(AssertionError):
+        construct.column_plan(columns + ('Notes',), path)
+
+
+def test_report_config_is_found_from_any_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert set(load_config()) >= {'eligibility', 'concat_answers'}
@@ -0,0 +1,35 @@
+import pytest
+from report_loader import read_report, ReportInventory
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_read_report_keeps_values_as_text(tmp_path):
+    df = read_report(write(tmp_path / 'Progress Report_Course.csv', 'Email,Percentage Completed\na@example.ca,007\n'))
+
+    assert df.loc[0, 'Percentage Completed'] == '007'
+
+
+def test_read_report_without_a_requested_column(tmp_path):
+    assert read_report(write(tmp_path / 'Group_A.csv', 'Name,Group\na,A\n'), usecols=['Email']) is None
+
+
+@pytest.mark.parametrize('text, usecols', [('', None), ('', ['Email']), ('Email,Group\na@example.ca,A\nb@example.ca,A,B,C\n', None)])
+def test_read_report_names_malformed_files(tmp_path, text, usecols):
+    path = write(tmp_path / 'Group_A.csv', text)
+
+    with pytest.raises(ValueError, match='Group_A.csv'):
+        read_report(path, usecols=usecols)
+
+
+def test_group_emails_skips_reports_without_emails(tmp_path):
+    write(tmp_path / 'Group_A.csv', 'Email,Group\na@example.ca,A\n')
+    write(tmp_path / 'Group_B.csv', 'Name,Group\nb,B\n')
+
+    emails = {group: df for group, _, df in ReportInventory(str(tmp_path)).group_emails()}
+
+    assert emails['A']['Email'].tolist() == ['a@example.ca']
+    assert emails['B'] is None
@@ -0,0 +1,107 @@
+import json
+import pickle
+import pytest
+import sheet_cache
+from sheet_cache import SheetCache
+from synthetic_course import FakeSheetsClient
+
+
+URL = 'https://docs.google.com/spreadsheets/d/attendance/edit#gid=0'
+
+
+def records(name, rows=20):
+    return [{'Email': f'{name}{i}@example.ca', 'Attended': i % 2} for i in range(rows)]
+
+
+class CountingClient(FakeSheetsClient):
+    '''
+    FakeSheetsClient counting how often each spreadsheet is opened
+    '''
+    def __init__(self, spreadsheets):
+        super().__init__(spreadsheets)
+        self.opened = 0
+
+    def open_by_url(self, url):
+        self.opened += 1
+        return super().open_by_url(url)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    ticks = iter(range(1, 1000))
+    monkeypatch.setattr(sheet_cache, 'time', lambda: next(ticks))
+
+
+def read(cache, title='Sheet1', url=URL):
+    return cache.open_by_url(url).worksheet(title).get_all_records()
+
+
+def test_records_are_served_from_the_cache_while_the_spreadsheet_is_unchanged(tmp_path):
+    client = FakeSheetsClient({URL: {'Sheet1': records('a')}})
+    sheet = client.open_by_url(URL).sheets[0]
+
+    assert read(SheetCache(client, str(tmp_path))) == records('a')
+    assert read(SheetCache(client, str(tmp_path))) == records('a')
+    assert sheet.calls == 1
+
+
+def test_a_new_revision_invalidates_the_cached_records(tmp_path):
+    client = FakeSheetsClient({URL: {'Sheet1': records('a')}})
+    spreadsheet = client.open_by_url(URL)
+    read(SheetCache(client, str(tmp_path)))
+
+    spreadsheet.lastUpdateTime = '2023-02-01T00:00:00.000Z'
+    spreadsheet.sheets[0].records = records('b')
+    assert read(SheetCache(client, str(tmp_path))) == records('b')
+    assert spreadsheet.sheets[0].calls == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    client = FakeSheetsClient({URL: {title: records(title) for title in ('first', 'second', 'third')}})
+    size = len(pickle.dumps(records('first')))
+    cache = SheetCache(client, str(tmp_path), max_bytes=2 * size)
+
+    read(cache, 'first')
+    read(cache, 'second')
+    read(cache, 'first')
+    read(cache, 'third')
+
+    assert sorted(key.split('/')[1] for key in cache.manifest['entries']) == ['first', 'third']
+    assert len([path for path in tmp_path.iterdir() if path.name != 'manifest.json']) == 2
+
+
+def test_offline_reads_only_serve_cached_worksheets(tmp_path):
+    client = FakeSheetsClient({URL: {'Sheet1': records('a'), 'Other': records('b')}})
+    read(SheetCache(client, str(tmp_path)))
+
+    offline = SheetCache(None, str(tmp_path), offline=True)
+    assert read(offline) == records('a')
+    with pytest.raises(FileNotFoundError):
+        read(offline, 'Other')
+    with pytest.raises(FileNotFoundError):
+        read(offline, url='https://docs.google.com/spreadsheets/d/unknown/edit')
+
+
+def test_revision_reuses_the_opened_spreadsheet(tmp_path):
+    client = CountingClient({URL: {'Sheet1': records('a')}})
+    cache = SheetCache(client, str(tmp_path))
+
+    assert cache.revision(URL) == '2023-01-01T00:00:00.000Z'
+    read(cache)
+    assert client.opened == 1
+
+
+def test_cache_hits_are_saved_to_the_manifest_once_flushed(tmp_path, clock):
+    client = FakeSheetsClient({URL: {'Sheet1': records('a')}})
+    read(SheetCache(client, str(tmp_path)))
+    manifest_path = tmp_path / 'manifest.json'
+    stored = json.loads(manifest_path.read_text())
+
+    cache = SheetCache(client, str(tmp_path))
+    read(cache)
+    read(cache)
+    assert json.loads(manifest_path.read_text()) == stored
+
+    cache.flush()
+    used = json.loads(manifest_path.read_text())['entries']
+    assert [entry['last_used'] for entry in used.values()] == [3]
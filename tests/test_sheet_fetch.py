@@ -0,0 +1,110 @@
+import threading
+import time
+import pytest
+from gspread.exceptions import APIError
+import sheet_fetch
+from sheet_fetch import fetch_worksheets, with_backoff
+
+
+class FakeResponse():
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ''
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': 'Quota exceeded', 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class RecordingSpreadsheet():
+    '''
+    Stand-in for a gspread spreadsheet that records its API calls and how many reads overlap.
+    '''
+    def __init__(self, titles, delay=0.02, rate_limited=()):
+        self.titles = titles
+        self.delay = delay
+        self.rate_limited = set(rate_limited)
+        self.calls = {'worksheets': 0, 'get_all_records': 0}
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def worksheets(self):
+        self.calls['worksheets'] += 1
+        return [RecordingWorksheet(self, title) for title in self.titles]
+
+
+class RecordingWorksheet():
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+
+    def get_all_records(self):
+        spreadsheet = self.spreadsheet
+        with spreadsheet.lock:
+            spreadsheet.calls['get_all_records'] += 1
+            spreadsheet.active += 1
+            spreadsheet.max_active = max(spreadsheet.max_active, spreadsheet.active)
+            limited = self.title in spreadsheet.rate_limited
+            spreadsheet.rate_limited.discard(self.title)
+        try:
+            time.sleep(spreadsheet.delay)
+            if limited:
+                raise APIError(FakeResponse(429))
+            return [{'email': f'{self.title}@example.ca', 'Sheet': self.title}]
+        finally:
+            with spreadsheet.lock:
+                spreadsheet.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(sheet_fetch, 'sleep', lambda seconds: None)
+
+
+def test_fetch_worksheets_reads_each_sheet_once_within_the_worker_limit():
+    titles = [f'{i:02d} - Module {i}' for i in range(12)]
+    spreadsheet = RecordingSpreadsheet(titles)
+
+    sheets = fetch_worksheets(spreadsheet, max_workers=4)
+
+    assert spreadsheet.calls == {'worksheets': 1, 'get_all_records': 12}
+    assert 1 < spreadsheet.max_active <= 4
+    assert list(sheets) == titles
+    assert [df.loc[0, 'Sheet'] for df in sheets.values()] == titles
+
+
+def test_fetch_worksheets_retries_rate_limited_reads():
+    spreadsheet = RecordingSpreadsheet(['01 - A', '02 - B', '03 - C'], rate_limited=['02 - B'])
+
+    sheets = fetch_worksheets(spreadsheet)
+
+    assert spreadsheet.calls['get_all_records'] == 4
+    assert sheets['02 - B'].loc[0, 'Sheet'] == '02 - B'
+
+
+def test_fetch_worksheets_of_an_empty_spreadsheet():
+    assert fetch_worksheets(RecordingSpreadsheet([])) == {}
+
+
+def test_with_backoff_gives_up_after_the_last_attempt():
+    attempts = []
+
+    def rate_limited():
+        attempts.append(1)
+        raise APIError(FakeResponse(429))
+
+    with pytest.raises(APIError):
+        with_backoff(rate_limited, retries=3)
+    assert len(attempts) == 3
+
+
+def test_with_backoff_does_not_retry_other_errors():
+    attempts = []
+
+    def forbidden():
+        attempts.append(1)
+        raise APIError(FakeResponse(403))
+
+    with pytest.raises(APIError):
+        with_backoff(forbidden)
+    assert len(attempts) == 1
@@ -0,0 +1,108 @@
+import random
+import pytest
+import pandas as pd
+from gspread.exceptions import APIError
+import sheet_fetch
+from sheet_writer import align_rows, dataframe_grid, write_dataframe_diff
+from synthetic_course import FakeWorksheet
+from test_sheet_fetch import FakeResponse
+
+
+def students(ids):
+    return pd.DataFrame({'First Name': [f'First{i}' for i in ids], 'Email': [f'student{i:04d}@example.ca' for i in ids],
+                         'Group': [f'School {i % 7}' for i in ids], '% Completed': [f'{i % 100}%' for i in ids]})
+
+
+def written(ids):
+    sheet = FakeWorksheet('Sheet1', [])
+    write_dataframe_diff(sheet, students(ids))
+    sheet.calls = 0
+    return sheet
+
+
+def test_student_added_near_the_top_only_writes_its_row():
+    sheet = written(range(1, 200))
+    df = students(range(0, 200))
+    summary = write_dataframe_diff(sheet, df)
+    assert sheet.get_all_values() == dataframe_grid(df)
+    assert (summary['cells'], summary['rows_inserted'], summary['students_added']) == (4, 1, 1)
+
+
+def test_student_removed_near_the_top_writes_nothing():
+    sheet = written(range(200))
+    df = students([i for i in range(200) if i != 3])
+    summary = write_dataframe_diff(sheet, df)
+    assert sheet.get_all_values() == dataframe_grid(df)
+    assert (summary['cells'], summary['rows_deleted'], summary['students_removed']) == (0, 1, 1)
+
+
+def test_shrinking_sheet_counts_every_removed_student():
+    sheet = written(range(100))
+    df = students(range(90))
+    summary = write_dataframe_diff(sheet, df)
+    assert sheet.get_all_values() == dataframe_grid(df)
+    assert summary['students_removed'] == 10
+
+
+def test_mixed_changes_produce_the_target_grid():
+    rng = random.Random(0)
+    before = rng.sample(range(500), 300)
+    after = sorted(set(rng.sample(before, 250)) | set(rng.sample(range(500, 600), 40)))
+    sheet = written(sorted(before))
+    df = students(after).assign(**{'% Completed': lambda d: d['% Completed'].where(d.index % 11 != 0, '100%')})
+    write_dataframe_diff(sheet, df)
+    assert sheet.get_all_values() == dataframe_grid(df)
+
+
+def test_dry_run_leaves_the_sheet_untouched():
+    sheet = written(range(50))
+    before = [list(row) for row in sheet.get_all_values()]
+    summary = write_dataframe_diff(sheet, students(range(1, 60)), dry_run=True)
+    assert sheet.get_all_values() == before and sheet.calls == 0
+    assert (summary['students_added'], summary['students_removed']) == (10, 1)
+
+
+def test_align_rows_keeps_the_longest_ordered_run():
+    assert align_rows(list('abcdef'), list('xabcyf')) == [None, 0, 1, 2, None, 5]
+    assert align_rows(list('abc'), list('cab')) == [None, 0, 1]
+
+
+def test_cells_displayed_differently_are_not_rewritten():
+    df = pd.DataFrame({'Email': ['a@example.ca', 'b@example.ca'], 'Score': ['1.50', '007'],
+                       '% Completed': ['10%', '12.50%'], 'Passed': ['TRUE', 'false']})
+    sheet = FakeWorksheet('Sheet1', [])
+    write_dataframe_diff(sheet, df)
+    assert sheet.get_all_values()[1:] == [['a@example.ca', '1.5', '10%', 'TRUE'], ['b@example.ca', '7', '12.5%', 'FALSE']]
+    summary = write_dataframe_diff(sheet, df)
+    assert summary['cells'] == 0
+
+
+def test_changed_number_is_rewritten():
+    sheet = FakeWorksheet('Sheet1', [])
+    write_dataframe_diff(sheet, pd.DataFrame({'Email': ['a@example.ca'], 'Score': ['1.50']}))
+    summary = write_dataframe_diff(sheet, pd.DataFrame({'Email': ['a@example.ca'], 'Score': ['1.51']}))
+    assert summary['cells'] == 1 and sheet.get_all_values()[1] == ['a@example.ca', '1.51']
+
+
+@pytest.mark.parametrize('status, attempts', [(500, 1), (429, 2)])
+def test_row_insertions_are_only_retried_when_rate_limited(monkeypatch, status, attempts):
+    monkeypatch.setattr(sheet_fetch, 'sleep', lambda seconds: None)
+    sheet = written(range(1, 20))
+    calls = []
+    insert = sheet.spreadsheet.batch_update
+
+    def failing_once(body):
+        calls.append(body)
+        if len(calls) == 1:
+            raise APIError(FakeResponse(status))
+        insert(body)
+
+    monkeypatch.setattr(sheet.spreadsheet, 'batch_update', failing_once)
+    df = students(range(0, 20))
+    if attempts == 1:
+        with pytest.raises(APIError):
+            write_dataframe_diff(sheet, df)
+    else:
+        write_dataframe_diff(sheet, df)
+        assert sheet.get_all_values() == dataframe_grid(df)
+    assert len(calls) == attempts
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+import pytest
+import construct
+from report_loader import ReportInventory
+from synthetic_course import FakeSheetsClient
+from thinkific_source import ThinkificSource, ThinkificInventory
+
+
+ENROLLMENTS = [{'id': i, 'user_id': 100 + i, 'user_email': f'u{i}@example.ca', 'percentage_completed': i / 10,
+                'activated_at': '2023-01-01'} for i in range(1, 8)]
+USERS = {str(100 + i): {'id': 100 + i, 'first_name': f'First{i}', 'last_name': f'Last{7 - i}', 'email': f'u{i}@example.ca'}
+         for i in range(1, 8)}
+GROUPS = [{'id': 1, 'name': 'alpha school'}, {'id': 2, 'name': 'Beta'}, {'id': 3, 'name': 'Other Site Group'}]
+MEMBERS = {'1': ['u1@example.ca', 'u2@example.ca', 'u3@example.ca'], '2': ['u3@example.ca', 'u5@example.ca'],
+           '3': ['u6@example.ca', 'u7@example.ca']}
+
+
+class FakeThinkific(BaseHTTPRequestHandler):
+    '''
+    Local stand-in for the Thinkific public API, rate limiting the first enrollments request
+    '''
+    calls = []
+    rate_limited = 1
+    enrollments = ENROLLMENTS
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        FakeThinkific.calls.append((url.path, query))
+        assert self.headers['X-Auth-API-Key'] == 'key'
+
+        if url.path == '/enrollments' and FakeThinkific.rate_limited > 0:
+            FakeThinkific.rate_limited -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+
+        if url.path.startswith('/users/'):
+            return self.reply(USERS[url.path.split('/')[-1]])
+        if url.path == '/courses':
+            items = [{'id': 9, 'name': 'Course A'}] + [{'id': i, 'name': f'Course {i}'} for i in range(20)]
+        elif url.path == '/enrollments':
+            items = [] if 'query[updated_after]' in query else FakeThinkific.enrollments
+        elif url.path == '/groups':
+            items = GROUPS
+        elif url.path == '/users' and 'query[group_id]' in query:
+            items = [{'email': email} for email in MEMBERS[query['query[group_id]']]]
+        elif url.path == '/users':
+            items = list(USERS.values()) + [{'id': 200 + i, 'first_name': 'Other', 'email': f'other{i}@example.ca'} for i in range(5)]
+
+        limit, page = int(query['limit']), int(query['page'])
+        pages = max(1, -(-len(items) // limit))
+        self.reply({'items': items[(page - 1) * limit:page * limit],
+                    'meta': {'pagination': {'current_page': page, 'total_pages': pages}}})
+
+    def reply(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def source():
+    FakeThinkific.calls, FakeThinkific.rate_limited, FakeThinkific.enrollments = [], 1, ENROLLMENTS
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeThinkific)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield ThinkificSource('key', 'subdomain', base_url=f'http://127.0.0.1:{server.server_port}', page_size=3)
+    server.shutdown()
+
+
+def test_list_reads_every_page(source):
+    assert len(source.course_names()) == 21
+    assert source.course_id('Course A') == 9
+    assert {int(query['page']) for path, query in FakeThinkific.calls if path == '/courses'} == set(range(1, 8))
+
+
+def test_sync_is_incremental_and_retries_rate_limits(source, tmp_path):
+    state_path = str(tmp_path / 'thinkific.json')
+    inventory = ThinkificInventory(source, 'Course A', state_path)
+    report = inventory.progress_report('Course A')
+    assert list(report['Email']) == [f'u{i}@example.ca' for i in range(1, 8)]
+    assert report.loc[0, '% Completed'] == '10%'
+
+    FakeThinkific.calls.clear()
+    again = ThinkificInventory(source, 'Course A', state_path)
+    enrollment_calls = [query for path, query in FakeThinkific.calls if path == '/enrollments']
+    assert enrollment_calls and all('query[updated_after]' in query for query in enrollment_calls)
+    assert again.fingerprint() == inventory.fingerprint()
+    pd.testing.assert_frame_equal(again.progress_report('Course A'), report)
+
+
+def test_only_participant_groups_are_read_and_named_like_group_reports(source, tmp_path):
+    inventory = ThinkificInventory(source, 'Course A', str(tmp_path / 'thinkific.json'), groups=['Alpha School', 'Beta'])
+    assert dict((group, list(df['Email'])) for group, _, df in inventory.group_emails()) == {
+        'Alpha School': MEMBERS['1'], 'Beta': MEMBERS['2']}
+    assert not any(query.get('query[group_id]') == '3' for _, query in FakeThinkific.calls)
+
+
+def test_api_groups_match_the_exported_reports(source, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    course = construct.Course('Course A', None, None, None, None, None)
+    downloads = tmp_path / 'Course A' / 'Downloaded Reports'
+    downloads.mkdir(parents=True)
+    (tmp_path / 'Course A' / 'Reports').mkdir()
+
+    inventory = ThinkificInventory(source, 'Course A', str(tmp_path / 'thinkific.json'), groups=['Alpha School', 'Beta'])
+    inventory.progress_report('Course A').to_csv(downloads / 'Progress Report_Course A.csv', index=False)
+    for group in ['Alpha School', 'Beta']:
+        emails = MEMBERS['1' if group == 'Alpha School' else '2']
+        pd.DataFrame({'Email': emails}).to_csv(downloads / f'Group_Progress_{group}.csv', index=False)
+
+    from_api = construct.build_progress_report(course, inventory)
+    from_exports = construct.build_progress_report(course, ReportInventory(str(downloads)))
+    pd.testing.assert_frame_equal(from_api[['Email', 'Group']], from_exports[['Email', 'Group']])
+
+
+def test_users_are_read_from_the_listing_when_it_takes_fewer_requests(source):
+    # Seven users fit on the first three of four listing pages
+    users = source.users(range(101, 108))
+    assert {user_id: user['first_name'] for user_id, user in users.items()} == {str(100 + i): f'First{i}' for i in range(1, 8)}
+    assert not any(path.startswith('/users/') for path, _ in FakeThinkific.calls)
+
+    FakeThinkific.calls.clear()
+    assert list(source.users([107, 101])) == ['107', '101']
+    # 101 is on the first page, 107 alone is cheaper to request than the rest of the listing
+    assert [path for path, _ in FakeThinkific.calls] == ['/users', '/users/107']
+
+
+def test_full_sync_drops_deleted_enrollments(source, tmp_path):
+    state_path = str(tmp_path / 'thinkific.json')
+    ThinkificInventory(source, 'Course A', state_path)
+    FakeThinkific.enrollments = ENROLLMENTS[1:]
+
+    # Incremental syncs cannot see the deleted enrollment
+    incremental = ThinkificInventory(source, 'Course A', state_path)
+    assert 'u1@example.ca' in set(incremental.progress_report('Course A')['Email'])
+
+    full = ThinkificInventory(source, 'Course A', state_path, full_sync=True)
+    assert list(full.progress_report('Course A')['Email']) == [f'u{i}@example.ca' for i in range(2, 8)]
+
+
+def test_full_sync_runs_periodically(source, tmp_path):
+    state_path = str(tmp_path / 'thinkific.json')
+    ThinkificInventory(source, 'Course A', state_path)
+    with open(state_path) as f:
+        state = json.load(f)
+    state['full_synced_at'] = '2020-01-01T00:00:00Z'
+    with open(state_path, 'w') as f:
+        json.dump(state, f)
+
+    FakeThinkific.calls.clear()
+    ThinkificInventory(source, 'Course A', state_path)
+    assert [query for path, query in FakeThinkific.calls if path == '/enrollments'][-1].get('query[updated_after]') is None
+    with open(state_path) as f:
+        assert json.load(f)['full_synced_at'] > '2020-01-01T00:00:00Z'
+
+
+def test_api_report_does_not_delete_exported_lesson_columns(source, tmp_path):
+    url = 'https://docs.google.com/spreadsheets/d/progress/edit'
+    exported = [{'Email': 'u1@example.ca', 'Group': 'Beta', '% Completed': '10%', 'Lesson 1': 'Completed'}]
+    gc = FakeSheetsClient({url: {'Sheet1': exported}})
+    report = pd.DataFrame([{'Email': 'u1@example.ca', 'Group': 'Beta', '% Completed': '20%'}])
+
+    with pytest.raises(ValueError, match='Lesson 1'):
+        construct.write_to_gs(gc, report, url, 'Sheet1', keep_columns=True)
+    assert gc.open_by_url(url).worksheet('Sheet1').get_all_values()[1] == ['u1@example.ca', 'Beta', '10%', 'Completed']
+
+    construct.write_to_gs(gc, report.assign(**{'Lesson 1': 'Completed'}), url, 'Sheet1', keep_columns=True)
+    assert gc.open_by_url(url).worksheet('Sheet1').get_all_values()[1] == ['u1@example.ca', 'Beta', '20%', 'Completed']
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import pandas as pd
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from instrumentation import RUN_REPORT
+from random import uniform
+from time import sleep
+
+
+API_URL = 'https://api.thinkific.com/api/public/v1'
+PAGE_SIZE = 250
+API_WORKERS = 4
+API_RETRIES = 5
+BACKOFF_SECONDS = 1
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+FULL_SYNC_DAYS = 7
+PROGRESS_COLUMNS = ['First Name', 'Last Name', 'Email', 'Company', 'Last Sign In', 'Activated At',
+                    'Started At', 'Completed At', 'Expiry Date', '% Completed']
+
+
+class ThinkificSource():
+    '''
+    Client for the Thinkific public REST API. List endpoints are paged concurrently through a
+    bounded thread pool once the first page reports the page count, and rate limited or failed
+    requests are retried, honouring the Retry-After header when the API sends one.
+    '''
+    def __init__(self, api_key, subdomain, base_url=API_URL, max_workers=API_WORKERS, page_size=PAGE_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.page_size = page_size
+        self.session = requests.Session()
+        self.session.headers.update({'X-Auth-API-Key': api_key, 'X-Auth-Subdomain': subdomain,
+                                     'Content-Type': 'application/json'})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        RUN_REPORT.hook_session(self.session, 'thinkific_api')
+
+    def get(self, path, params=None, retries=API_RETRIES, backoff=BACKOFF_SECONDS):
+        '''
+        Requests a single API resource.
+
+        Args:
+        path (str): The resource path relative to the API URL, e.g. 'courses'.
+        params (Dict[str, Any]): The query parameters.
+        retries (int): The maximum number of attempts.
+        backoff (float): The initial delay in seconds, doubled after every failed attempt.
+
+        Returns:
+        Dict[str, Any]: The decoded JSON response.
+        '''
+        for attempt in range(retries):
+            try:
+                response = self.session.get(f'{self.base_url}/{path}', params=params, timeout=60)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == retries - 1:
+                    raise
+                status, response = 'no response', None
+            else:
+                status = response.status_code
+                if status not in RETRY_STATUS_CODES or attempt == retries - 1:
+                    response.raise_for_status()
+                    return response.json()
+
+            delay = backoff * 2 ** attempt + uniform(0, backoff)
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after is not None:
+                try:
+                    delay = float(retry_after)
+                except ValueError:
+                    pass
+            print(f'Thinkific API returned {status}, retrying in {delay:.1f}s...')
+            sleep(delay)
+
+    def list(self, path, params=None, first=None):
+        '''
+        Retrieves every item of a paged list endpoint.
+
+        Args:
+        path (str): The resource path relative to the API URL.
+        params (Dict[str, Any]): The query parameters, e.g. {'query[course_id]': 1}.
+        first (Dict[str, Any]): The first page, if it has already been requested.
+
+        Returns:
+        List[Dict[str, Any]]: The items of all pages, in page order.
+        '''
+        params = dict(params or {}, limit=self.page_size)
+        if first is None:
+            first = self.get(path, dict(params, page=1))
+        items = list(first['items'])
+        total_pages = first.get('meta', {}).get('pagination', {}).get('total_pages') or 1
+        if total_pages < 2:
+            return items
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, total_pages - 1)) as executor:
+            pages = executor.map(lambda page: self.get(path, dict(params, page=page)), range(2, total_pages + 1))
+            for page in pages:
+                items.extend(page['items'])
+
+        return items
+
+    def course_names(self):
+        '''
+        Returns the names of every course on Thinkific, across all pages.
+        '''
+        return {course['name'] for course in self.list('courses')}
+
+    def course_id(self, course_name):
+        for course in self.list('courses'):
+            if course['name'] == course_name:
+                return course['id']
+        raise LookupError(f'{course_name} was not found on Thinkific')
+
+    def enrollments(self, course_id, updated_after=None):
+        '''
+        Lists the enrollments of a course, optionally only those updated after a timestamp.
+
+        Args:
+        course_id (int): The Thinkific course ID.
+        updated_after (str): An ISO 8601 timestamp, or None for every enrollment.
+
+        Returns:
+        List[Dict[str, Any]]: The enrollments.
+        '''
+        params = {'query[course_id]': course_id}
+        if updated_after is not None:
+            params['query[updated_after]'] = updated_after
+        return self.list('enrollments', params)
+
+    def users(self, user_ids):
+        '''
+        Retrieves users by ID. The first page of the users listing tells how many pages the whole listing
+        takes, and the users are read from the listing when that takes fewer requests than one per user.
+
+        Returns:
+        Dict[str, Dict[str, Any]]: The users keyed by their ID as text.
+        '''
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        if not user_ids:
+            return {}
+
+        first = self.get('users', {'limit': self.page_size, 'page': 1})
+        found = {str(user['id']): user for user in first['items']}
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        total_pages = first.get('meta', {}).get('pagination', {}).get('total_pages') or 1
+
+        if missing and total_pages - 1 < len(missing):
+            found = {str(user['id']): user for user in self.list('users', first=first)}
+        elif missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                users = executor.map(lambda user_id: self.get(f'users/{user_id}'), missing)
+                found.update(zip(missing, users))
+
+        return {user_id: found[user_id] for user_id in user_ids if user_id in found}
+
+    def groups(self):
+        return self.list('groups')
+
+    def group_users(self, group_id):
+        return self.list('users', {'query[group_id]': group_id})
+
+
+class ThinkificInventory():
+    '''
+    Stand-in for report_loader.ReportInventory that serves a course's progress report and group
+    reports from the Thinkific API instead of downloaded exports. Enrollments and their users are
+    synced incrementally with updated_after and kept in state_path between runs, while the membership
+    of the course's participant groups is listed on every sync. Incremental syncs cannot see deleted
+    enrollments, so every enrollment is listed again on a full sync, at least every full_sync_days.
+    '''
+    def __init__(self, source, course_name, state_path, groups=None, full_sync=False, full_sync_days=FULL_SYNC_DAYS):
+        self.source = source
+        self.course_name = course_name
+        self.state_path = state_path
+        # Group names are matched case-insensitively, as group reports are named by their export subject
+        self.participant_groups = None if groups is None else {group.lower() for group in groups}
+        self.state = self.__load_state()
+        if full_sync or self.__full_sync_due(full_sync_days):
+            self.state = {}
+        self.groups = {}
+        self.sync()
+
+    def sync(self):
+        '''
+        Pulls the enrollments updated since the last sync, their users and the current group membership.
+        '''
+        course_id = self.source.course_id(self.course_name)
+        if self.state.get('course_id') != course_id:
+            self.state = {'course_id': course_id, 'synced_at': None, 'enrollments': {}, 'users': {}}
+
+        # Taken before the requests, so updates made while syncing are picked up next time
+        started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        changed = self.source.enrollments(course_id, self.state['synced_at'])
+        for enrollment in changed:
+            self.state['enrollments'][str(enrollment['id'])] = enrollment
+        self.state['users'].update(self.source.users(enrollment['user_id'] for enrollment in changed))
+        if self.state['synced_at'] is None:
+            self.state['full_synced_at'] = started
+        self.state['synced_at'] = started
+        print(f'{len(changed)} enrollments synced from Thinkific, {len(self.state["enrollments"])} in total.')
+
+        groups = [group for group in self.source.groups()
+                  if self.participant_groups is None or group['name'].lower() in self.participant_groups]
+        self.groups = {}
+        if groups:
+            with ThreadPoolExecutor(max_workers=min(self.source.max_workers, len(groups))) as executor:
+                members = list(executor.map(lambda group: self.source.group_users(group['id']), groups))
+            # Named like the group reports of download_reports.report_filename
+            for group, users in zip(groups, members):
+                self.groups.setdefault(group['name'].lower().title(), []).extend(user['email'] for user in users)
+
+        self.__save_state()
+
+    def fingerprint(self):
+        '''
+        Identifies the synced content, so unchanged data is loaded from its checkpoint.
+
+        Returns:
+        str: A digest of the enrollments, users and group membership.
+        '''
+        data = json.dumps([self.state['enrollments'], self.state['users'], self.groups], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def progress_report(self, course_name):
+        '''
+        Builds the progress report of the course in the shape of the exported CSV, with every value as text.
+        The API exposes no lesson-level progress, so only the enrollment columns are present.
+
+        Args:
+        course_name (str): The name of the course.
+
+        Returns:
+        pd.DataFrame: The progress report.
+        '''
+        if course_name != self.course_name:
+            raise FileNotFoundError(f'No progress report for {course_name} synced from Thinkific')
+
+        rows = []
+        for enrollment in sorted(self.state['enrollments'].values(), key=lambda enrollment: enrollment['id']):
+            user = self.state['users'].get(str(enrollment['user_id']), {})
+            percentage = enrollment.get('percentage_completed')
+            rows.append([
+                user.get('first_name'), user.get('last_name'), enrollment.get('user_email') or user.get('email'),
+                user.get('company'), user.get('last_sign_in_at'), enrollment.get('activated_at'),
+                enrollment.get('started_at'), enrollment.get('completed_at'), enrollment.get('expiry_date'),
+                None if percentage is None else f'{float(percentage) * 100:g}%',
+            ])
+
+        return pd.DataFrame(rows, columns=PROGRESS_COLUMNS, dtype=str)
+
+    def group_emails(self, max_workers=None):
+        '''
+        Returns the members of every group in the shape of report_loader.ReportInventory.group_emails.
+
+        Returns:
+        List[Tuple[str, str, pd.DataFrame]]: The group name, API source and emails of each group.
+        '''
+        return [(group, f'thinkific:groups/{group}', pd.DataFrame({'Email': emails}, dtype=str))
+                for group, emails in self.groups.items()]
+
+    def __full_sync_due(self, days):
+        full_synced_at = self.state.get('full_synced_at')
+        if full_synced_at is None:
+            return True
+        elapsed = datetime.now(timezone.utc) - datetime.strptime(full_synced_at, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+        return elapsed.days >= days
+
+    def __load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def __save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f'{self.state_path}.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(f'{self.state_path}.tmp', self.state_path)